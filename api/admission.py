@@ -0,0 +1,201 @@
+import math
+import os
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from fastapi import HTTPException
+
+# Per-user limits across all of a user's collections; 0 means unlimited
+USER_RATE_LIMIT_RPS = float(os.getenv("USER_RATE_LIMIT_RPS", "0"))
+USER_RATE_LIMIT_BURST = float(os.getenv("USER_RATE_LIMIT_BURST", "0"))
+USER_MAX_IN_FLIGHT = int(os.getenv("USER_MAX_IN_FLIGHT", "0"))
+USER_MAX_UPSTREAM = int(os.getenv("USER_MAX_UPSTREAM", "0"))
+
+# Status for over-limit requests, unless a collection sets its own
+ADMISSION_REJECT_STATUS = int(os.getenv("ADMISSION_REJECT_STATUS", "429"))
+
+# Key under which the middleware collects a request's tickets in the ASGI scope
+SCOPE_KEY = "admission"
+
+@dataclass(frozen=True)
+class Limits:
+    """A tenant's limits; zero means unlimited.
+
+    rps/burst feed a token bucket, max_in_flight caps requests being served
+    (including their injected delay) and max_upstream caps requests holding
+    an upstream call.
+    """
+    rps: float = 0
+    burst: float = 0
+    max_in_flight: int = 0
+    max_upstream: int = 0
+    reject_status: int = ADMISSION_REJECT_STATUS
+
+    def __bool__(self) -> bool:
+        return bool(self.rps or self.max_in_flight or self.max_upstream)
+
+USER_LIMITS = Limits(USER_RATE_LIMIT_RPS, USER_RATE_LIMIT_BURST, USER_MAX_IN_FLIGHT, USER_MAX_UPSTREAM)
+
+class AdmissionRejected(HTTPException):
+    """A request turned away because its user or collection is over a limit."""
+
+class RateLimiter:
+    """Token bucket that answers immediately instead of waiting for budget."""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float = 0):
+        self.rate = float(rate)
+        self.capacity = float(burst or max(rate, 1))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def try_acquire(self) -> float:
+        """Take one token: 0 if there was one, else seconds until there will be."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+class Tenant:
+    """Live counters for one user or collection."""
+
+    __slots__ = ("name", "limits", "bucket", "in_flight", "upstream")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.limits = Limits()
+        self.bucket: Optional[RateLimiter] = None
+        self.in_flight = 0
+        self.upstream = 0
+
+    def configure(self, limits: Limits):
+        if limits.rps != self.limits.rps or limits.burst != self.limits.burst:
+            self.bucket = RateLimiter(limits.rps, limits.burst) if limits.rps > 0 else None
+        self.limits = limits
+
+    def reject(self, detail: str, retry_after: float = 1) -> AdmissionRejected:
+        return AdmissionRejected(
+            status_code=self.limits.reject_status,
+            detail=f"{self.name} {detail}",
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
+
+class Ticket:
+    """A request's claim on its tenants' in-flight (and possibly upstream) slots."""
+
+    __slots__ = ("tenants", "holds_upstream", "released")
+
+    def __init__(self, tenants: List[Tenant]):
+        self.tenants = tenants
+        self.holds_upstream = False
+        self.released = False
+
+    def acquire_upstream(self):
+        """Claim an upstream slot for the rest of the request, or fail fast; raises AdmissionRejected."""
+        if self.holds_upstream:
+            return
+        for tenant in self.tenants:
+            if tenant.limits.max_upstream and tenant.upstream >= tenant.limits.max_upstream:
+                raise tenant.reject("has too many upstream requests in flight")
+        for tenant in self.tenants:
+            tenant.upstream += 1
+        self.holds_upstream = True
+
+    def release(self):
+        if self.released:
+            return
+        self.released = True
+        for tenant in self.tenants:
+            tenant.in_flight -= 1
+            if self.holds_upstream:
+                tenant.upstream -= 1
+
+class AdmissionControl:
+    """Per-user and per-collection admission, all O(1) dictionary and counter updates.
+
+    admit() runs before any delay is injected, so a tenant over its limits
+    is turned away without holding a worker slot. Tickets are released by
+    AdmissionMiddleware once the response has been sent in full.
+    """
+
+    def __init__(self, user_limits: Limits = USER_LIMITS):
+        self.user_limits = user_limits
+        self._users: Dict[int, Tenant] = {}
+        self._collections: Dict[int, Tenant] = {}
+        self.admitted = 0
+        self.rejected = 0
+
+    def _tenant(self, tenants: Dict[int, Tenant], key: int, name: str, limits: Limits) -> Tenant:
+        tenant = tenants.get(key)
+        if tenant is None:
+            tenant = tenants[key] = Tenant(name)
+        if tenant.limits is not limits:
+            tenant.configure(limits)
+        return tenant
+
+    def admit(self, scope: dict, user_id: int, collection_id: int, collection_limits: Limits) -> Ticket:
+        """Admit a proxied request or raise AdmissionRejected."""
+        tenants = []
+        if self.user_limits:
+            tenants.append(self._tenant(self._users, user_id, "User", self.user_limits))
+        if collection_limits:
+            tenants.append(self._tenant(self._collections, collection_id, "Collection", collection_limits))
+        ticket = Ticket(tenants)
+        if not tenants:
+            return ticket
+
+        try:
+            for tenant in tenants:
+                if tenant.limits.max_in_flight and tenant.in_flight >= tenant.limits.max_in_flight:
+                    raise tenant.reject("has too many requests in flight")
+            for tenant in tenants:
+                if tenant.bucket is not None:
+                    wait = tenant.bucket.try_acquire()
+                    if wait:
+                        raise tenant.reject("is over its request rate limit", wait)
+        except AdmissionRejected:
+            self.rejected += 1
+            raise
+
+        for tenant in tenants:
+            tenant.in_flight += 1
+        scope[SCOPE_KEY].append(ticket)
+        self.admitted += 1
+        return ticket
+
+    def forget_collection(self, collection_id: int):
+        # In-flight tickets keep their own reference to the old counters
+        self._collections.pop(collection_id, None)
+
+    def stats(self) -> dict:
+        return {
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "users": len(self._users),
+            "collections": len(self._collections),
+        }
+
+class AdmissionMiddleware:
+    """Release every ticket a request took once its response is finished, however it ends."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        tickets: List[Ticket] = []
+        scope[SCOPE_KEY] = tickets
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            for ticket in tickets:
+                ticket.release()
+
+admission = AdmissionControl()
@@ -0,0 +1,102 @@
+import json
+import os
+from typing import AsyncIterator, Iterable, Iterator, Optional, Tuple
+
+# Bulk import limits
+IMPORT_MAX_ENDPOINTS = int(os.getenv("IMPORT_MAX_ENDPOINTS", "50000"))
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "500"))
+IMPORT_MAX_ERRORS = 50
+
+NDJSON_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+OPENAPI_METHODS = ("get", "put", "post", "delete", "options", "head", "patch")
+
+class ImportFormatError(ValueError):
+    """The import body could not be parsed at all."""
+
+def is_ndjson(content_type: str) -> bool:
+    return content_type.split(";")[0].strip().lower() in NDJSON_TYPES
+
+async def iter_ndjson(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, object]]:
+    """Yield (line number, parsed value) for each non-blank line as the body arrives."""
+    buffer = bytearray()
+    line_number = 0
+    async for chunk in chunks:
+        # Only the new bytes can hold a newline; earlier ones were searched already
+        search_from = len(buffer)
+        buffer += chunk
+        start = 0
+        while True:
+            end = buffer.find(b"\n", search_from)
+            if end < 0:
+                break
+            line = bytes(buffer[start:end])
+            start = search_from = end + 1
+            line_number += 1
+            if line.strip():
+                yield line_number, _parse_line(line, line_number)
+        if start:
+            del buffer[:start]
+    if buffer.strip():
+        yield line_number + 1, _parse_line(buffer, line_number + 1)
+
+def _parse_line(line: bytes, line_number: int):
+    try:
+        return json.loads(line)
+    except ValueError as e:
+        raise ImportFormatError(f"line {line_number}: invalid JSON ({e})")
+
+def iter_json(document, base_url: Optional[str] = None) -> Iterator[Tuple[int, object]]:
+    """Items of a JSON import: a list of endpoints, {"endpoints": [...]} or an OpenAPI spec."""
+    if isinstance(document, dict) and ("openapi" in document or "swagger" in document):
+        items = openapi_endpoints(document, base_url)
+    elif isinstance(document, dict) and isinstance(document.get("endpoints"), list):
+        items = document["endpoints"]
+    elif isinstance(document, list):
+        items = document
+    else:
+        raise ImportFormatError("expected a list of endpoints, {\"endpoints\": [...]} or an OpenAPI document")
+    return enumerate(items, start=1)
+
+def openapi_endpoints(spec: dict, base_url: Optional[str] = None) -> Iterable[dict]:
+    """One endpoint per path and operation, pointed at the spec's first server."""
+    if base_url is None:
+        servers = spec.get("servers") or []
+        if servers:
+            base_url = servers[0].get("url", "")
+        elif "host" in spec:
+            scheme = (spec.get("schemes") or ["https"])[0]
+            base_url = f"{scheme}://{spec['host']}{spec.get('basePath', '')}"
+        else:
+            base_url = ""
+    base_url = base_url.rstrip("/")
+
+    for path, operations in (spec.get("paths") or {}).items():
+        if not isinstance(operations, dict):
+            continue
+        for method in OPENAPI_METHODS:
+            operation = operations.get(method)
+            if not isinstance(operation, dict):
+                continue
+            endpoint = {
+                "name": operation.get("operationId") or operation.get("summary") or f"{method.upper()} {path}",
+                "url": base_url + path,
+                "method": method.upper(),
+            }
+            example = _request_example(operation)
+            if example is not None:
+                endpoint["body"] = example
+            yield endpoint
+
+def _request_example(operation: dict):
+    content = (operation.get("requestBody") or {}).get("content") or {}
+    media = content.get("application/json") or {}
+    if "example" in media:
+        return media["example"]
+    for example in (media.get("examples") or {}).values():
+        if isinstance(example, dict) and "value" in example:
+            return example["value"]
+    return None
+
+def batches(rows: list, size: int = IMPORT_BATCH_SIZE) -> Iterator[list]:
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
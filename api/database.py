@@ -1,15 +1,111 @@
-from sqlalchemy import create_engine, Column, Integer, String, Boolean, ForeignKey, JSON
+from sqlalchemy import event, Column, Float, Index, Integer, String, Boolean, ForeignKey, JSON
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.orm import relationship
+from sqlalchemy.pool import AsyncAdaptedQueuePool, StaticPool
 import os
 
 # Use a proper path in the Docker environment
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:////data/users.db")
+# Optional replica for the read-only pool; defaults to the primary database
+SQLALCHEMY_READ_DATABASE_URL = os.getenv("DATABASE_READ_URL", SQLALCHEMY_DATABASE_URL)
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Async drivers used for plain sqlite:// and postgresql:// URLs
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
+
+# Connection pool sizing
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_READ_POOL_SIZE = int(os.getenv("DB_READ_POOL_SIZE", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
+# SQLite tuning, applied to every new connection
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "16384"))
+
+def async_url(url: str):
+    """Swap a plain database URL onto its async driver; explicit drivers are kept."""
+    url = make_url(url)
+    if url.drivername in ASYNC_DRIVERS:
+        url = url.set(drivername=ASYNC_DRIVERS[url.drivername])
+    return url
+
+def is_sqlite(url: str) -> bool:
+    return make_url(url).get_backend_name() == "sqlite"
+
+def _is_memory(url: str) -> bool:
+    return make_url(url).database in (None, "", ":memory:")
+
+def _sqlite_pragmas(read_only: bool):
+    pragmas = [
+        f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}",
+        f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}",
+        f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}",
+        f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}",
+        "PRAGMA temp_store=MEMORY",
+    ]
+    if read_only:
+        pragmas.append("PRAGMA query_only=ON")
+    else:
+        # The journal mode is persistent, so the writer pool sets it once per connection
+        pragmas.insert(0, f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+    return pragmas
+
+def build_engine(url: str, read_only: bool = False):
+    """Create a pooled async engine tuned for concurrent proxy reads and API writes."""
+    if is_sqlite(url):
+        if _is_memory(url):
+            # Every connection to :memory: would be a separate, empty database
+            return create_async_engine(async_url(url), connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        # aiosqlite defaults to opening a fresh connection per checkout; pool them instead
+        engine = create_async_engine(
+            async_url(url),
+            connect_args={"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000},
+            poolclass=AsyncAdaptedQueuePool,
+            pool_size=DB_READ_POOL_SIZE if read_only else DB_POOL_SIZE,
+            max_overflow=0 if read_only else DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+        )
+        pragmas = _sqlite_pragmas(read_only)
+
+        @event.listens_for(engine.sync_engine, "connect")
+        def configure_sqlite(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for pragma in pragmas:
+                cursor.execute(pragma)
+            cursor.close()
+
+        return engine
+
+    engine = create_async_engine(
+        async_url(url),
+        pool_size=DB_READ_POOL_SIZE if read_only else DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=True,
+    )
+    if read_only and engine.dialect.name == "postgresql":
+        engine = engine.execution_options(postgresql_readonly=True)
+    return engine
+
+engine = build_engine(SQLALCHEMY_DATABASE_URL)
+SessionLocal = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+
+# Separate read-only pool for the proxy lookup path, so lookups never queue behind writes
+if SQLALCHEMY_READ_DATABASE_URL == SQLALCHEMY_DATABASE_URL and _is_memory(SQLALCHEMY_DATABASE_URL):
+    read_engine = engine
+else:
+    read_engine = build_engine(SQLALCHEMY_READ_DATABASE_URL, read_only=True)
+ReadSessionLocal = async_sessionmaker(read_engine, autoflush=False, expire_on_commit=False)
 
 Base = declarative_base()
 
@@ -31,9 +127,21 @@ class Collection(Base):
     name = Column(String, index=True)
     description = Column(String)
     owner_id = Column(Integer, ForeignKey("users.id"))
+    # Fault rules applied to every endpoint in the collection, after the endpoint's own
+    fault_rules = Column(JSON)
+    # Admission limits for proxied requests to the collection's endpoints; 0 means unlimited
+    rate_limit_rps = Column(Float, default=0)
+    rate_limit_burst = Column(Float, default=0)
+    max_in_flight = Column(Integer, default=0)
+    max_upstream_concurrency = Column(Integer, default=0)
+    # 429 or 503; defaults to ADMISSION_REJECT_STATUS
+    limit_status = Column(Integer)
     owner = relationship("User", back_populates="collections")
     endpoints = relationship("Endpoint", back_populates="collection", cascade="all, delete-orphan")
 
+    # Serves owner listings in id order, so keyset pages are index range scans
+    __table_args__ = (Index("ix_collections_owner_id_id", "owner_id", "id"),)
+
 class Endpoint(Base):
     __tablename__ = "endpoints"
 
@@ -48,15 +156,42 @@ class Endpoint(Base):
     fail_rate = Column(Integer, default=0)
     min_latency = Column(Integer, default=0)
     max_latency = Column(Integer, default=1000)
+    latency_distribution = Column(String, default="uniform")
+    latency_params = Column(JSON)
+    bandwidth_down = Column(Integer, default=0)
+    bandwidth_up = Column(Integer, default=0)
+    ttfb_ms = Column(Integer, default=0)
+    chunk_delay_ms = Column(Integer, default=0)
+    chunk_size = Column(Integer, default=0)
     sandbox = Column(Boolean, default=False)
+    record = Column(Boolean, default=False)
+    record_match = Column(String)
+    coalesce = Column(Boolean, default=False)
+    cache_ttl_ms = Column(Integer, default=0)
+    fault_rules = Column(JSON)
+    # Set for tcp:// endpoints: the port their TCP listener accepts connections on
+    listen_port = Column(Integer)
+    reset_probability = Column(Float, default=0)
+    stall_probability = Column(Float, default=0)
+    stall_ms = Column(Integer, default=0)
+
+    # AUTOINCREMENT keeps SQLite from reusing a deleted endpoint's id, which
+    # would hand the new endpoint anything still keyed on the old one
+    __table_args__ = (
+        Index("ix_endpoints_collection_id_id", "collection_id", "id"),
+        {"sqlite_autoincrement": True},
+    )
+
+async def create_tables():
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
 
-# Create tables
-Base.metadata.create_all(bind=engine)
+async def dispose_engines():
+    await engine.dispose()
+    if read_engine is not engine:
+        await read_engine.dispose()
 
 # Dependency
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close() 
\ No newline at end of file
+async def get_db():
+    async with SessionLocal() as db:
+        yield db 
\ No newline at end of file
@@ -0,0 +1,200 @@
+# Shared module: keep api/delays.py and app/core/delays.py identical (make check-shared)
+import asyncio
+import math
+import os
+import time
+from typing import List, Optional, Tuple
+
+# Timing wheel layout: millisecond ticks, 4 levels of 256 slots (~49 days)
+WHEEL_BITS = 8
+WHEEL_SLOTS = 1 << WHEEL_BITS
+WHEEL_LEVELS = 4
+# Timers are fired up to this much early to make up for measured wake-up lag
+DELAY_MAX_LEAD_MS = float(os.getenv("DELAY_MAX_LEAD_MS", "5"))
+# Weight of each new wake-up lag sample in the running estimate
+LAG_SMOOTHING = 0.05
+
+_MASK = WHEEL_SLOTS - 1
+
+class DelayScheduler:
+    """Hierarchical hashed timing wheel for injected delays.
+
+    Each pending sleep is a future in a slot of a 256-slot wheel; timers
+    further out sit in coarser wheels and cascade down as their slot comes
+    round. One event-loop timer drives the whole wheel and fires every
+    sleep due in a tick at once, so 50k delayed requests cost a handful of
+    loop timers rather than 50k entries in the loop's heap.
+
+    The lag between a deadline and the sleeper actually resuming is
+    measured on every wake-up, and later deadlines are brought forward by
+    that much (up to DELAY_MAX_LEAD_MS).
+    """
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.fired = 0
+        self.wakeups = 0
+        self.lag = 0.0
+        self._reset(None)
+
+    def _reset(self, loop: Optional[asyncio.AbstractEventLoop]):
+        self._loop = loop
+        self._origin = loop.time() if loop is not None else 0.0
+        self._levels: List[List[List[Tuple[int, asyncio.Future]]]] = [
+            [[] for _ in range(WHEEL_SLOTS)] for _ in range(WHEEL_LEVELS)
+        ]
+        self._counts = [0] * WHEEL_LEVELS
+        self._overflow: List[Tuple[int, asyncio.Future]] = []
+        # Last tick processed; the wheel never runs ahead of the loop clock
+        self._tick = 0
+        self._handle: Optional[asyncio.TimerHandle] = None
+        self._armed: Optional[int] = None
+
+    @property
+    def lead(self) -> float:
+        return min(max(self.lag, 0.0), DELAY_MAX_LEAD_MS / 1000)
+
+    @property
+    def pending(self) -> int:
+        return sum(self._counts) + len(self._overflow)
+
+    async def sleep(self, seconds: float, since: Optional[float] = None):
+        """Sleep until `seconds` after `since`, a time.perf_counter() reading (default now).
+
+        Passing the request's start time makes the delay absorb the proxy's
+        own overhead up to this point instead of adding to it.
+        """
+        if since is not None:
+            seconds -= time.perf_counter() - since
+        if seconds <= 0:
+            return
+
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._reset(loop)
+        deadline = loop.time() + seconds
+        lead = self.lead
+        future = loop.create_future()
+        self._schedule(math.ceil((deadline - lead - self._origin) * 1000), future)
+        await future
+
+        # Lag this sleep would have had without the lead, including the time
+        # to get this task running again after the batch was fired
+        self.lag += LAG_SMOOTHING * (loop.time() - deadline + lead - self.lag)
+
+    def _schedule(self, tick: int, future: asyncio.Future):
+        if not self.pending:
+            # Idle wheel: catch up with the clock without walking the ticks
+            self._tick = max(self._tick, self._now_tick())
+        if tick <= self._tick:
+            future.set_result(None)
+            self.fired += 1
+            return
+        self._place(tick, future)
+        if self._armed is None or tick < self._armed:
+            self._arm(tick)
+
+    def _place(self, tick: int, future: asyncio.Future):
+        delta = tick - self._tick
+        for level in range(WHEEL_LEVELS):
+            if delta < 1 << (WHEEL_BITS * (level + 1)):
+                self._levels[level][(tick >> (WHEEL_BITS * level)) & _MASK].append((tick, future))
+                self._counts[level] += 1
+                return
+        self._overflow.append((tick, future))
+
+    def _now_tick(self) -> int:
+        # The epsilon stops float rounding from waking the wheel just short of a tick
+        return math.floor((self._loop.time() - self._origin) * 1000 + 1e-6)
+
+    def _arm(self, tick: int):
+        if self._handle is not None:
+            self._handle.cancel()
+        self._armed = tick
+        self._handle = self._loop.call_at(self._origin + tick / 1000, self._run)
+
+    def _run(self):
+        self._handle = None
+        self._armed = None
+        self.wakeups += 1
+        self._advance(self._now_tick())
+        next_tick = self._next_tick()
+        if next_tick is not None:
+            self._arm(next_tick)
+
+    def _advance(self, target: int):
+        while True:
+            tick = self._next_tick()
+            if tick is None or tick > target:
+                self._tick = max(self._tick, target)
+                return
+            # Ticks skipped over had nothing to fire or cascade
+            self._tick = tick
+            if not tick & _MASK:
+                self._cascade(tick)
+            slot = self._levels[0][tick & _MASK]
+            if slot:
+                self._levels[0][tick & _MASK] = []
+                self._counts[0] -= len(slot)
+                for _, future in slot:
+                    if not future.done():
+                        future.set_result(None)
+                        self.fired += 1
+
+    def _cascade(self, tick: int):
+        """Move timers from coarser wheels whose slot has come round into finer ones."""
+        if self._overflow and not tick & ((1 << (WHEEL_BITS * WHEEL_LEVELS)) - 1):
+            overflow, self._overflow = self._overflow, []
+            for entry in overflow:
+                self._place(*entry)
+        for level in range(WHEEL_LEVELS - 1, 0, -1):
+            shift = WHEEL_BITS * level
+            if tick & ((1 << shift) - 1):
+                continue
+            index = (tick >> shift) & _MASK
+            slot = self._levels[level][index]
+            if not slot:
+                continue
+            self._levels[level][index] = []
+            self._counts[level] -= len(slot)
+            for entry in slot:
+                if entry[1].done():
+                    continue
+                if entry[0] <= tick:
+                    # Due exactly at the boundary: fire it with this tick's slot
+                    self._levels[0][tick & _MASK].append(entry)
+                    self._counts[0] += 1
+                else:
+                    self._place(*entry)
+
+    def _next_tick(self) -> Optional[int]:
+        """The next tick with work: a busy slot in the finest wheel, or a busy coarser slot cascading."""
+        best = None
+        if self._overflow:
+            best = (self._tick | ((1 << (WHEEL_BITS * WHEEL_LEVELS)) - 1)) + 1
+        for level in range(WHEEL_LEVELS):
+            if not self._counts[level]:
+                continue
+            shift = WHEEL_BITS * level
+            base = self._tick >> shift
+            if best is not None and (base + 1) << shift >= best:
+                break
+            slots = self._levels[level]
+            for step in range(1, WHEEL_SLOTS + 1):
+                if slots[(base + step) & _MASK]:
+                    tick = (base + step) << shift
+                    if best is None or tick < best:
+                        best = tick
+                    break
+        return best
+
+    def stats(self) -> dict:
+        return {
+            "pending": self.pending,
+            "fired": self.fired,
+            "wakeups": self.wakeups,
+            "lag_ms": round(self.lag * 1000, 3),
+            "lead_ms": round(self.lead * 1000, 3),
+        }
+
+scheduler = DelayScheduler()
@@ -0,0 +1,147 @@
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+from admission import ADMISSION_REJECT_STATUS, Limits
+from faults import RuleSet, compile_rules
+from latency import build_sampler
+from recordings import parse_match
+from throttle import Shaping
+
+# Cache configuration
+ENDPOINT_CACHE_SIZE = int(os.getenv("ENDPOINT_CACHE_SIZE", "10000"))
+ENDPOINT_CACHE_TTL = float(os.getenv("ENDPOINT_CACHE_TTL", "30"))
+
+@dataclass(frozen=True)
+class EndpointConfig:
+    """Plain, session-independent copy of the endpoint fields the proxy needs."""
+    id: int
+    collection_id: int
+    url: str
+    method: str
+    headers: Optional[Dict[str, Any]]
+    body: Optional[Dict[str, Any]]
+    fail_rate: int
+    min_latency: int
+    max_latency: int
+    latency_sampler: Any
+    shaping: Shaping
+    sandbox: bool
+    record: bool
+    record_match: Tuple[str, ...]
+    coalesce: bool
+    cache_ttl_ms: int
+    faults: RuleSet
+    # The collection's admission limits
+    limits: Limits
+    listen_port: Optional[int]
+    reset_probability: float
+    stall_probability: float
+    stall_ms: int
+
+    @classmethod
+    def from_model(cls, endpoint, collection=None) -> "EndpointConfig":
+        return cls(
+            id=endpoint.id,
+            collection_id=endpoint.collection_id,
+            url=endpoint.url,
+            method=endpoint.method,
+            headers=endpoint.headers,
+            body=endpoint.body,
+            fail_rate=endpoint.fail_rate or 0,
+            min_latency=endpoint.min_latency or 0,
+            max_latency=endpoint.max_latency or 0,
+            latency_sampler=build_sampler(
+                endpoint.latency_distribution,
+                endpoint.latency_params,
+                endpoint.min_latency or 0,
+                endpoint.max_latency or 0,
+            ),
+            shaping=Shaping(
+                bandwidth_down=endpoint.bandwidth_down or 0,
+                bandwidth_up=endpoint.bandwidth_up or 0,
+                ttfb_ms=endpoint.ttfb_ms or 0,
+                chunk_delay_ms=endpoint.chunk_delay_ms or 0,
+                chunk_size=endpoint.chunk_size or 0,
+            ),
+            sandbox=bool(endpoint.sandbox),
+            record=bool(endpoint.record),
+            record_match=parse_match(endpoint.record_match),
+            coalesce=bool(endpoint.coalesce),
+            cache_ttl_ms=endpoint.cache_ttl_ms or 0,
+            faults=compile_rules(endpoint.fault_rules, collection.fault_rules if collection is not None else None),
+            limits=collection_limits(collection),
+            listen_port=endpoint.listen_port,
+            reset_probability=endpoint.reset_probability or 0,
+            stall_probability=endpoint.stall_probability or 0,
+            stall_ms=endpoint.stall_ms or 0,
+        )
+
+def collection_limits(collection) -> Limits:
+    if collection is None:
+        return Limits()
+    return Limits(
+        rps=collection.rate_limit_rps or 0,
+        burst=collection.rate_limit_burst or 0,
+        max_in_flight=collection.max_in_flight or 0,
+        max_upstream=collection.max_upstream_concurrency or 0,
+        reject_status=collection.limit_status or ADMISSION_REJECT_STATUS,
+    )
+
+class EndpointCache:
+    """Read-through LRU cache of endpoint configs keyed by (owner_id, endpoint_id), with a TTL."""
+
+    def __init__(self, maxsize: int = ENDPOINT_CACHE_SIZE, ttl: float = ENDPOINT_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[Tuple[int, int], Tuple[float, EndpointConfig]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, owner_id: int, endpoint_id: int) -> Optional[EndpointConfig]:
+        key = (owner_id, endpoint_id)
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, owner_id: int, config: EndpointConfig):
+        key = (owner_id, config.id)
+        self._entries[key] = (time.monotonic() + self.ttl, config)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, owner_id: int, endpoint_id: int):
+        self._entries.pop((owner_id, endpoint_id), None)
+
+    def invalidate_collection(self, collection_id: int):
+        stale = [key for key, (_, config) in self._entries.items() if config.collection_id == collection_id]
+        for key in stale:
+            del self._entries[key]
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+endpoint_cache = EndpointCache()
@@ -0,0 +1,289 @@
+import heapq
+import json
+import random
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from itertools import accumulate, islice
+from typing import Dict, Iterable, Iterator, List, Mapping, Optional, Pattern, Sequence, Tuple
+
+FAULT_TYPES = ("status", "reset", "empty", "malformed_json", "truncated", "timeout")
+
+# Status sent when an outcome doesn't name one; reset, empty, malformed and
+# truncated responses look healthy until the body goes wrong
+DEFAULT_STATUS = {"status": 500, "timeout": 504}
+
+# Characters that end the literal prefix of a path glob
+GLOB_SPECIAL = set("*?[")
+
+@dataclass(frozen=True)
+class Fault:
+    """One outcome a rule can produce.
+
+    truncate_bytes of 0 cuts a truncated body at half its Content-Length;
+    delay_ms of 0 makes a timeout last as long as the upstream timeout.
+    """
+    type: str
+    status: int = 500
+    body: Optional[str] = None
+    truncate_bytes: int = 0
+    delay_ms: int = 0
+
+def glob_to_regex(glob: str) -> str:
+    """Translate a path glob: * stays within a segment, ** crosses segments, ? is one character."""
+    parts = []
+    i = 0
+    while i < len(glob):
+        char = glob[i]
+        if glob.startswith("**", i):
+            parts.append(".*")
+            i += 2
+            continue
+        if char == "*":
+            parts.append("[^/]*")
+        elif char == "?":
+            parts.append("[^/]")
+        elif char == "[":
+            end = glob.find("]", i + 1)
+            if end == -1:
+                parts.append(re.escape(char))
+            else:
+                parts.append("[" + glob[i + 1:end].replace("\\", "\\\\") + "]")
+                i = end
+        else:
+            parts.append(re.escape(char))
+        i += 1
+    return "".join(parts) + r"\Z"
+
+def literal_segments(glob: str) -> List[str]:
+    """Leading path segments of a glob that contain no wildcards, used as the trie key."""
+    segments = []
+    for segment in glob.strip("/").split("/"):
+        if not segment or GLOB_SPECIAL & set(segment):
+            break
+        segments.append(segment)
+    return segments
+
+def _split_path(path: str) -> List[str]:
+    return [segment for segment in path.split("/") if segment]
+
+def _pairs(mapping: Optional[Mapping[str, str]], lower_keys: bool) -> Tuple[Tuple[str, str], ...]:
+    if not mapping:
+        return ()
+    if not isinstance(mapping, dict):
+        raise ValueError("headers and query matchers must be objects")
+    return tuple((key.lower() if lower_keys else key, str(value)) for key, value in mapping.items())
+
+def _matches_pairs(expected: Tuple[Tuple[str, str], ...], actual: Mapping[str, str]) -> bool:
+    for key, value in expected:
+        present = actual.get(key)
+        if present is None or (value != "*" and present != value):
+            return False
+    return True
+
+class CompiledRule:
+    __slots__ = ("order", "methods", "path", "headers", "query", "probability", "faults", "cum_weights", "prefix")
+
+    def __init__(self, order: int, rule: dict):
+        if not isinstance(rule, dict):
+            raise ValueError(f"rule {order + 1}: expected an object")
+        self.order = order
+        methods = rule.get("methods")
+        self.methods = frozenset(method.upper() for method in methods) if methods else None
+
+        path = rule.get("path")
+        path_regex = rule.get("path_regex")
+        if path and path_regex:
+            raise ValueError(f"rule {order + 1}: use either path or path_regex, not both")
+        try:
+            if path:
+                self.path = re.compile(glob_to_regex(path if path.startswith("/") else "/" + path))
+                self.prefix = literal_segments(path)
+            elif path_regex:
+                self.path = re.compile(path_regex)
+                self.prefix = []
+            else:
+                self.path = None
+                self.prefix = []
+        except re.error as e:
+            raise ValueError(f"rule {order + 1}: invalid path pattern ({e})")
+
+        self.headers = _pairs(rule.get("headers"), lower_keys=True)
+        self.query = _pairs(rule.get("query"), lower_keys=False)
+
+        probability = rule.get("probability")
+        self.probability = 1.0 if probability is None else float(probability)
+        if not 0 <= self.probability <= 1:
+            raise ValueError(f"rule {order + 1}: probability must be between 0 and 1")
+
+        outcomes = rule.get("outcomes") or []
+        if not outcomes:
+            raise ValueError(f"rule {order + 1}: at least one outcome is required")
+        self.faults = []
+        weights = []
+        for outcome in outcomes:
+            if not isinstance(outcome, dict):
+                raise ValueError(f"rule {order + 1}: outcomes must be objects")
+            fault_type = outcome.get("type") or "status"
+            if fault_type not in FAULT_TYPES:
+                raise ValueError(f"rule {order + 1}: outcome type must be one of: " + ", ".join(FAULT_TYPES))
+            weight = outcome.get("weight")
+            weight = 1.0 if weight is None else float(weight)
+            if weight <= 0:
+                raise ValueError(f"rule {order + 1}: outcome weights must be positive")
+            status = int(outcome.get("status") or DEFAULT_STATUS.get(fault_type, 200))
+            if not 100 <= status <= 599:
+                raise ValueError(f"rule {order + 1}: status must be between 100 and 599")
+            self.faults.append(Fault(
+                type=fault_type,
+                status=status,
+                body=outcome.get("body"),
+                truncate_bytes=int(outcome.get("truncate_bytes") or 0),
+                delay_ms=int(outcome.get("delay_ms") or 0),
+            ))
+            weights.append(weight)
+        self.cum_weights = list(accumulate(weights))
+
+    def __lt__(self, other: "CompiledRule") -> bool:
+        return self.order < other.order
+
+    def accepts(self, headers: Mapping[str, str], query: Mapping[str, str]) -> bool:
+        """Header and query matchers; method and path are settled by the RuleSet's index."""
+        if self.headers and not _matches_pairs(self.headers, headers):
+            return False
+        if self.query and not _matches_pairs(self.query, query):
+            return False
+        return True
+
+    def pick(self) -> Optional[Fault]:
+        """Draw this rule's outcome, or None if the rule's probability says it doesn't fire."""
+        if self.probability < 1 and random.random() >= self.probability:
+            return None
+        if len(self.faults) == 1:
+            return self.faults[0]
+        return random.choices(self.faults, cum_weights=self.cum_weights)[0]
+
+# Method key for rules that don't name any methods
+ANY_METHOD = "*"
+
+# Patterns whose group numbering would break once joined into one alternation
+BACKREFERENCE = re.compile(r"\\[1-9]|\(\?P=")
+
+def _combine(rules: Sequence[CompiledRule]) -> Optional[Pattern]:
+    """One alternation of the rules' path patterns, each tagged with an empty _f<index> group.
+
+    A single match then finds the first rule whose path matches in one pass
+    through the regex engine; None means the table falls back to a scan.
+    """
+    if any(rule.path is not None and BACKREFERENCE.search(rule.path.pattern) for rule in rules):
+        return None
+    alternatives = "|".join(
+        f"(?:{rule.path.pattern if rule.path is not None else ''})(?P<_f{index}>)"
+        for index, rule in enumerate(rules)
+    )
+    try:
+        return re.compile(alternatives)
+    except re.error:
+        return None
+
+class _Table:
+    """The rules of one trie node that apply to one method."""
+    __slots__ = ("rules", "pattern")
+
+    def __init__(self, rules: List[CompiledRule]):
+        self.rules = rules
+        self.pattern = _combine(rules)
+
+    def candidates(self, path: str) -> Iterator[CompiledRule]:
+        """Rules whose path pattern matches, in declaration order."""
+        start = 0
+        if self.pattern is not None:
+            match = self.pattern.match(path)
+            if match is None:
+                return
+            start = int(match.lastgroup[2:])
+            yield self.rules[start]
+            start += 1
+        for rule in islice(self.rules, start, None):
+            if rule.path is None or rule.path.match(path):
+                yield rule
+
+class _Node:
+    __slots__ = ("children", "rules", "tables")
+
+    def __init__(self):
+        self.children: Dict[str, "_Node"] = {}
+        self.rules: List[CompiledRule] = []
+        self.tables: Dict[str, _Table] = {}
+
+    def build(self, methods: Iterable[str]):
+        for method in methods:
+            rules = [
+                rule for rule in self.rules
+                if rule.methods is None or (method != ANY_METHOD and method in rule.methods)
+            ]
+            if rules:
+                self.tables[method] = _Table(rules)
+        for child in self.children.values():
+            child.build(methods)
+
+class RuleSet:
+    """Rules indexed by the literal prefix of their path glob, then by method.
+
+    A lookup walks the request path down a segment trie, so only rules whose
+    prefix matches the path are considered. Each node keeps a table per
+    method whose path patterns are joined into one regex, so finding the
+    first candidate costs one match rather than one per rule. Candidates
+    from each level are merged back into declaration order and the first
+    rule that matches (and fires) decides the fault.
+    """
+
+    def __init__(self, rules: Sequence[CompiledRule]):
+        self.size = len(rules)
+        self._root = _Node()
+        for rule in rules:
+            node = self._root
+            for segment in rule.prefix:
+                node = node.children.setdefault(segment, _Node())
+            node.rules.append(rule)
+        methods = {ANY_METHOD}.union(*(rule.methods for rule in rules if rule.methods is not None))
+        self._root.build(methods)
+
+    def __bool__(self) -> bool:
+        return self.size > 0
+
+    def match(self, method: str, path: str, headers: Mapping[str, str], query: Mapping[str, str]) -> Optional[Fault]:
+        tables = []
+        node = self._root
+        segments = iter(_split_path(path))
+        while node is not None:
+            table = node.tables.get(method) or node.tables.get(ANY_METHOD)
+            if table is not None:
+                tables.append(table)
+            node = node.children.get(next(segments, None))
+
+        if not tables:
+            return None
+        if len(tables) == 1:
+            candidates: Iterable[CompiledRule] = tables[0].candidates(path)
+        else:
+            candidates = heapq.merge(*(table.candidates(path) for table in tables))
+        for rule in candidates:
+            if rule.accepts(headers, query):
+                fault = rule.pick()
+                if fault is not None:
+                    return fault
+        return None
+
+EMPTY_RULES = RuleSet([])
+
+def compile_rules(*rule_lists: Optional[List[dict]]) -> RuleSet:
+    """Compile rule lists (earlier lists take precedence) into one RuleSet; raises ValueError."""
+    rules = [rule for rule_list in rule_lists if rule_list for rule in rule_list]
+    if not rules:
+        return EMPTY_RULES
+    return _compile(json.dumps(rules, sort_keys=True))
+
+@lru_cache(maxsize=1024)
+def _compile(rules_json: str) -> RuleSet:
+    return RuleSet([CompiledRule(order, rule) for order, rule in enumerate(json.loads(rules_json))])
@@ -0,0 +1,114 @@
+import asyncio
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional
+
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+# Hashing pool configuration
+HASH_EXECUTOR = os.getenv("HASH_EXECUTOR", "thread")  # "thread" or "process"
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+HASH_QUEUE_LIMIT = int(os.getenv("HASH_QUEUE_LIMIT", "64"))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+def _timed(fn, *args):
+    # Runs in the worker; monotonic clocks are shared across processes on one host
+    started = time.monotonic()
+    result = fn(*args)
+    return started, time.monotonic(), result
+
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+def _verify(plain_password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(plain_password, hashed_password)
+
+class Timing:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def stats(self) -> dict:
+        return {
+            "count": self.count,
+            "avg": self.total / self.count if self.count else 0.0,
+            "max": self.max,
+        }
+
+class PasswordHasher:
+    """Runs bcrypt on a bounded worker pool so it never blocks the event loop.
+
+    Once HASH_QUEUE_LIMIT calls are pending, new ones fail fast with a 503
+    instead of queueing behind a login burst.
+    """
+
+    def __init__(self, kind: str = HASH_EXECUTOR, workers: int = HASH_WORKERS, queue_limit: int = HASH_QUEUE_LIMIT):
+        self.kind = kind
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self._executor: Optional[Executor] = None
+        self.pending = 0
+        self.rejected = 0
+        self.hash_latency = Timing()
+        self.queue_wait = Timing()
+
+    def start(self):
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def _run(self, fn, *args):
+        if self.pending >= self.queue_limit:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Authentication is busy, please retry",
+                headers={"Retry-After": "1"},
+            )
+        self.start()
+        self.pending += 1
+        submitted = time.monotonic()
+        try:
+            started, finished, result = await asyncio.get_running_loop().run_in_executor(
+                self._executor, _timed, fn, *args
+            )
+        finally:
+            self.pending -= 1
+        self.queue_wait.observe(started - submitted)
+        self.hash_latency.observe(finished - started)
+        return result
+
+    async def hash(self, password: str) -> str:
+        return await self._run(_hash, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(_verify, plain_password, hashed_password)
+
+    def stats(self) -> dict:
+        return {
+            "executor": self.kind,
+            "workers": self.workers,
+            "queue_limit": self.queue_limit,
+            "pending": self.pending,
+            "rejected": self.rejected,
+            "hash_latency": self.hash_latency.stats(),
+            "queue_wait": self.queue_wait.stats(),
+        }
+
+password_hasher = PasswordHasher()
@@ -1,22 +1,46 @@
-from database import SessionLocal, User, Base, engine
+from database import SessionLocal, User, Base, engine, create_tables, dispose_engines
 from passlib.context import CryptContext
+from sqlalchemy import inspect, select, text
+import asyncio
 import os
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
-def init_db():
+def upgrade_schema(connection):
+    # Add columns and indexes introduced after the database was first created
+    inspector = inspect(connection)
+    for table in Base.metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                column_type = column.type.compile(dialect=connection.dialect)
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"
+                # Backfill existing rows with the model default so they still validate
+                if column.default is not None and column.default.is_scalar:
+                    ddl += f" DEFAULT {column.default.arg!r}"
+                connection.execute(text(ddl))
+                print(f"Added column {table.name}.{column.name}")
+        existing_indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing_indexes:
+                index.create(connection)
+                print(f"Added index {index.name}")
+
+async def init_db():
     # Create database directory if it doesn't exist
     os.makedirs("/data", exist_ok=True)
     
     # Create all tables
-    Base.metadata.create_all(bind=engine)
+    await create_tables()
+    async with engine.begin() as connection:
+        await connection.run_sync(upgrade_schema)
     
     # Create a session
     db = SessionLocal()
     
     try:
         # Check if demo user already exists
-        demo_user = db.query(User).filter(User.username == "demo").first()
+        demo_user = await db.scalar(select(User).where(User.username == "demo"))
         if not demo_user:
             # Create demo user
             demo_user = User(
@@ -27,7 +51,7 @@ def init_db():
                 disabled=False
             )
             db.add(demo_user)
-            db.commit()
+            await db.commit()
             print("Demo user created successfully")
             print("Username: demo")
             print("Password: demo123")
@@ -35,9 +59,10 @@ def init_db():
             print("Demo user already exists")
     except Exception as e:
         print(f"Error creating demo user: {e}")
-        db.rollback()
+        await db.rollback()
     finally:
-        db.close()
+        await db.close()
+        await dispose_engines()
 
 if __name__ == "__main__":
-    init_db() 
\ No newline at end of file
+    asyncio.run(init_db()) 
\ No newline at end of file
@@ -1,26 +1,40 @@
-from fastapi import FastAPI, Depends, HTTPException, status, Request
+from fastapi import FastAPI, Depends, HTTPException, Query, status, Request
+from fastapi.responses import Response, StreamingResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
-from pydantic import BaseModel
-from typing import Optional, List, Dict, Any
+from sqlalchemy import and_, func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from pydantic import BaseModel, Field, ValidationError
+from typing import Optional, List, Dict, Any, Literal
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 import os
 import json
-import requests
+import httpx
 import random
 import time
+from urllib.parse import urlparse
 
-from database import get_db, User as DBUser, Collection as DBCollection, Endpoint as DBEndpoint
+from database import get_db, create_tables, dispose_engines, engine, read_engine, ReadSessionLocal, User as DBUser, Collection as DBCollection, Endpoint as DBEndpoint
+import upstream
+from endpoint_cache import EndpointConfig, endpoint_cache
+from token_cache import Principal, token_cache
+from hashing import password_hasher
+from latency import build_sampler
+import metrics
+import bulk
+import faults
+import recordings
+from delays import scheduler
+from admission import AdmissionMiddleware, Ticket, admission
+from tcp_proxy import check_listen_port, parse_target, tcp_proxies
+from response_cache import response_cache, single_flight
 
 # Security
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-here")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/login")
 
 app = FastAPI()
@@ -32,8 +46,26 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
+# Releases admission tickets once each response has been sent
+app.add_middleware(AdmissionMiddleware)
+
+@app.on_event("startup")
+async def startup_event():
+    await create_tables()
+    await upstream.startup()
+    password_hasher.start()
+    await start_tcp_proxies()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await tcp_proxies.shutdown()
+    await upstream.shutdown()
+    password_hasher.shutdown()
+    await dispose_engines()
+
 # Models
 class Token(BaseModel):
     access_token: str
@@ -54,10 +86,35 @@ class UserCreate(BaseModel):
     password: str
     full_name: Optional[str] = None
 
+# Fault rules: the first rule whose matchers all hold (and whose probability
+# fires) picks one of its outcomes by weight
+class FaultOutcome(BaseModel):
+    type: Literal["status", "reset", "empty", "malformed_json", "truncated", "timeout"] = "status"
+    weight: float = Field(1, gt=0)
+    status: Optional[int] = Field(None, ge=100, le=599)
+    body: Optional[str] = None
+    truncate_bytes: int = Field(0, ge=0)
+    delay_ms: int = Field(0, ge=0)
+
+class FaultRule(BaseModel):
+    methods: Optional[List[str]] = None
+    path: Optional[str] = None
+    path_regex: Optional[str] = None
+    headers: Optional[Dict[str, str]] = None
+    query: Optional[Dict[str, str]] = None
+    probability: float = Field(1.0, ge=0, le=1)
+    outcomes: List[FaultOutcome] = Field(..., min_length=1)
+
 # New Pydantic models
 class CollectionBase(BaseModel):
     name: str
     description: Optional[str] = None
+    fault_rules: Optional[List[FaultRule]] = None
+    rate_limit_rps: float = Field(0, ge=0)
+    rate_limit_burst: float = Field(0, ge=0)
+    max_in_flight: int = Field(0, ge=0)
+    max_upstream_concurrency: int = Field(0, ge=0)
+    limit_status: Optional[Literal[429, 503]] = None
 
 class CollectionCreate(CollectionBase):
     pass
@@ -78,7 +135,23 @@ class EndpointBase(BaseModel):
     fail_rate: int = 0
     min_latency: int = 0
     max_latency: int = 1000
+    latency_distribution: str = "uniform"
+    latency_params: Optional[Dict[str, Any]] = None
+    bandwidth_down: int = Field(0, ge=0)
+    bandwidth_up: int = Field(0, ge=0)
+    ttfb_ms: int = Field(0, ge=0)
+    chunk_delay_ms: int = Field(0, ge=0)
+    chunk_size: int = Field(0, ge=0)
     sandbox: bool = False
+    record: bool = False
+    record_match: Optional[str] = None
+    coalesce: bool = False
+    cache_ttl_ms: int = Field(0, ge=0)
+    fault_rules: Optional[List[FaultRule]] = None
+    listen_port: Optional[int] = Field(None, ge=1, le=65535)
+    reset_probability: float = Field(0, ge=0, le=1)
+    stall_probability: float = Field(0, ge=0, le=1)
+    stall_ms: int = Field(0, ge=0)
 
 class EndpointCreate(EndpointBase):
     collection_id: int
@@ -91,17 +164,16 @@ class Endpoint(EndpointBase):
         orm_mode = True
 
 # Helper functions
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+async def get_user(db: AsyncSession, username: str):
+    return await db.scalar(select(DBUser).where(DBUser.username == username))
 
-def get_user(db: Session, username: str):
-    return db.query(DBUser).filter(DBUser.username == username).first()
-
-def authenticate_user(db: Session, username: str, password: str):
-    user = get_user(db, username)
+async def authenticate_user(db: AsyncSession, username: str, password: str):
+    user = await get_user(db, username)
     if not user:
         return False
-    if not verify_password(password, user.hashed_password):
+    # Release the connection while bcrypt runs; loaded attributes stay readable
+    await db.close()
+    if not await password_hasher.verify(password, user.hashed_password):
         return False
     return user
 
@@ -115,28 +187,59 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    credentials_exception = HTTPException(
+def credentials_exception():
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+def inactive_user_exception():
+    return HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Inactive user")
+
+def decode_token(token: str) -> dict:
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
         if username is None:
-            raise credentials_exception
-        token_data = TokenData(username=username)
+            raise credentials_exception()
     except JWTError:
-        raise credentials_exception
-    user = get_user(db, username=token_data.username)
+        raise credentials_exception()
+    return payload
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
+    token_data = TokenData(username=decode_token(token)["sub"])
+    user = await get_user(db, username=token_data.username)
     if user is None:
-        raise credentials_exception
+        raise credentials_exception()
+    if user.disabled:
+        token_cache.revoke_user(user.id)
+        raise inactive_user_exception()
     return user
 
+async def get_current_principal(token: str = Depends(oauth2_scheme)) -> Principal:
+    """Resolve the caller from the verified-token cache; the database is only hit on a miss."""
+    started = time.perf_counter()
+    principal = token_cache.get(token)
+    if principal is not None:
+        metrics.observe_stage("auth", time.perf_counter() - started)
+        return principal
+
+    payload = decode_token(token)
+    async with ReadSessionLocal() as db:
+        user = await get_user(db, username=payload["sub"])
+        if user is None:
+            raise credentials_exception()
+        if user.disabled:
+            raise inactive_user_exception()
+        principal = Principal(id=user.id, username=user.username, expires_at=payload["exp"])
+    token_cache.put(token, principal)
+    metrics.observe_stage("auth", time.perf_counter() - started)
+    return principal
+
 # Routes
 @app.post("/api/auth/login")
-async def login_for_access_token(request: Request, db: Session = Depends(get_db)):
+async def login_for_access_token(request: Request, db: AsyncSession = Depends(get_db)):
     try:
         body = await request.json()
         username = body.get("username")
@@ -148,7 +251,7 @@ async def login_for_access_token(request: Request, db: Session = Depends(get_db)
                 detail="Username and password are required"
             )
         
-        user = authenticate_user(db, username, password)
+        user = await authenticate_user(db, username, password)
         if not user:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
@@ -168,7 +271,7 @@ async def login_for_access_token(request: Request, db: Session = Depends(get_db)
         )
 
 @app.post("/api/auth/register")
-async def register_user(request: Request, db: Session = Depends(get_db)):
+async def register_user(request: Request, db: AsyncSession = Depends(get_db)):
     try:
         body = await request.json()
         username = body.get("username")
@@ -183,18 +286,20 @@ async def register_user(request: Request, db: Session = Depends(get_db)):
             )
         
         # Check if username or email already exists
-        if db.query(DBUser).filter(DBUser.username == username).first():
+        if await db.scalar(select(DBUser).where(DBUser.username == username)):
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Username already registered"
             )
-        if db.query(DBUser).filter(DBUser.email == email).first():
+        if await db.scalar(select(DBUser).where(DBUser.email == email)):
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Email already registered"
             )
         
-        hashed_password = pwd_context.hash(password)
+        # Release the connection while bcrypt runs
+        await db.close()
+        hashed_password = await password_hasher.hash(password)
         db_user = DBUser(
             username=username,
             email=email,
@@ -203,8 +308,8 @@ async def register_user(request: Request, db: Session = Depends(get_db)):
             disabled=False
         )
         db.add(db_user)
-        db.commit()
-        db.refresh(db_user)
+        await db.commit()
+        await db.refresh(db_user)
         
         return User(
             username=db_user.username,
@@ -231,164 +336,726 @@ async def read_users_me(current_user: DBUser = Depends(get_current_user)):
 async def root():
     return {"message": "Welcome to Latency Poison API"}
 
+@app.get("/api/stats")
+async def read_stats():
+    return {
+        "endpoint_cache": endpoint_cache.stats(),
+        "token_cache": token_cache.stats(),
+        "password_hashing": password_hasher.stats(),
+        "recordings": recordings.store.stats(),
+        "response_cache": response_cache.stats(),
+        "single_flight": single_flight.stats(),
+        "delays": scheduler.stats(),
+        "admission": admission.stats(),
+        "tcp_proxies": tcp_proxies.stats(),
+        "database": {
+            "pool": engine.pool.status(),
+            "read_pool": read_engine.pool.status(),
+        },
+    }
+
+@app.get("/metrics")
+async def read_metrics():
+    return Response(metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
+PROXY_MODES = ("raw", "inspect")
+
+class InjectedFailure(HTTPException):
+    """A failure simulated by the proxy, as opposed to one from the upstream."""
+
+async def get_endpoint_config(endpoint_id: int, owner: Principal) -> EndpointConfig:
+    """Resolve an owned endpoint's proxy settings, opening a session only on a cache miss."""
+    config = endpoint_cache.get(owner.id, endpoint_id)
+    if config is not None:
+        return config
+
+    async with ReadSessionLocal() as db:
+        row = (await db.execute(select(DBEndpoint, DBCollection).join(DBCollection).where(
+            DBEndpoint.id == endpoint_id,
+            DBCollection.owner_id == owner.id
+        ))).first()
+        if row is None:
+            raise HTTPException(status_code=404, detail="Endpoint not found")
+        config = EndpointConfig.from_model(*row)
+    endpoint_cache.put(owner.id, config)
+    return config
+
+async def inject_chaos(endpoint: EndpointConfig, timer: metrics.ProxyTimer):
+    # Simulate latency drawn from the endpoint's distribution, counted from
+    # the start of the request so the proxy's own overhead isn't added on top
+    latency = endpoint.latency_sampler.sample() / 1000  # Convert to seconds
+    if latency > 0:
+        await scheduler.sleep(latency, since=timer.started)
+
+    # Simulate failure if specified
+    if random.random() < (endpoint.fail_rate / 100):  # Convert percentage to decimal
+        raise InjectedFailure(status_code=500, detail="Simulated failure")
+
+# Body of a malformed_json fault without its own body: cut off mid-document
+MALFORMED_JSON = '{"data": [{"id": 1, "name": "'
+
+def match_fault(endpoint: EndpointConfig, method: str, url: str, request: Request) -> Optional[faults.Fault]:
+    """The fault the endpoint's compiled rules pick for this request, if any."""
+    if not endpoint.faults:
+        return None
+    return endpoint.faults.match(method.upper(), urlparse(url).path or "/", request.headers, request.query_params)
+
+def check_http_endpoint(endpoint: EndpointConfig):
+    if endpoint.url.startswith("tcp://"):
+        raise HTTPException(
+            status_code=409,
+            detail=f"Endpoint {endpoint.id} is a TCP endpoint, reachable only on its listen_port {endpoint.listen_port}",
+        )
+
+def recording_scope(endpoint_id: int) -> str:
+    # Recordings may hold data fetched with the endpoint's stored credentials,
+    # so they are only replayed through the endpoint that made them. Endpoint
+    # ids are never reused, and an endpoint's recordings go when it does.
+    return f"endpoint:{endpoint_id}"
+
+async def replay(key: str, endpoint: EndpointConfig, timer: metrics.ProxyTimer, truncate_after: Optional[int] = None) -> Response:
+    """Serve a sandboxed endpoint from its recordings; the upstream is never contacted."""
+    recording = recordings.store.get(key)
+    if recording is None:
+        raise HTTPException(status_code=404, detail="No recorded response matches this request")
+    return await upstream.replay_response(recording, endpoint.shaping, timer, truncate_after)
+
+def shares_responses(endpoint: EndpointConfig, method: str) -> bool:
+    # Only GETs are shared, and recording needs each response streamed through
+    return method.upper() == "GET" and (endpoint.coalesce or endpoint.cache_ttl_ms > 0) and not endpoint.record
+
+async def shared_response(endpoint: EndpointConfig, request: httpx.Request, timer: metrics.ProxyTimer, ticket: Ticket, truncate_after: Optional[int] = None) -> Response:
+    """Serve a GET from the endpoint's response cache or one upstream call shared by concurrent callers.
+
+    Latency and faults have already been applied per caller; shaping is
+    applied per caller when the shared body is sent. Only callers that miss
+    the cache take an upstream slot. Bodies over RESPONSE_CACHE_MAX_BODY are
+    never buffered: each caller streams its own upstream response instead.
+    """
+    key = (endpoint.id, str(request.url), tuple(request.headers.raw))
+    response = response_cache.get(key) if endpoint.cache_ttl_ms else None
+    if response is None:
+        ticket.acquire_upstream()
+        fetch = lambda: upstream.fetch_buffered(request, response_cache.max_body)
+        if endpoint.coalesce:
+            response = await single_flight.do(key, fetch)
+        else:
+            response = await fetch()
+        if response is None:
+            response_cache.too_large += 1
+            return await upstream.stream_response(request, endpoint.shaping, timer, truncate_after)
+        if endpoint.cache_ttl_ms:
+            response_cache.put(key, response, endpoint.cache_ttl_ms / 1000)
+    return await upstream.replay_response(response, endpoint.shaping, timer, truncate_after, stage="upstream")
+
+async def reset_body():
+    raise upstream.InjectedDisconnect("connection reset")
+    yield b""
+
+async def fault_response(fault: faults.Fault) -> Response:
+    """Respond with a fault that doesn't involve the upstream (truncation does)."""
+    if fault.type == "status":
+        raise InjectedFailure(status_code=fault.status, detail=fault.body or "Injected fault")
+    if fault.type == "timeout":
+        await scheduler.sleep(fault.delay_ms / 1000 if fault.delay_ms else upstream.UPSTREAM_TIMEOUT)
+        raise InjectedFailure(status_code=fault.status, detail="Request timed out")
+    if fault.type == "reset":
+        # Headers go out, then the connection drops before any body
+        return StreamingResponse(reset_body(), status_code=fault.status)
+    if fault.type == "malformed_json":
+        return Response(fault.body or MALFORMED_JSON, status_code=fault.status, media_type="application/json")
+    return Response(status_code=fault.status)
+
 @app.get("/proxy")
 async def proxy_request(
     endpoint_id: int,
-    db: Session = Depends(get_db),
-    current_user: DBUser = Depends(get_current_user)
+    caller: Request,
+    mode: str = "raw",
+    current_user: Principal = Depends(get_current_principal)
 ):
+    if mode not in PROXY_MODES:
+        raise HTTPException(status_code=400, detail="mode must be one of: " + ", ".join(PROXY_MODES))
+
+    timer = metrics.ProxyTimer()
     try:
-        # Get endpoint from database
-        endpoint = db.query(DBEndpoint).join(DBCollection).filter(
-            DBEndpoint.id == endpoint_id,
-            DBCollection.owner_id == current_user.id
-        ).first()
-        
-        if endpoint is None:
-            raise HTTPException(status_code=404, detail="Endpoint not found")
+        endpoint = await get_endpoint_config(endpoint_id, current_user)
+        timer.label(endpoint.id, endpoint.collection_id)
+        timer.mark("lookup")
+        check_http_endpoint(endpoint)
 
-        # Simulate latency if specified
-        if endpoint.min_latency > 0 or endpoint.max_latency > 0:
-            latency = random.uniform(endpoint.min_latency, endpoint.max_latency) / 1000  # Convert to seconds
-            time.sleep(latency)
+        ticket = admission.admit(caller.scope, current_user.id, endpoint.collection_id, endpoint.limits)
+        await inject_chaos(endpoint, timer)
+        timer.mark("delay")
 
-        # Simulate failure if specified
-        if random.random() < (endpoint.fail_rate / 100):  # Convert percentage to decimal
-            raise HTTPException(status_code=500, detail="Simulated failure")
+        fault = match_fault(endpoint, endpoint.method, endpoint.url, caller)
+        timer.mark("faults")
+        if fault is not None and fault.type != "truncated":
+            timer.status_code = fault.status
+            response = await fault_response(fault)
+            timer.finish("injected")
+            return response
+        truncate_after = fault.truncate_bytes if fault is not None else None
 
         # Make the actual request with timeout
-        headers = endpoint.headers or {}
+        headers = httpx.Headers(endpoint.headers or {})
+        headers.setdefault("accept-encoding", "identity")
         data = endpoint.body if endpoint.method.upper() in ['POST', 'PUT', 'PATCH'] else None
         
-        response = requests.request(
+        client = upstream.get_client()
+        request = client.build_request(
             method=endpoint.method,
             url=endpoint.url,
             headers=headers,
-            json=data,
-            timeout=10  # 10 second timeout
+            json=data
+        )
+        key = lambda: recordings.request_key(
+            recording_scope(endpoint.id), endpoint.record_match, request.method, str(request.url),
+            recordings.digest(request.content)
         )
+
+        # Replays are served as recorded, whatever the mode
+        if endpoint.sandbox:
+            return await replay(key(), endpoint, timer, truncate_after)
+
+        # Raw mode streams the upstream response through untouched; a truncated
+        # body is always streamed, since inspecting it would only fail to parse
+        if (mode == "raw" or truncate_after is not None) and shares_responses(endpoint, request.method):
+            return await shared_response(endpoint, request, timer, ticket, truncate_after)
+        ticket.acquire_upstream()
+        if mode == "raw" or truncate_after is not None:
+            response = await upstream.stream_response(request, endpoint.shaping, timer, truncate_after)
+            return upstream.record_response(response, key) if endpoint.record else response
+
+        response = await client.send(request)
+        timer.mark("upstream")
+        timer.status_code = response.status_code
+        if endpoint.record:
+            recordings.store.save(key(), response.status_code, upstream.forward_headers(response.headers), response.content)
         response.raise_for_status()  # Raise an exception for bad status codes
-        return response.json()
-    except requests.Timeout:
+        content = response.json()
+        timer.mark("serialize")
+        timer.finish()
+        return content
+    except InjectedFailure:
+        timer.finish("injected")
+        raise
+    except HTTPException:
+        timer.finish("proxy")
+        raise
+    except httpx.TimeoutException:
+        timer.finish("upstream")
         raise HTTPException(status_code=504, detail="Request timed out")
-    except requests.RequestException as e:
+    except httpx.HTTPError as e:
+        timer.finish("upstream")
         raise HTTPException(status_code=500, detail=str(e))
     except Exception as e:
+        timer.finish("proxy")
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def forward_request(endpoint_id: int, path: str, request: Request, current_user: Principal):
+    """Forward the caller's own method, headers, query and body to the endpoint's URL."""
+    timer = metrics.ProxyTimer()
+    try:
+        endpoint = await get_endpoint_config(endpoint_id, current_user)
+        timer.label(endpoint.id, endpoint.collection_id)
+        timer.mark("lookup")
+        check_http_endpoint(endpoint)
+
+        ticket = admission.admit(request.scope, current_user.id, endpoint.collection_id, endpoint.limits)
+        await inject_chaos(endpoint, timer)
+        timer.mark("delay")
+
+        url = endpoint.url.rstrip("/") + "/" + path if path else endpoint.url
+        if request.url.query:
+            url += ("&" if urlparse(url).query else "?") + request.url.query
+
+        fault = match_fault(endpoint, request.method, url, request)
+        timer.mark("faults")
+        if fault is not None and fault.type != "truncated":
+            timer.status_code = fault.status
+            response = await fault_response(fault)
+            timer.finish("injected")
+            return response
+
+        # Stored endpoint headers act as defaults for the caller's own headers
+        caller_headers = upstream.request_headers(request, exclude=["authorization"])
+        caller_names = {name for name, _ in caller_headers}
+        headers = [
+            (name.lower().encode("latin-1"), str(value).encode("latin-1"))
+            for name, value in (endpoint.headers or {}).items()
+            if name.lower().encode("latin-1") not in caller_names
+        ] + caller_headers
+
+        truncate_after = fault.truncate_bytes if fault is not None else None
+
+        if endpoint.sandbox:
+            body_digest = recordings.digest(await request.body()) if "body" in endpoint.record_match else recordings.EMPTY_DIGEST
+            key = recordings.request_key(recording_scope(endpoint.id), endpoint.record_match, request.method, url, body_digest)
+            return await replay(key, endpoint, timer, truncate_after)
+
+        body = upstream.request_body(request)
+        if endpoint.record and body is not None:
+            body = recordings.BodyDigest(body)
+
+        client = upstream.get_client()
+        upstream_request = client.build_request(
+            method=request.method,
+            url=url,
+            headers=headers,
+            content=endpoint.shaping.upload(body)
+        )
+        # A request with a body can't be sent again if the shared response turns out too large
+        if body is None and shares_responses(endpoint, request.method):
+            return await shared_response(endpoint, upstream_request, timer, ticket, truncate_after)
+        ticket.acquire_upstream()
+        response = await upstream.stream_response(upstream_request, endpoint.shaping, timer, truncate_after)
+        if endpoint.record:
+            response = upstream.record_response(response, lambda: recordings.request_key(
+                recording_scope(endpoint.id), endpoint.record_match, request.method, url,
+                body.hexdigest() if body is not None else recordings.EMPTY_DIGEST
+            ))
+        return response
+    except InjectedFailure:
+        timer.finish("injected")
+        raise
+    except HTTPException:
+        timer.finish("proxy")
+        raise
+    except httpx.TimeoutException:
+        timer.finish("upstream")
+        raise HTTPException(status_code=504, detail="Request timed out")
+    except httpx.HTTPError as e:
+        timer.finish("upstream")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.api_route("/proxy/{endpoint_id}", methods=upstream.PROXY_METHODS)
+async def proxy_endpoint(
+    endpoint_id: int,
+    request: Request,
+    current_user: Principal = Depends(get_current_principal)
+):
+    return await forward_request(endpoint_id, "", request, current_user)
+
+@app.api_route("/proxy/{endpoint_id}/{path:path}", methods=upstream.PROXY_METHODS)
+async def proxy_endpoint_path(
+    endpoint_id: int,
+    path: str,
+    request: Request,
+    current_user: Principal = Depends(get_current_principal)
+):
+    return await forward_request(endpoint_id, path, request, current_user)
+
+# Keyset pagination for listings: pages are ordered by id, and the id to pass as
+# `after` for the next page is returned in the X-Next-Cursor header
+PAGE_SIZE = int(os.getenv("PAGE_SIZE", "100"))
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "1000"))
+
+def paginate(items: list, limit: int, response: Response) -> list:
+    """Trim a page fetched with limit + 1 rows, setting the cursor if more remain."""
+    if len(items) > limit:
+        items = items[:limit]
+        response.headers["X-Next-Cursor"] = str(items[-1].id)
+    return items
+
+def check_endpoint(endpoint: EndpointBase):
+    """Build everything the proxy derives from an endpoint, so bad settings fail on save; raises ValueError."""
+    build_sampler(endpoint.latency_distribution, endpoint.latency_params, endpoint.min_latency, endpoint.max_latency)
+    faults.compile_rules([rule.dict() for rule in endpoint.fault_rules or []])
+    recordings.parse_match(endpoint.record_match)
+    if endpoint.listen_port is not None or endpoint.url.startswith("tcp://"):
+        if endpoint.listen_port is None:
+            raise ValueError("tcp:// endpoints need a listen_port")
+        check_listen_port(endpoint.listen_port)
+        parse_target(endpoint.url)
+
+async def start_tcp_proxies():
+    """Start the TCP listeners of every endpoint with a listen_port."""
+    async with ReadSessionLocal() as db:
+        endpoints = (await db.scalars(select(DBEndpoint).where(DBEndpoint.listen_port.isnot(None)))).all()
+    await tcp_proxies.start_all(EndpointConfig.from_model(endpoint) for endpoint in endpoints)
+
+async def apply_tcp_proxy(db: AsyncSession, db_endpoint: DBEndpoint, previous: Optional[EndpointConfig] = None):
+    """Bring the endpoint's TCP listener in line, then commit its changes.
+
+    If the commit fails, the listener is put back as it was in `previous`
+    (none, for a new endpoint).
+    """
+    port = db_endpoint.listen_port
+    endpoint_id = db_endpoint.id
+    try:
+        await tcp_proxies.apply(EndpointConfig.from_model(db_endpoint))
+    except OSError as e:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail=f"Could not listen on port {port}: {e}")
+    try:
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        await tcp_proxies.restore(endpoint_id, previous)
+        raise
+
+async def apply_imported_tcp_proxies(db: AsyncSession, collection_id: int, after_id: int):
+    """Start the listeners of endpoints just imported, then commit them; all or none."""
+    imported = (await db.scalars(select(DBEndpoint).where(
+        DBEndpoint.collection_id == collection_id,
+        DBEndpoint.id > after_id,
+        DBEndpoint.listen_port.isnot(None)
+    ))).all()
+    started = []
+    for db_endpoint in imported:
+        try:
+            await tcp_proxies.apply(EndpointConfig.from_model(db_endpoint))
+        except OSError as e:
+            # Read before the rollback expires the row
+            port = db_endpoint.listen_port
+            for endpoint_id in started:
+                await tcp_proxies.remove(endpoint_id)
+            await db.rollback()
+            raise HTTPException(status_code=400, detail=f"Could not listen on port {port}: {e}")
+        started.append(db_endpoint.id)
+    try:
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        for endpoint_id in started:
+            await tcp_proxies.remove(endpoint_id)
+        raise
+
+def check_fault_rules(rules: Optional[List[FaultRule]]):
+    """Compile rules as they are saved, rejecting bad patterns and priming the compile cache."""
+    try:
+        faults.compile_rules([rule.dict() for rule in rules or []])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 # New routes for collections
 @app.post("/api/collections/", response_model=Collection)
 async def create_collection(
     collection: CollectionCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: DBUser = Depends(get_current_user)
 ):
+    check_fault_rules(collection.fault_rules)
     db_collection = DBCollection(**collection.dict(), owner_id=current_user.id)
     db.add(db_collection)
-    db.commit()
-    db.refresh(db_collection)
+    await db.commit()
+    await db.refresh(db_collection)
     return db_collection
 
 @app.get("/api/collections/", response_model=List[Collection])
 async def read_collections(
-    db: Session = Depends(get_db),
+    response: Response,
+    limit: int = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[int] = None,
+    db: AsyncSession = Depends(get_db),
     current_user: DBUser = Depends(get_current_user)
 ):
-    return db.query(DBCollection).filter(DBCollection.owner_id == current_user.id).all()
+    query = select(DBCollection).where(DBCollection.owner_id == current_user.id)
+    if after is not None:
+        query = query.where(DBCollection.id > after)
+    collections = (await db.scalars(query.order_by(DBCollection.id).limit(limit + 1))).all()
+    return paginate(collections, limit, response)
 
 @app.get("/api/collections/{collection_id}/", response_model=Collection)
 async def read_collection(
     collection_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: DBUser = Depends(get_current_user)
 ):
-    collection = db.query(DBCollection).filter(
+    collection = await db.scalar(select(DBCollection).where(
         DBCollection.id == collection_id,
         DBCollection.owner_id == current_user.id
-    ).first()
+    ))
     if collection is None:
         raise HTTPException(status_code=404, detail="Collection not found")
     return collection
 
+@app.put("/api/collections/{collection_id}/", response_model=Collection)
+async def update_collection(
+    collection_id: int,
+    collection: CollectionCreate,
+    db: AsyncSession = Depends(get_db),
+    current_user: DBUser = Depends(get_current_user)
+):
+    db_collection = await db.scalar(select(DBCollection).where(
+        DBCollection.id == collection_id,
+        DBCollection.owner_id == current_user.id
+    ))
+    if db_collection is None:
+        raise HTTPException(status_code=404, detail="Collection not found")
+    check_fault_rules(collection.fault_rules)
+    for field, value in collection.dict().items():
+        setattr(db_collection, field, value)
+    await db.commit()
+    await db.refresh(db_collection)
+    endpoint_cache.invalidate_collection(collection_id)
+    return db_collection
+
 @app.delete("/api/collections/{collection_id}/")
 async def delete_collection(
     collection_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: DBUser = Depends(get_current_user)
 ):
-    collection = db.query(DBCollection).filter(
+    collection = await db.scalar(select(DBCollection).where(
         DBCollection.id == collection_id,
         DBCollection.owner_id == current_user.id
-    ).first()
+    ))
     if collection is None:
         raise HTTPException(status_code=404, detail="Collection not found")
-    db.delete(collection)
-    db.commit()
+    endpoint_ids = (await db.scalars(select(DBEndpoint.id).where(DBEndpoint.collection_id == collection_id))).all()
+    await db.delete(collection)
+    await db.commit()
+    endpoint_cache.invalidate_collection(collection_id)
+    for endpoint_id in endpoint_ids:
+        response_cache.invalidate(endpoint_id)
+        recordings.store.forget_scope(recording_scope(endpoint_id))
+    admission.forget_collection(collection_id)
+    await tcp_proxies.remove_collection(collection_id)
     return {"message": "Collection deleted"}
 
+def describe_error(error: ValueError) -> str:
+    if isinstance(error, ValidationError):
+        return "; ".join(
+            ".".join(str(part) for part in detail["loc"]) + ": " + detail["msg"]
+            for detail in error.errors()
+        )
+    return str(error)
+
+@app.post("/api/collections/{collection_id}/import")
+async def import_endpoints(
+    collection_id: int,
+    request: Request,
+    base_url: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+    current_user: DBUser = Depends(get_current_user)
+):
+    """Bulk-create endpoints from NDJSON, a JSON list or an OpenAPI document.
+
+    Every item is validated before anything is written; the rows are then
+    inserted in batches within a single transaction, so an import either
+    lands completely or not at all.
+    """
+    collection = await db.scalar(select(DBCollection).where(
+        DBCollection.id == collection_id,
+        DBCollection.owner_id == current_user.id
+    ))
+    if collection is None:
+        raise HTTPException(status_code=404, detail="Collection not found")
+    # Release the connection while the body is read and validated
+    await db.close()
+
+    rows = []
+    errors = []
+    invalid = 0
+    # Item position claiming each listen_port, to catch duplicates within the import
+    listen_ports = {}
+
+    def add(position: int, item):
+        nonlocal invalid
+        if len(rows) >= bulk.IMPORT_MAX_ENDPOINTS:
+            raise HTTPException(status_code=413, detail=f"Imports are limited to {bulk.IMPORT_MAX_ENDPOINTS} endpoints")
+        try:
+            if not isinstance(item, dict):
+                raise ValueError("expected a JSON object")
+            endpoint = EndpointBase(**item)
+            check_endpoint(endpoint)
+            if endpoint.listen_port is not None:
+                if endpoint.listen_port in listen_ports:
+                    raise ValueError(f"listen_port {endpoint.listen_port} is also used by item {listen_ports[endpoint.listen_port]}")
+                listen_ports[endpoint.listen_port] = position
+        except ValueError as e:
+            invalid += 1
+            if len(errors) < bulk.IMPORT_MAX_ERRORS:
+                errors.append({"item": position, "error": describe_error(e)})
+            return
+        rows.append({**endpoint.dict(), "collection_id": collection_id})
+
+    try:
+        if bulk.is_ndjson(request.headers.get("content-type", "")):
+            async for position, item in bulk.iter_ndjson(request.stream()):
+                add(position, item)
+        else:
+            for position, item in bulk.iter_json(json.loads(await request.body()), base_url):
+                add(position, item)
+    except json.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="Invalid JSON in request body")
+    except bulk.ImportFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if invalid:
+        raise HTTPException(status_code=400, detail={
+            "message": f"{invalid} invalid endpoint(s), nothing was imported",
+            "errors": errors,
+        })
+
+    if listen_ports:
+        taken = (await db.scalars(select(DBEndpoint.listen_port).where(
+            DBEndpoint.listen_port.in_(list(listen_ports))
+        ))).all()
+        if taken:
+            raise HTTPException(status_code=400, detail={
+                "message": "listen_port already used by another endpoint, nothing was imported",
+                "errors": [{"item": listen_ports[port], "error": f"listen_port {port} is already in use"} for port in sorted(taken)],
+            })
+        # Imported rows get ids above the current highest
+        after_id = await db.scalar(select(func.max(DBEndpoint.id))) or 0
+
+    for batch in bulk.batches(rows):
+        await db.execute(insert(DBEndpoint), batch)
+    if listen_ports:
+        await apply_imported_tcp_proxies(db, collection_id, after_id)
+    else:
+        await db.commit()
+    return {"imported": len(rows)}
+
+@app.get("/api/collections/{collection_id}/export")
+async def export_endpoints(
+    collection_id: int,
+    db: AsyncSession = Depends(get_db),
+    current_user: DBUser = Depends(get_current_user)
+):
+    """Stream a collection's endpoints as NDJSON, in the format the import accepts."""
+    collection = await db.scalar(select(DBCollection).where(
+        DBCollection.id == collection_id,
+        DBCollection.owner_id == current_user.id
+    ))
+    if collection is None:
+        raise HTTPException(status_code=404, detail="Collection not found")
+
+    async def lines():
+        async with ReadSessionLocal() as export_db:
+            endpoints = await export_db.stream_scalars(
+                select(DBEndpoint)
+                .where(DBEndpoint.collection_id == collection_id)
+                .order_by(DBEndpoint.id)
+                .execution_options(yield_per=bulk.IMPORT_BATCH_SIZE)
+            )
+            async for endpoint in endpoints:
+                yield json.dumps({field: getattr(endpoint, field) for field in EndpointBase.model_fields}) + "\n"
+
+    return StreamingResponse(
+        lines(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="collection-{collection_id}.ndjson"'},
+    )
+
 # New routes for endpoints
 @app.post("/api/endpoints/", response_model=Endpoint)
 async def create_endpoint(
     endpoint: EndpointCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: DBUser = Depends(get_current_user)
 ):
     # Verify collection belongs to user
-    collection = db.query(DBCollection).filter(
+    collection = await db.scalar(select(DBCollection).where(
         DBCollection.id == endpoint.collection_id,
         DBCollection.owner_id == current_user.id
-    ).first()
+    ))
     if collection is None:
         raise HTTPException(status_code=404, detail="Collection not found")
+
+    try:
+        check_endpoint(endpoint)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
     db_endpoint = DBEndpoint(**endpoint.dict())
     db.add(db_endpoint)
-    db.commit()
-    db.refresh(db_endpoint)
+    if db_endpoint.listen_port is None:
+        await db.commit()
+    else:
+        await db.flush()
+        await apply_tcp_proxy(db, db_endpoint)
+    await db.refresh(db_endpoint)
+    endpoint_cache.invalidate(current_user.id, db_endpoint.id)
     return db_endpoint
 
 @app.get("/api/collections/{collection_id}/endpoints/", response_model=List[Endpoint])
 async def read_endpoints(
     collection_id: int,
-    db: Session = Depends(get_db),
+    response: Response,
+    limit: int = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[int] = None,
+    db: AsyncSession = Depends(get_db),
     current_user: DBUser = Depends(get_current_user)
 ):
-    # Verify collection belongs to user
-    collection = db.query(DBCollection).filter(
-        DBCollection.id == collection_id,
-        DBCollection.owner_id == current_user.id
-    ).first()
-    if collection is None:
+    # Ownership check and page in one query: the owned collection is outer-joined
+    # to its endpoints, so an empty collection still yields a single row
+    join_on = [DBEndpoint.collection_id == DBCollection.id]
+    if after is not None:
+        join_on.append(DBEndpoint.id > after)
+    rows = (await db.execute(
+        select(DBCollection.id, DBEndpoint)
+        .outerjoin(DBEndpoint, and_(*join_on))
+        .where(DBCollection.id == collection_id, DBCollection.owner_id == current_user.id)
+        .order_by(DBEndpoint.id)
+        .limit(limit + 1)
+    )).all()
+    if not rows:
         raise HTTPException(status_code=404, detail="Collection not found")
-    
-    return db.query(DBEndpoint).filter(DBEndpoint.collection_id == collection_id).all()
+
+    endpoints = [endpoint for _, endpoint in rows if endpoint is not None]
+    return paginate(endpoints, limit, response)
 
 @app.get("/api/endpoints/{endpoint_id}/", response_model=Endpoint)
 async def read_endpoint(
     endpoint_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: DBUser = Depends(get_current_user)
 ):
-    endpoint = db.query(DBEndpoint).join(DBCollection).filter(
+    endpoint = await db.scalar(select(DBEndpoint).join(DBCollection).where(
         DBEndpoint.id == endpoint_id,
         DBCollection.owner_id == current_user.id
-    ).first()
+    ))
     if endpoint is None:
         raise HTTPException(status_code=404, detail="Endpoint not found")
     return endpoint
 
+@app.put("/api/endpoints/{endpoint_id}/", response_model=Endpoint)
+async def update_endpoint(
+    endpoint_id: int,
+    endpoint: EndpointBase,
+    db: AsyncSession = Depends(get_db),
+    current_user: DBUser = Depends(get_current_user)
+):
+    db_endpoint = await db.scalar(select(DBEndpoint).join(DBCollection).where(
+        DBEndpoint.id == endpoint_id,
+        DBCollection.owner_id == current_user.id
+    ))
+    if db_endpoint is None:
+        raise HTTPException(status_code=404, detail="Endpoint not found")
+
+    try:
+        check_endpoint(endpoint)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    previous = EndpointConfig.from_model(db_endpoint)
+    for field, value in endpoint.dict().items():
+        setattr(db_endpoint, field, value)
+    await apply_tcp_proxy(db, db_endpoint, previous)
+    await db.refresh(db_endpoint)
+    endpoint_cache.invalidate(current_user.id, endpoint_id)
+    response_cache.invalidate(endpoint_id)
+    return db_endpoint
+
 @app.delete("/api/endpoints/{endpoint_id}/")
 async def delete_endpoint(
     endpoint_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: DBUser = Depends(get_current_user)
 ):
-    endpoint = db.query(DBEndpoint).join(DBCollection).filter(
+    endpoint = await db.scalar(select(DBEndpoint).join(DBCollection).where(
         DBEndpoint.id == endpoint_id,
         DBCollection.owner_id == current_user.id
-    ).first()
+    ))
     if endpoint is None:
         raise HTTPException(status_code=404, detail="Endpoint not found")
-    db.delete(endpoint)
-    db.commit()
+    await db.delete(endpoint)
+    await db.commit()
+    endpoint_cache.invalidate(current_user.id, endpoint_id)
+    response_cache.invalidate(endpoint_id)
+    recordings.store.forget_scope(recording_scope(endpoint_id))
+    await tcp_proxies.remove(endpoint_id)
     return {"message": "Endpoint deleted"} 
\ No newline at end of file
@@ -0,0 +1,255 @@
+# Shared module: keep api/recordings.py and app/core/recordings.py identical (make check-shared)
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import tempfile
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from typing import AsyncIterator, Callable, Iterable, Iterator, List, Optional, Tuple
+
+# Recorded responses: bodies are stored once per content hash under objects/,
+# and each request key maps to a small JSON file under keys/<scope digest>/
+RECORDINGS_DIR = os.getenv("RECORDINGS_DIR", "recordings")
+RECORDING_CACHE_BYTES = int(os.getenv("RECORDING_CACHE_BYTES", str(64 * 1024 * 1024)))
+# Bodies at least this large are streamed from a memory map instead of cached
+RECORDING_MMAP_THRESHOLD = int(os.getenv("RECORDING_MMAP_THRESHOLD", str(1024 * 1024)))
+RECORDING_CHUNK_SIZE = 64 * 1024
+
+# Parts of a request a recording can be keyed on
+MATCH_PARTS = ("method", "url", "body")
+DEFAULT_MATCH = os.getenv("RECORD_MATCH", "method,url,body")
+
+EMPTY_DIGEST = hashlib.sha256(b"").hexdigest()
+
+def parse_match(spec: Optional[str] = None) -> Tuple[str, ...]:
+    """Parse a comma-separated list of match parts, e.g. "method,url"; raises ValueError."""
+    parts = tuple(part.strip().lower() for part in (spec or DEFAULT_MATCH).split(",") if part.strip())
+    unknown = [part for part in parts if part not in MATCH_PARTS]
+    if unknown or not parts:
+        raise ValueError("match must list some of: " + ", ".join(MATCH_PARTS))
+    return parts
+
+# Caller headers that decide whose data an upstream response is
+CREDENTIAL_HEADERS = (b"authorization", b"cookie", b"proxy-authorization")
+
+def scope_digest(scope: str) -> str:
+    return hashlib.sha256(scope.encode()).hexdigest()
+
+def request_key(scope: str, match: Iterable[str], method: str, url: str, body_digest: str = EMPTY_DIGEST) -> str:
+    """Key of a recording; `scope` names whose request it was, so one is never replayed to another.
+
+    Keys are "<scope digest>/<request digest>", so a scope's recordings can be dropped together.
+    """
+    values = {"method": method.upper(), "url": url, "body": body_digest}
+    parts = [f"scope={scope}"] + [f"{part}={values[part]}" for part in match]
+    return scope_digest(scope) + "/" + hashlib.sha256("\0".join(parts).encode()).hexdigest()
+
+def credentials_scope(headers: Iterable[Tuple[bytes, bytes]]) -> str:
+    """Scope for a request forwarding the caller's own headers: a digest of its credentials."""
+    credentials = sorted((name.lower(), value) for name, value in headers if name.lower() in CREDENTIAL_HEADERS)
+    return "credentials:" + hashlib.sha256(b"\0".join(name + b"=" + value for name, value in credentials)).hexdigest()
+
+def digest(body: Optional[bytes]) -> str:
+    return hashlib.sha256(body or b"").hexdigest()
+
+class BodyDigest:
+    """Hash a request body as it streams through to the upstream."""
+
+    def __init__(self, chunks: Optional[AsyncIterator[bytes]]):
+        self._chunks = chunks
+        self._hash = hashlib.sha256()
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        if self._chunks is None:
+            return
+        async for chunk in self._chunks:
+            self._hash.update(chunk)
+            yield chunk
+
+    def hexdigest(self) -> str:
+        return self._hash.hexdigest()
+
+@dataclass(frozen=True)
+class Recording:
+    status_code: int
+    headers: List[Tuple[bytes, bytes]]
+    digest: str
+    size: int
+    # Small bodies are held in memory; large ones are read from disk on demand
+    body: Optional[bytes] = None
+
+class RecordingStore:
+    """Content-addressed response store on disk, fronted by an LRU of recent recordings."""
+
+    def __init__(
+        self,
+        root: str = RECORDINGS_DIR,
+        cache_bytes: int = RECORDING_CACHE_BYTES,
+        mmap_threshold: int = RECORDING_MMAP_THRESHOLD,
+    ):
+        self.root = root
+        self.cache_bytes = cache_bytes
+        self.mmap_threshold = mmap_threshold
+        self._cache: "OrderedDict[str, Recording]" = OrderedDict()
+        self._cached_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.saved = 0
+
+    def _object_path(self, body_digest: str) -> str:
+        return os.path.join(self.root, "objects", body_digest[:2], body_digest[2:])
+
+    def _key_path(self, key: str) -> str:
+        scope, _, request = key.partition("/")
+        return os.path.join(self.root, "keys", scope, request[:2], request[2:] + ".json")
+
+    def get(self, key: str) -> Optional[Recording]:
+        recording = self._cache.get(key)
+        if recording is not None:
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return recording
+
+        self.misses += 1
+        try:
+            with open(self._key_path(key)) as f:
+                meta = json.load(f)
+            recording = Recording(
+                status_code=meta["status_code"],
+                headers=[(name.encode("latin-1"), value.encode("latin-1")) for name, value in meta["headers"]],
+                digest=meta["digest"],
+                size=meta["size"],
+            )
+            if recording.size < self.mmap_threshold:
+                with open(self._object_path(recording.digest), "rb") as f:
+                    recording = replace(recording, body=f.read())
+        except FileNotFoundError:
+            return None
+        self._remember(key, recording)
+        return recording
+
+    def _remember(self, key: str, recording: Recording):
+        old = self._cache.pop(key, None)
+        if old is not None:
+            self._cached_bytes -= self._cost(old)
+        self._cache[key] = recording
+        self._cached_bytes += self._cost(recording)
+        while self._cached_bytes > self.cache_bytes and self._cache:
+            _, evicted = self._cache.popitem(last=False)
+            self._cached_bytes -= self._cost(evicted)
+
+    @staticmethod
+    def _cost(recording: Recording) -> int:
+        return len(recording.body or b"") + sum(len(name) + len(value) for name, value in recording.headers) + 200
+
+    def chunks(self, recording: Recording) -> Iterator[bytes]:
+        """A recording's body in chunks, memory-mapped from disk when it isn't cached."""
+        if recording.body is not None:
+            if recording.body:
+                yield recording.body
+            return
+        if recording.size == 0:
+            return
+        with open(self._object_path(recording.digest), "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                for start in range(0, len(mapped), RECORDING_CHUNK_SIZE):
+                    yield mapped[start:start + RECORDING_CHUNK_SIZE]
+
+    async def body(self, recording: Recording) -> AsyncIterator[bytes]:
+        for chunk in self.chunks(recording):
+            yield chunk
+
+    def read(self, recording: Recording) -> bytes:
+        return b"".join(self.chunks(recording))
+
+    def save(self, key: str, status_code: int, headers: List[Tuple[bytes, bytes]], body: bytes) -> Recording:
+        temp = self._temp_file()
+        with temp:
+            temp.write(body)
+        return self._commit(key, status_code, headers, temp.name, digest(body), len(body))
+
+    async def capture(
+        self,
+        key: Callable[[], str],
+        status_code: int,
+        headers: List[Tuple[bytes, bytes]],
+        chunks: AsyncIterator[bytes],
+    ) -> AsyncIterator[bytes]:
+        """Pass a response body through while writing it to the store.
+
+        The recording is only kept if the body completes; the key is computed
+        afterwards, once the request body has been hashed too.
+        """
+        temp = self._temp_file()
+        body_hash = hashlib.sha256()
+        size = 0
+        complete = False
+        try:
+            async for chunk in chunks:
+                temp.write(chunk)
+                body_hash.update(chunk)
+                size += len(chunk)
+                yield chunk
+            complete = True
+        finally:
+            temp.close()
+            if complete:
+                self._commit(key(), status_code, headers, temp.name, body_hash.hexdigest(), size)
+            else:
+                os.unlink(temp.name)
+
+    def _temp_file(self):
+        directory = os.path.join(self.root, "tmp")
+        os.makedirs(directory, exist_ok=True)
+        return tempfile.NamedTemporaryFile(dir=directory, delete=False)
+
+    def _commit(self, key: str, status_code: int, headers: List[Tuple[bytes, bytes]], temp_path: str, body_digest: str, size: int) -> Recording:
+        object_path = self._object_path(body_digest)
+        if os.path.exists(object_path):
+            os.unlink(temp_path)
+        else:
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            os.replace(temp_path, object_path)
+
+        key_path = self._key_path(key)
+        os.makedirs(os.path.dirname(key_path), exist_ok=True)
+        meta = {
+            "status_code": status_code,
+            "headers": [[name.decode("latin-1"), value.decode("latin-1")] for name, value in headers],
+            "digest": body_digest,
+            "size": size,
+        }
+        temp = self._temp_file()
+        with temp:
+            temp.write(json.dumps(meta).encode())
+        os.replace(temp.name, key_path)
+
+        self.saved += 1
+        # Drop any cached copy; the next replay reloads it from disk
+        old = self._cache.pop(key, None)
+        if old is not None:
+            self._cached_bytes -= self._cost(old)
+        return Recording(status_code=status_code, headers=headers, digest=body_digest, size=size)
+
+    def forget_scope(self, scope: str):
+        """Drop every recording made in `scope`; bodies other recordings share stay in objects/."""
+        prefix = scope_digest(scope) + "/"
+        for key in [key for key in self._cache if key.startswith(prefix)]:
+            self._cached_bytes -= self._cost(self._cache.pop(key))
+        shutil.rmtree(os.path.join(self.root, "keys", prefix[:-1]), ignore_errors=True)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "cached": len(self._cache),
+            "cached_bytes": self._cached_bytes,
+            "cache_bytes": self.cache_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "saved": self.saved,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+store = RecordingStore()
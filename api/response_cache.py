@@ -0,0 +1,112 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from recordings import Recording
+
+# Cache configuration
+RESPONSE_CACHE_BYTES = int(os.getenv("RESPONSE_CACHE_BYTES", str(32 * 1024 * 1024)))
+RESPONSE_CACHE_MAX_BODY = int(os.getenv("RESPONSE_CACHE_MAX_BODY", str(1024 * 1024)))
+
+def _cost(response: Recording) -> int:
+    return len(response.body or b"") + sum(len(name) + len(value) for name, value in response.headers) + 200
+
+class ResponseCache:
+    """LRU of buffered upstream responses with per-entry TTLs, bounded by total size.
+
+    Keys start with the endpoint id so an endpoint's entries can be dropped
+    when it changes.
+    """
+
+    def __init__(self, max_bytes: int = RESPONSE_CACHE_BYTES, max_body: int = RESPONSE_CACHE_MAX_BODY):
+        self.max_bytes = max_bytes
+        self.max_body = max_body
+        self._entries: "OrderedDict[Tuple, Tuple[float, Recording]]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Shared GETs streamed per caller because the body was over max_body
+        self.too_large = 0
+
+    def get(self, key: Tuple) -> Optional[Recording]:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                self._discard(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key: Tuple, response: Recording, ttl: float):
+        """Cache a response unless it is a server error or too large to keep."""
+        if response.status_code >= 500 or response.size > self.max_body:
+            return
+        self._discard(key)
+        self._entries[key] = (time.monotonic() + ttl, response)
+        self._bytes += _cost(response)
+        while self._bytes > self.max_bytes and self._entries:
+            oldest = next(iter(self._entries))
+            self._discard(oldest)
+            self.evictions += 1
+
+    def _discard(self, key: Tuple):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= _cost(entry[1])
+
+    def invalidate(self, endpoint_id: int):
+        for key in [key for key in self._entries if key[0] == endpoint_id]:
+            self._discard(key)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "too_large": self.too_large,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+class SingleFlight:
+    """Share one in-flight call among concurrent callers with the same key.
+
+    The call runs as its own task, so a caller that goes away doesn't cancel
+    it for the others; every caller gets the same result or exception.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self.calls = 0
+        self.shared = 0
+
+    async def do(self, key: Hashable, call: Callable[[], Awaitable]):
+        task = self._calls.get(key)
+        if task is None:
+            self.calls += 1
+            task = self._calls[key] = asyncio.ensure_future(call())
+            task.add_done_callback(lambda done: self._finished(key, done))
+        else:
+            self.shared += 1
+        return await asyncio.shield(task)
+
+    def _finished(self, key: Hashable, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Mark the exception retrieved even if every caller has gone away
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> dict:
+        return {"in_flight": len(self._calls), "calls": self.calls, "shared": self.shared}
+
+response_cache = ResponseCache()
+single_flight = SingleFlight()
@@ -0,0 +1,305 @@
+import asyncio
+import ipaddress
+import logging
+import os
+import random
+import socket
+import struct
+from typing import Dict, List, Optional, Set, Tuple, Union
+from urllib.parse import urlparse
+
+from delays import scheduler
+from throttle import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# TCP listener configuration
+TCP_PROXY_HOST = os.getenv("TCP_PROXY_HOST", "127.0.0.1")
+TCP_PROXY_BUFFER_SIZE = int(os.getenv("TCP_PROXY_BUFFER_SIZE", str(64 * 1024)))
+TCP_PROXY_BACKLOG = int(os.getenv("TCP_PROXY_BACKLOG", "512"))
+
+# Listeners accept connections without authentication, so the ports they may
+# bind and the targets they may forward to are both allowlisted.
+# Ports and port ranges, e.g. "20000-20999,25432"
+TCP_PROXY_PORTS = os.getenv("TCP_PROXY_PORTS", "20000-29999")
+# Hostnames and IP networks, e.g. "db.internal,10.1.0.0/16"; empty allows none
+TCP_PROXY_ALLOWED_TARGETS = os.getenv("TCP_PROXY_ALLOWED_TARGETS", "")
+
+def parse_ports(spec: str) -> List[Tuple[int, int]]:
+    """Inclusive port ranges from a spec such as "20000-20999,25432"."""
+    ranges = []
+    for part in filter(None, (part.strip() for part in spec.split(","))):
+        low, _, high = part.partition("-")
+        low, high = int(low), int(high or low)
+        if not 1 <= low <= high <= 65535:
+            raise ValueError(f"invalid port range '{part}'")
+        ranges.append((low, high))
+    return ranges
+
+def parse_targets(spec: str) -> Tuple[Set[str], List[Union[ipaddress.IPv4Network, ipaddress.IPv6Network]]]:
+    """Hostnames and IP networks from a spec such as "db.internal,10.1.0.0/16"."""
+    hosts = set()
+    networks = []
+    for part in filter(None, (part.strip() for part in spec.split(","))):
+        try:
+            networks.append(ipaddress.ip_network(part, strict=False))
+        except ValueError:
+            hosts.add(part.lower())
+    return hosts, networks
+
+ALLOWED_PORTS = parse_ports(TCP_PROXY_PORTS)
+ALLOWED_HOSTS, ALLOWED_NETWORKS = parse_targets(TCP_PROXY_ALLOWED_TARGETS)
+
+def check_listen_port(port: int):
+    """Raise ValueError unless the port is in TCP_PROXY_PORTS."""
+    if not any(low <= port <= high for low, high in ALLOWED_PORTS):
+        raise ValueError(f"listen_port must be in TCP_PROXY_PORTS ({TCP_PROXY_PORTS or 'none allowed'})")
+
+def host_allowed(host: str) -> bool:
+    """Whether a target host is listed by name or is an IP address in a listed network."""
+    if host.lower() in ALLOWED_HOSTS:
+        return True
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return any(address in network for network in ALLOWED_NETWORKS)
+
+def parse_target(url: str) -> Tuple[str, int]:
+    """Host and port of a tcp://host:port URL whose host is allowlisted; raises ValueError."""
+    parsed = urlparse(url)
+    if parsed.scheme != "tcp" or not parsed.hostname or parsed.port is None:
+        raise ValueError("TCP endpoints need a url of the form tcp://host:port")
+    if not host_allowed(parsed.hostname):
+        raise ValueError(f"TCP target {parsed.hostname} is not in TCP_PROXY_ALLOWED_TARGETS")
+    return parsed.hostname, parsed.port
+
+class InjectedReset(Exception):
+    """Raised inside a connection to drop both sides with a TCP reset."""
+
+def abort(sock: socket.socket):
+    """Close with SO_LINGER 0, so the peer gets a RST instead of a FIN."""
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+    except OSError:
+        pass
+    sock.close()
+
+class TcpListener:
+    """Accepts connections on one port and forwards them to an endpoint's tcp:// target.
+
+    Bytes are moved with sock_recv_into() into one preallocated buffer per
+    direction and sent from a memoryview of it, so forwarding allocates
+    nothing per chunk. The endpoint's settings are applied as:
+
+    - latency distribution: delay before connecting upstream
+    - fail_rate: percentage of connections reset on accept
+    - chunk_delay_ms / chunk_size: delay before, and size of, each forwarded chunk
+    - bandwidth_up / bandwidth_down: bytes per second towards / from the target
+    - reset_probability: chance per chunk of resetting both sides
+    - stall_probability / stall_ms: chance per chunk of freezing the connection
+    """
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.port = endpoint.listen_port
+        self._socket: Optional[socket.socket] = None
+        self._accepting: Optional[asyncio.Task] = None
+        self._connections: Set[asyncio.Task] = set()
+        self.connections = 0
+        self.refused = 0
+        self.resets = 0
+        self.stalls = 0
+        self.bytes_up = 0
+        self.bytes_down = 0
+
+    def start(self):
+        """Bind and start accepting; raises OSError if the port is taken."""
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            listener.bind((TCP_PROXY_HOST, self.port))
+            listener.listen(TCP_PROXY_BACKLOG)
+            listener.setblocking(False)
+        except OSError:
+            listener.close()
+            raise
+        self._socket = listener
+        self._accepting = asyncio.get_running_loop().create_task(self._accept())
+
+    async def stop(self):
+        if self._accepting is not None:
+            self._accepting.cancel()
+        if self._socket is not None:
+            self._socket.close()
+        for connection in list(self._connections):
+            connection.cancel()
+        await asyncio.gather(*self._connections, return_exceptions=True)
+
+    async def _accept(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            client, _ = await loop.sock_accept(self._socket)
+            client.setblocking(False)
+            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            connection = loop.create_task(self._serve(client))
+            self._connections.add(connection)
+            connection.add_done_callback(self._connections.discard)
+
+    async def _serve(self, client: socket.socket):
+        # Settings as of accept; an update applies to new connections
+        endpoint = self.endpoint
+        loop = asyncio.get_running_loop()
+        self.connections += 1
+        upstream: Optional[socket.socket] = None
+        try:
+            delay = endpoint.latency_sampler.sample() / 1000
+            if delay > 0:
+                await scheduler.sleep(delay)
+            if random.random() < endpoint.fail_rate / 100:
+                self.refused += 1
+                raise InjectedReset()
+
+            host, port = parse_target(endpoint.url)
+            family, kind, proto, _, address = (await loop.getaddrinfo(host, port, type=socket.SOCK_STREAM))[0]
+            upstream = socket.socket(family, kind, proto)
+            upstream.setblocking(False)
+            await loop.sock_connect(upstream, address)
+            upstream.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            pumps = [
+                loop.create_task(self._pump(client, upstream, endpoint, endpoint.shaping.bandwidth_up, True)),
+                loop.create_task(self._pump(upstream, client, endpoint, endpoint.shaping.bandwidth_down, False)),
+            ]
+            try:
+                done, _ = await asyncio.wait(pumps, return_when=asyncio.FIRST_EXCEPTION)
+                for pump in done:
+                    pump.result()
+            finally:
+                for pump in pumps:
+                    pump.cancel()
+                # Let the pumps drop their fd readers before the sockets close,
+                # so they can't act on a newly accepted socket reusing the fd
+                await asyncio.gather(*pumps, return_exceptions=True)
+        except (InjectedReset, OSError):
+            abort(client)
+            if upstream is not None:
+                abort(upstream)
+            return
+        finally:
+            # Closing twice is harmless; this covers cancellation and normal ends
+            client.close()
+            if upstream is not None:
+                upstream.close()
+
+    async def _pump(self, source: socket.socket, target: socket.socket, endpoint, rate: int, up: bool):
+        """Forward one direction until the source sends EOF, then half-close the target."""
+        loop = asyncio.get_running_loop()
+        shaping = endpoint.shaping
+        # Rate-limited streams default to ~50 ms slices so bytes flow evenly
+        size = shaping.chunk_size or (min(TCP_PROXY_BUFFER_SIZE, max(rate // 20, 1)) if rate else TCP_PROXY_BUFFER_SIZE)
+        buffer = bytearray(size)
+        view = memoryview(buffer)
+        bucket = TokenBucket(rate, burst=size) if rate > 0 else None
+        while True:
+            received = await loop.sock_recv_into(source, buffer)
+            if not received:
+                try:
+                    target.shutdown(socket.SHUT_WR)
+                except OSError:
+                    pass
+                return
+            if shaping.chunk_delay_ms > 0:
+                await scheduler.sleep(shaping.chunk_delay_ms / 1000)
+            if endpoint.stall_probability and random.random() < endpoint.stall_probability:
+                self.stalls += 1
+                await scheduler.sleep(endpoint.stall_ms / 1000)
+            if endpoint.reset_probability and random.random() < endpoint.reset_probability:
+                self.resets += 1
+                raise InjectedReset()
+            if bucket is not None:
+                await bucket.consume(received)
+            await loop.sock_sendall(target, view[:received])
+            if up:
+                self.bytes_up += received
+            else:
+                self.bytes_down += received
+
+    def stats(self) -> dict:
+        return {
+            "port": self.port,
+            "target": self.endpoint.url,
+            "active": len(self._connections),
+            "connections": self.connections,
+            "refused": self.refused,
+            "resets": self.resets,
+            "stalls": self.stalls,
+            "bytes_up": self.bytes_up,
+            "bytes_down": self.bytes_down,
+        }
+
+class TcpProxies:
+    """The running TCP listeners, one per endpoint with a listen_port."""
+
+    def __init__(self):
+        self._listeners: Dict[int, TcpListener] = {}
+
+    async def apply(self, endpoint):
+        """Start, move or reconfigure an endpoint's listener.
+
+        Raises ValueError if its port or target isn't allowlisted and OSError
+        if its port can't be bound; the previous listener, if any, keeps running.
+        """
+        current = self._listeners.get(endpoint.id)
+        if endpoint.listen_port is None:
+            await self.remove(endpoint.id)
+            return
+        check_listen_port(endpoint.listen_port)
+        parse_target(endpoint.url)
+        if current is not None and current.port == endpoint.listen_port:
+            current.endpoint = endpoint
+            return
+        if any(listener.port == endpoint.listen_port for listener in self._listeners.values()):
+            raise OSError(f"Port {endpoint.listen_port} is already used by another endpoint")
+        listener = TcpListener(endpoint)
+        listener.start()
+        self._listeners[endpoint.id] = listener
+        if current is not None:
+            await current.stop()
+
+    async def remove(self, endpoint_id: int):
+        listener = self._listeners.pop(endpoint_id, None)
+        if listener is not None:
+            await listener.stop()
+
+    async def restore(self, endpoint_id: int, previous):
+        """Put an endpoint's listener back as it was in `previous` (none, if None) after its change failed."""
+        try:
+            if previous is None:
+                await self.remove(endpoint_id)
+            else:
+                await self.apply(previous)
+        except (OSError, ValueError) as e:
+            logger.error("TCP listener for endpoint %s not restored: %s", endpoint_id, e)
+
+    async def remove_collection(self, collection_id: int):
+        for endpoint_id, listener in list(self._listeners.items()):
+            if listener.endpoint.collection_id == collection_id:
+                await self.remove(endpoint_id)
+
+    async def start_all(self, endpoints):
+        """Start listeners at startup, logging endpoints whose listener can't be started."""
+        for endpoint in endpoints:
+            try:
+                await self.apply(endpoint)
+            except (OSError, ValueError) as e:
+                logger.error("TCP listener for endpoint %s not started: %s", endpoint.id, e)
+
+    async def shutdown(self):
+        for endpoint_id in list(self._listeners):
+            await self.remove(endpoint_id)
+
+    def stats(self) -> dict:
+        return {str(endpoint_id): listener.stats() for endpoint_id, listener in self._listeners.items()}
+
+tcp_proxies = TcpProxies()
@@ -0,0 +1,96 @@
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional, Set, Tuple
+
+# Cache configuration
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+# Seconds a verified token is trusted before the user is looked up again, so
+# a user disabled directly in the database loses access within this time
+TOKEN_CACHE_TTL = float(os.getenv("TOKEN_CACHE_TTL", "60"))
+
+@dataclass(frozen=True)
+class Principal:
+    """Verified identity behind a bearer token, valid until the token's exp."""
+    id: int
+    username: str
+    expires_at: float
+
+def _token_key(token: str) -> bytes:
+    return hashlib.sha256(token.encode()).digest()
+
+class TokenCache:
+    """Bounded LRU of verified tokens keyed by the token's SHA-256, so raw tokens are never kept.
+
+    Entries live until the token's exp or `ttl` seconds, whichever is first.
+    revoke_user() only reaches this process's cache; other workers notice a
+    disabled user once their entries expire.
+    """
+
+    def __init__(self, maxsize: int = TOKEN_CACHE_SIZE, ttl: float = TOKEN_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[bytes, Tuple[Principal, float]]" = OrderedDict()
+        self._keys_by_user: Dict[int, Set[bytes]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.revocations = 0
+
+    def get(self, token: str) -> Optional[Principal]:
+        key = _token_key(token)
+        entry = self._entries.get(key)
+        if entry is None or entry[1] <= time.time():
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, token: str, principal: Principal):
+        if self.ttl <= 0:
+            return
+        key = _token_key(token)
+        self._entries[key] = (principal, min(principal.expires_at, time.time() + self.ttl))
+        self._entries.move_to_end(key)
+        self._keys_by_user.setdefault(principal.id, set()).add(key)
+        while len(self._entries) > self.maxsize:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def revoke_user(self, user_id: int):
+        """Drop every cached token of a user, e.g. when the account is disabled."""
+        for key in self._keys_by_user.pop(user_id, set()):
+            if self._entries.pop(key, None) is not None:
+                self.revocations += 1
+
+    def clear(self):
+        self._entries.clear()
+        self._keys_by_user.clear()
+
+    def _remove(self, key: bytes):
+        principal, _ = self._entries.pop(key)
+        keys = self._keys_by_user.get(principal.id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_user[principal.id]
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "revocations": self.revocations,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+token_cache = TokenCache()
@@ -0,0 +1,232 @@
+import logging
+import os
+from typing import AsyncIterator, Callable, Iterable, List, Optional, Tuple
+
+import httpx
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+
+import recordings
+from metrics import ProxyTimer
+from recordings import Recording
+from throttle import Shaping
+
+# Upstream client configuration
+UPSTREAM_TIMEOUT = float(os.getenv("UPSTREAM_TIMEOUT", "10"))
+
+# Headers that only apply to a single connection and must not be forwarded
+HOP_BY_HOP_HEADERS = {
+    "connection",
+    "keep-alive",
+    "proxy-authenticate",
+    "proxy-authorization",
+    "te",
+    "trailers",
+    "transfer-encoding",
+    "upgrade",
+}
+
+# Headers the ASGI server always sets on its own responses
+SERVER_HEADERS = {"date", "server"}
+
+_DROPPED_HEADERS = HOP_BY_HOP_HEADERS | SERVER_HEADERS
+_DROPPED_REQUEST_HEADERS = HOP_BY_HOP_HEADERS | {"host"}
+
+# Methods the catch-all proxy routes forward
+PROXY_METHODS = ["GET", "POST", "PUT", "PATCH", "DELETE", "HEAD", "OPTIONS"]
+
+class InjectedDisconnect(Exception):
+    """Raised from a response body to drop the caller's connection mid-response.
+
+    ASGI has no way to abort a connection other than failing after the
+    response has started, so reset and truncation faults end this way.
+    """
+
+class DisconnectLogFilter(logging.Filter):
+    """Keep injected disconnects out of the server's error log."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return not (record.exc_info and isinstance(record.exc_info[1], InjectedDisconnect))
+
+_disconnect_log_filter = DisconnectLogFilter()
+
+# Shared async client, created on application startup
+client: Optional[httpx.AsyncClient] = None
+
+async def startup():
+    global client
+    client = httpx.AsyncClient(timeout=UPSTREAM_TIMEOUT)
+    logging.getLogger("uvicorn.error").addFilter(_disconnect_log_filter)
+
+async def shutdown():
+    global client
+    if client is not None:
+        await client.aclose()
+        client = None
+
+def get_client() -> httpx.AsyncClient:
+    if client is None:
+        raise RuntimeError("Upstream client is not started")
+    return client
+
+def request_headers(request: Request, exclude: Iterable[str] = ()) -> List[Tuple[bytes, bytes]]:
+    """Caller headers to send upstream, minus hop-by-hop and excluded ones.
+
+    Without an explicit Accept-Encoding the upstream is asked for identity,
+    so raw pass-through never hands the caller an encoding it didn't ask for.
+    """
+    dropped = _DROPPED_REQUEST_HEADERS | {name.lower() for name in exclude}
+    headers = [
+        (name, value) for name, value in request.headers.raw
+        if name.decode("latin-1") not in dropped
+    ]
+    if not any(name == b"accept-encoding" for name, _ in headers):
+        headers.append((b"accept-encoding", b"identity"))
+    return headers
+
+def request_body(request: Request) -> Optional[AsyncIterator[bytes]]:
+    """Stream the caller's body through without buffering it, if there is one."""
+    if "content-length" in request.headers or "transfer-encoding" in request.headers:
+        return request.stream()
+    return None
+
+def forward_headers(headers: httpx.Headers) -> List[Tuple[bytes, bytes]]:
+    """Raw end-to-end headers, keeping repeated headers such as set-cookie."""
+    return [
+        (name.lower(), value) for name, value in headers.raw
+        if name.lower().decode("latin-1") not in _DROPPED_HEADERS
+    ]
+
+async def stream_response(
+    request: httpx.Request,
+    shaping: Optional[Shaping] = None,
+    timer: Optional[ProxyTimer] = None,
+    truncate_after: Optional[int] = None,
+) -> StreamingResponse:
+    """Send a request upstream and stream the raw response body back chunk by chunk.
+
+    A timer is finished once the body has been sent (or the client went away).
+    With truncate_after, the connection is dropped after that many body bytes
+    (0 meaning half the Content-Length) and the timer records an injected failure.
+    """
+    shaping = shaping or Shaping()
+    response = await get_client().send(request, stream=True)
+    if timer is not None:
+        timer.mark("upstream")
+        timer.status_code = response.status_code
+    try:
+        await shaping.wait_first_byte()
+    except BaseException:
+        await response.aclose()
+        raise
+    if timer is not None:
+        timer.mark("delay")
+
+    async def close(failure: str = "none"):
+        await response.aclose()
+        if timer is not None:
+            timer.mark("body")
+            timer.finish(failure)
+
+    body = shaping.download(response.aiter_raw())
+    if truncate_after is not None:
+        limit = truncate_after or int(response.headers.get("content-length", 0)) // 2
+        body = truncated(body, limit, close)
+
+    streaming = StreamingResponse(
+        body,
+        status_code=response.status_code,
+        background=BackgroundTask(close),
+    )
+    streaming.raw_headers = forward_headers(response.headers)
+    return streaming
+
+async def fetch_buffered(request: httpx.Request, max_body: int) -> Optional[Recording]:
+    """Send a request and buffer the raw response, so it can be served to several callers.
+
+    Returns None, having stopped reading, if the body is larger than
+    max_body; the request should then be streamed instead.
+    """
+    response = await get_client().send(request, stream=True)
+    try:
+        length = response.headers.get("content-length", "")
+        if length.isdigit() and int(length) > max_body:
+            return None
+        chunks = []
+        size = 0
+        async for chunk in response.aiter_raw():
+            size += len(chunk)
+            if size > max_body:
+                return None
+            chunks.append(chunk)
+    finally:
+        await response.aclose()
+    body = b"".join(chunks)
+    return Recording(
+        status_code=response.status_code,
+        headers=forward_headers(response.headers),
+        digest="",
+        size=len(body),
+        body=body,
+    )
+
+def record_response(streaming: StreamingResponse, key: Callable[[], str]) -> StreamingResponse:
+    """Save the streamed response once its body has been sent in full."""
+    streaming.body_iterator = recordings.store.capture(
+        key, streaming.status_code, streaming.raw_headers, streaming.body_iterator
+    )
+    return streaming
+
+async def replay_response(
+    recording: Recording,
+    shaping: Optional[Shaping] = None,
+    timer: Optional[ProxyTimer] = None,
+    truncate_after: Optional[int] = None,
+    stage: str = "replay",
+) -> StreamingResponse:
+    """Serve a recorded (or buffered) response, shaped like a live one.
+
+    Time since the timer's last mark is charged to `stage`.
+    """
+    shaping = shaping or Shaping()
+    if timer is not None:
+        timer.mark(stage)
+        timer.status_code = recording.status_code
+    await shaping.wait_first_byte()
+    if timer is not None:
+        timer.mark("delay")
+
+    async def close(failure: str = "none"):
+        if timer is not None:
+            timer.mark("body")
+            timer.finish(failure)
+
+    body = shaping.download(recordings.store.body(recording))
+    if truncate_after is not None:
+        body = truncated(body, truncate_after or recording.size // 2, close)
+
+    streaming = StreamingResponse(
+        body,
+        status_code=recording.status_code,
+        background=BackgroundTask(close),
+    )
+    streaming.raw_headers = list(recording.headers)
+    return streaming
+
+async def truncated(body: AsyncIterator[bytes], limit: int, close) -> AsyncIterator[bytes]:
+    """Pass the first `limit` bytes of a body through, then drop the connection."""
+    sent = 0
+    try:
+        async for chunk in body:
+            remaining = limit - sent
+            if len(chunk) >= remaining:
+                if remaining:
+                    yield chunk[:remaining]
+                break
+            sent += len(chunk)
+            yield chunk
+    finally:
+        # The response's background task never runs once the body fails
+        await close("injected")
+    raise InjectedDisconnect(f"response truncated after {limit} bytes")
@@ -0,0 +1,232 @@
+import asyncio
+import os
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlparse
+
+import httpx
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+
+from . import recordings
+from .metrics import ProxyTimer
+from .recordings import Recording
+from .throttle import Shaping
+
+# Upstream pool configuration
+MAX_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "200"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_KEEPALIVE_CONNECTIONS", "50"))
+MAX_CONNECTIONS_PER_HOST = int(os.getenv("UPSTREAM_MAX_CONNECTIONS_PER_HOST", "50"))
+KEEPALIVE_EXPIRY = float(os.getenv("UPSTREAM_KEEPALIVE_EXPIRY", "30"))
+TIMEOUT = float(os.getenv("UPSTREAM_TIMEOUT", "10"))
+HTTP2 = os.getenv("UPSTREAM_HTTP2", "true").lower() in ("1", "true", "yes")
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# Headers that only apply to a single connection and must not be forwarded
+HOP_BY_HOP_HEADERS = {
+    "connection",
+    "keep-alive",
+    "proxy-authenticate",
+    "proxy-authorization",
+    "te",
+    "trailers",
+    "transfer-encoding",
+    "upgrade",
+}
+
+# Headers the ASGI server always sets on its own responses
+SERVER_HEADERS = {"date", "server"}
+
+_DROPPED_HEADERS = HOP_BY_HOP_HEADERS | SERVER_HEADERS
+_DROPPED_REQUEST_HEADERS = HOP_BY_HOP_HEADERS | {"host"}
+
+# Methods the catch-all proxy routes forward
+PROXY_METHODS = ["GET", "POST", "PUT", "PATCH", "DELETE", "HEAD", "OPTIONS"]
+
+# Application-lifetime client, created on startup and closed on shutdown
+_client: Optional[httpx.AsyncClient] = None
+
+class HostSlots:
+    """Concurrency limit for one upstream host, counting requests holding and waiting for a slot."""
+
+    __slots__ = ("semaphore", "in_flight", "waiting")
+
+    def __init__(self, limit: int):
+        self.semaphore = asyncio.Semaphore(limit)
+        self.in_flight = 0
+        self.waiting = 0
+
+# Per-host concurrency limits, keyed by scheme://host:port
+_host_slots: Dict[str, HostSlots] = {}
+
+async def startup():
+    global _client
+    transport = httpx.AsyncHTTPTransport(
+        limits=httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=KEEPALIVE_EXPIRY,
+        ),
+        http2=HTTP2 and HTTP2_AVAILABLE,
+    )
+    _client = httpx.AsyncClient(transport=transport, timeout=TIMEOUT)
+
+async def shutdown():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+    _client = None
+    _host_slots.clear()
+
+def get_client() -> httpx.AsyncClient:
+    if _client is None:
+        raise RuntimeError("Upstream client is not started")
+    return _client
+
+def host_key(url: str) -> str:
+    parsed = urlparse(url)
+    port = parsed.port or (443 if parsed.scheme == "https" else 80)
+    return f"{parsed.scheme}://{parsed.hostname}:{port}"
+
+@asynccontextmanager
+async def host_slot(url: str):
+    """Hold one of the per-host connection slots for the duration of a request."""
+    key = host_key(url)
+    slots = _host_slots.get(key)
+    if slots is None:
+        slots = _host_slots[key] = HostSlots(MAX_CONNECTIONS_PER_HOST)
+    slots.waiting += 1
+    try:
+        await slots.semaphore.acquire()
+    finally:
+        slots.waiting -= 1
+    slots.in_flight += 1
+    try:
+        yield
+    finally:
+        slots.in_flight -= 1
+        slots.semaphore.release()
+
+def request_headers(request: Request, exclude: Iterable[str] = ()) -> List[Tuple[bytes, bytes]]:
+    """Caller headers to send upstream, minus hop-by-hop and excluded ones.
+
+    Without an explicit Accept-Encoding the upstream is asked for identity,
+    so raw pass-through never hands the caller an encoding it didn't ask for.
+    """
+    dropped = _DROPPED_REQUEST_HEADERS | {name.lower() for name in exclude}
+    headers = [
+        (name, value) for name, value in request.headers.raw
+        if name.decode("latin-1") not in dropped
+    ]
+    if not any(name == b"accept-encoding" for name, _ in headers):
+        headers.append((b"accept-encoding", b"identity"))
+    return headers
+
+def request_body(request: Request) -> Optional[AsyncIterator[bytes]]:
+    """Stream the caller's body through without buffering it, if there is one."""
+    if "content-length" in request.headers or "transfer-encoding" in request.headers:
+        return request.stream()
+    return None
+
+def forward_headers(headers: httpx.Headers) -> List[Tuple[bytes, bytes]]:
+    """Raw end-to-end headers, keeping repeated headers such as set-cookie."""
+    return [
+        (name.lower(), value) for name, value in headers.raw
+        if name.lower().decode("latin-1") not in _DROPPED_HEADERS
+    ]
+
+async def stream_response(
+    request: httpx.Request,
+    shaping: Optional[Shaping] = None,
+    timer: Optional[ProxyTimer] = None,
+) -> StreamingResponse:
+    """Send a request upstream and stream the raw response body back chunk by chunk.
+
+    The per-host slot and the upstream connection are held until the client
+    has received the whole body (or disconnected); a timer is finished then.
+    """
+    shaping = shaping or Shaping()
+    stack = AsyncExitStack()
+    try:
+        await stack.enter_async_context(host_slot(str(request.url)))
+        response = await get_client().send(request, stream=True)
+        stack.push_async_callback(response.aclose)
+        if timer is not None:
+            timer.mark("upstream")
+            timer.status_code = response.status_code
+        await shaping.wait_first_byte()
+    except BaseException:
+        await stack.aclose()
+        raise
+    if timer is not None:
+        timer.mark("delay")
+        stack.callback(timer.finish)
+        stack.callback(timer.mark, "body")
+    streaming = StreamingResponse(
+        shaping.download(response.aiter_raw()),
+        status_code=response.status_code,
+        background=BackgroundTask(stack.aclose),
+    )
+    streaming.raw_headers = forward_headers(response.headers)
+    return streaming
+
+def record_response(streaming: StreamingResponse, key: Callable[[], str]) -> StreamingResponse:
+    """Save the streamed response once its body has been sent in full."""
+    streaming.body_iterator = recordings.store.capture(
+        key, streaming.status_code, streaming.raw_headers, streaming.body_iterator
+    )
+    return streaming
+
+async def replay_response(
+    recording: Recording,
+    shaping: Optional[Shaping] = None,
+    timer: Optional[ProxyTimer] = None,
+) -> StreamingResponse:
+    """Serve a recorded response, shaped like a live one, without contacting the upstream."""
+    shaping = shaping or Shaping()
+    if timer is not None:
+        timer.mark("replay")
+        timer.status_code = recording.status_code
+    await shaping.wait_first_byte()
+    stack = AsyncExitStack()
+    if timer is not None:
+        timer.mark("delay")
+        stack.callback(timer.finish)
+        stack.callback(timer.mark, "body")
+    streaming = StreamingResponse(
+        shaping.download(recordings.store.body(recording)),
+        status_code=recording.status_code,
+        background=BackgroundTask(stack.aclose),
+    )
+    streaming.raw_headers = list(recording.headers)
+    return streaming
+
+def pool_stats() -> dict:
+    """Report requests holding or waiting for a per-host slot, overall and per upstream host.
+
+    Connection-level detail is left out: httpx has no public API for the
+    state of its pool.
+    """
+    hosts = {
+        key: {"in_flight": slots.in_flight, "waiting": slots.waiting}
+        for key, slots in _host_slots.items()
+    }
+    return {
+        "started": _client is not None,
+        "limits": {
+            "max_connections": MAX_CONNECTIONS,
+            "max_keepalive_connections": MAX_KEEPALIVE_CONNECTIONS,
+            "max_connections_per_host": MAX_CONNECTIONS_PER_HOST,
+            "keepalive_expiry": KEEPALIVE_EXPIRY,
+        },
+        "http2": HTTP2 and HTTP2_AVAILABLE,
+        "in_flight": sum(host["in_flight"] for host in hosts.values()),
+        "waiting": sum(host["waiting"] for host in hosts.values()),
+        "hosts": hosts,
+    }
@@ -0,0 +1,164 @@
+# Shared module: keep api/latency.py and app/core/latency.py identical (make check-shared)
+import math
+import random
+from statistics import NormalDist
+from typing import Any, Dict, List, Optional, Sequence
+
+LATENCY_DISTRIBUTIONS = ("uniform", "normal", "lognormal", "pareto", "percentiles", "histogram")
+
+# Number of cells in the precomputed inverse-CDF tables
+TABLE_SIZE = 2048
+
+class LatencySampler:
+    """Draws latencies (ms) in O(1) from a precomputed inverse-CDF table.
+
+    The table holds TABLE_SIZE + 1 evenly spaced quantiles; a draw picks a
+    cell with one random number and interpolates linearly inside it.
+    """
+
+    def __init__(self, quantiles: Sequence[float]):
+        self._table = list(quantiles)
+        self._cells = len(self._table) - 1
+
+    def sample(self) -> float:
+        if self._cells == 0:
+            return self._table[0]
+        position = random.random() * self._cells
+        index = int(position)
+        low = self._table[index]
+        return low + (self._table[index + 1] - low) * (position - index)
+
+class AliasSampler:
+    """Draws latencies (ms) from weighted histogram buckets with Vose's alias method.
+
+    Draws are clamped to [low, high], like the table-based distributions.
+    """
+
+    def __init__(self, buckets: Sequence[Sequence[float]], low: float = 0.0, high: Optional[float] = None):
+        self._low = low
+        self._high = high
+        weights = [float(bucket[2]) for bucket in buckets]
+        total = sum(weights)
+        count = len(buckets)
+        self._bounds = [(float(bucket[0]), float(bucket[1])) for bucket in buckets]
+        self._probability = [0.0] * count
+        self._alias = [0] * count
+
+        scaled = [weight * count / total for weight in weights]
+        small = [index for index, value in enumerate(scaled) if value < 1.0]
+        large = [index for index, value in enumerate(scaled) if value >= 1.0]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            self._probability[less] = scaled[less]
+            self._alias[less] = more
+            scaled[more] -= 1.0 - scaled[less]
+            (small if scaled[more] < 1.0 else large).append(more)
+        for index in small + large:
+            self._probability[index] = 1.0
+
+    def sample(self) -> float:
+        position = random.random() * len(self._bounds)
+        index = int(position)
+        if position - index >= self._probability[index]:
+            index = self._alias[index]
+        low, high = self._bounds[index]
+        value = max(random.uniform(low, high), self._low)
+        return min(value, self._high) if self._high is not None else value
+
+def _probabilities() -> List[float]:
+    # Cell midpoints keep the extreme quantiles finite for unbounded distributions
+    return [(index + 0.5) / (TABLE_SIZE + 1) for index in range(TABLE_SIZE + 1)]
+
+def _clipped(values: List[float], low: float, high: Optional[float]) -> List[float]:
+    return [min(max(value, low), high) if high is not None else max(value, low) for value in values]
+
+def _param(params: Dict[str, Any], name: str, default: float) -> float:
+    value = params.get(name, default)
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"latency parameter '{name}' must be a number")
+
+def build_sampler(distribution: Optional[str], params: Optional[Dict[str, Any]], min_latency: int, max_latency: int):
+    """Compile an endpoint's latency settings into a sampler, or raise ValueError.
+
+    min_latency/max_latency bound every distribution; max_latency <= 0
+    leaves the upper end open for the heavy-tailed ones.
+    """
+    distribution = distribution or "uniform"
+    params = params or {}
+    low = float(max(min_latency, 0))
+    high = float(max_latency) if max_latency > 0 else None
+
+    if distribution == "uniform":
+        return LatencySampler([low, high if high is not None else low])
+
+    if distribution == "normal":
+        default_mean = (low + high) / 2 if high is not None else low
+        mean = _param(params, "mean", default_mean)
+        stddev = _param(params, "stddev", ((high or low) - low) / 6)
+        if stddev <= 0:
+            return LatencySampler(_clipped([mean], low, high))
+        normal = NormalDist(mean, stddev)
+        return LatencySampler(_clipped([normal.inv_cdf(p) for p in _probabilities()], low, high))
+
+    if distribution == "lognormal":
+        median = _param(params, "median", (low + high) / 2 if high is not None else max(low, 1.0))
+        sigma = _param(params, "sigma", 0.5)
+        if median <= 0 or sigma <= 0:
+            raise ValueError("lognormal requires median > 0 and sigma > 0")
+        normal = NormalDist(math.log(median), sigma)
+        return LatencySampler(_clipped([math.exp(normal.inv_cdf(p)) for p in _probabilities()], low, high))
+
+    if distribution == "pareto":
+        scale = _param(params, "scale", max(low, 1.0))
+        alpha = _param(params, "alpha", 1.5)
+        if scale <= 0 or alpha <= 0:
+            raise ValueError("pareto requires scale > 0 and alpha > 0")
+        return LatencySampler(_clipped([scale / (1 - p) ** (1 / alpha) for p in _probabilities()], low, high))
+
+    if distribution == "percentiles":
+        # Piecewise-linear inverse CDF through min, the given percentiles and max
+        knots = [(0.0, low)]
+        for name in params:
+            if not name.startswith("p"):
+                continue
+            try:
+                percentile = float(name[1:])
+            except ValueError:
+                raise ValueError(f"unknown percentile '{name}'")
+            if not 0 < percentile < 100:
+                raise ValueError(f"percentile '{name}' must be between p0 and p100")
+            knots.append((percentile / 100, _param(params, name, 0)))
+        knots.sort()
+        if len(knots) == 1:
+            raise ValueError("percentiles requires at least one of p50, p95, p99, ...")
+        knots.append((1.0, high if high is not None else knots[-1][1]))
+        if any(later[1] < earlier[1] for earlier, later in zip(knots, knots[1:])):
+            raise ValueError("percentile latencies must be non-decreasing between min_latency and max_latency")
+
+        quantiles = []
+        knot = 0
+        for index in range(TABLE_SIZE + 1):
+            p = index / TABLE_SIZE
+            while knot < len(knots) - 2 and p > knots[knot + 1][0]:
+                knot += 1
+            (p0, v0), (p1, v1) = knots[knot], knots[knot + 1]
+            quantiles.append(v0 + (v1 - v0) * (p - p0) / (p1 - p0) if p1 > p0 else v1)
+        return LatencySampler(quantiles)
+
+    if distribution == "histogram":
+        buckets = params.get("buckets")
+        if not buckets:
+            raise ValueError("histogram requires 'buckets' as [[low_ms, high_ms, weight], ...]")
+        try:
+            buckets = [[float(low_ms), float(high_ms), float(weight)] for low_ms, high_ms, weight in buckets]
+        except (TypeError, ValueError):
+            raise ValueError("histogram buckets must be [low_ms, high_ms, weight] triples")
+        if any(bucket[0] < 0 or bucket[1] < bucket[0] or bucket[2] < 0 for bucket in buckets):
+            raise ValueError("histogram buckets need 0 <= low_ms <= high_ms and weight >= 0")
+        if sum(bucket[2] for bucket in buckets) <= 0:
+            raise ValueError("histogram buckets need a positive total weight")
+        return AliasSampler(buckets, low, high)
+
+    raise ValueError("latency distribution must be one of: " + ", ".join(LATENCY_DISTRIBUTIONS))
@@ -0,0 +1,176 @@
+# Shared module: keep api/metrics.py and app/core/metrics.py identical (make check-shared)
+import os
+import time
+from bisect import bisect_left
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Label cardinality limits; values past the limit are reported as "other"
+METRICS_MAX_ENDPOINTS = int(os.getenv("METRICS_MAX_ENDPOINTS", "200"))
+METRICS_MAX_COLLECTIONS = int(os.getenv("METRICS_MAX_COLLECTIONS", "100"))
+
+# Histogram buckets in seconds, from sub-millisecond overhead up to long injected delays
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+OVERFLOW_LABEL = "other"
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+class LabelLimiter:
+    """Admit the first `limit` distinct values of a label and fold the rest into "other"."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._seen: set = set()
+
+    def __call__(self, value) -> str:
+        value = str(value)
+        if value in self._seen:
+            return value
+        if len(self._seen) >= self.limit:
+            return OVERFLOW_LABEL
+        self._seen.add(value)
+        return value
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, labels: Tuple[str, ...] = (), amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labels, value in self._values.items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+class Histogram:
+    """Fixed-bucket histogram; an observation is one bisect and two additions."""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts (last is +Inf), sum]
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, labels: Tuple[str, ...] = ()):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total) in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = _format_labels(self.labelnames, labels, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            cumulative += counts[-1]
+            le = _format_labels(self.labelnames, labels, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{le} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+# Text exposition format served by /metrics
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+registry = Registry()
+
+proxy_requests = registry.register(Counter(
+    "latencypoison_proxy_requests_total",
+    "Proxied requests by endpoint, collection, failure source and upstream status class.",
+    ("endpoint", "collection", "failure", "status_class"),
+))
+proxy_duration = registry.register(Histogram(
+    "latencypoison_proxy_request_duration_seconds",
+    "Wall time of proxied requests, including injected delay and body transfer.",
+    ("endpoint", "collection"),
+))
+proxy_stage_duration = registry.register(Histogram(
+    "latencypoison_proxy_stage_duration_seconds",
+    "Time spent in each stage of a proxied request.",
+    ("stage",),
+))
+
+endpoint_label = LabelLimiter(METRICS_MAX_ENDPOINTS)
+collection_label = LabelLimiter(METRICS_MAX_COLLECTIONS)
+
+def observe_stage(stage: str, seconds: float):
+    proxy_stage_duration.observe(seconds, (stage,))
+
+def status_class(status_code: Optional[int]) -> str:
+    return f"{status_code // 100}xx" if status_code else "none"
+
+class ProxyTimer:
+    """Per-request stage clock for the proxy hot path.
+
+    mark(stage) charges the time since the previous mark to `stage`; the
+    stages, overall duration and request counter are recorded once, on
+    finish(). failure is "none", "injected" (simulated by the proxy),
+    "upstream" (transport error or 5xx from the upstream) or "proxy"
+    (rejected before reaching the upstream, e.g. unknown endpoint).
+    """
+
+    __slots__ = ("started", "last", "stages", "endpoint", "collection", "status_code", "finished")
+
+    def __init__(self):
+        self.started = self.last = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.endpoint = ""
+        self.collection = ""
+        self.status_code: Optional[int] = None
+        self.finished = False
+
+    def label(self, endpoint, collection=""):
+        self.endpoint = endpoint_label(endpoint)
+        self.collection = collection_label(collection) if collection != "" else ""
+
+    def mark(self, stage: str):
+        now = time.perf_counter()
+        self.stages[stage] = self.stages.get(stage, 0.0) + now - self.last
+        self.last = now
+
+    def finish(self, failure: str = "none"):
+        if self.finished:
+            return
+        self.finished = True
+        if failure == "none" and self.status_code is not None and self.status_code >= 500:
+            failure = "upstream"
+        for stage, seconds in self.stages.items():
+            proxy_stage_duration.observe(seconds, (stage,))
+        proxy_duration.observe(time.perf_counter() - self.started, (self.endpoint, self.collection))
+        proxy_requests.inc((self.endpoint, self.collection, failure, status_class(self.status_code)))
@@ -0,0 +1,113 @@
+import math
+import os
+import time
+from typing import Callable, Dict, List, Optional, Sequence
+
+from .metrics import DEFAULT_BUCKETS
+
+# Limits on a single batch probe
+PROBE_MAX_SAMPLES = int(os.getenv("PROBE_MAX_SAMPLES", "1000"))
+PROBE_MAX_CONCURRENCY = int(os.getenv("PROBE_MAX_CONCURRENCY", "50"))
+# Probes one user may have running at once (per worker)
+PROBE_MAX_PER_USER = int(os.getenv("PROBE_MAX_PER_USER", "1"))
+# Seconds between progress snapshots streamed to the caller
+PROBE_PROGRESS_INTERVAL = float(os.getenv("PROBE_PROGRESS_INTERVAL", "0.25"))
+
+# Histogram bucket upper bounds in milliseconds, matching the /metrics buckets
+HISTOGRAM_BUCKETS_MS = tuple(bound * 1000 for bound in DEFAULT_BUCKETS)
+
+PERCENTILES = (50, 90, 95, 99)
+
+def percentile(ordered: Sequence[float], p: float) -> float:
+    """Nearest-rank percentile of an already sorted sequence."""
+    if not ordered:
+        return 0.0
+    rank = max(1, math.ceil(p / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    ordered = sorted(values)
+    summary = {f"p{p}": round(percentile(ordered, p), 3) for p in PERCENTILES}
+    summary["min"] = round(ordered[0], 3) if ordered else 0.0
+    summary["max"] = round(ordered[-1], 3) if ordered else 0.0
+    summary["mean"] = round(sum(ordered) / len(ordered), 3) if ordered else 0.0
+    return summary
+
+class ProbeSlots:
+    """Running probes per user, so one account can't start an unbounded number of them."""
+
+    def __init__(self, per_user: int = PROBE_MAX_PER_USER):
+        self.per_user = per_user
+        self._running: Dict[str, int] = {}
+
+    def acquire(self, user: str) -> Optional[Callable[[], None]]:
+        """Take a slot for the user; returns a release function that is safe to call twice, or None."""
+        running = self._running.get(user, 0)
+        if running >= self.per_user:
+            return None
+        self._running[user] = running + 1
+        released = False
+
+        def release():
+            nonlocal released
+            if not released:
+                released = True
+                self._release(user)
+        return release
+
+    def _release(self, user: str):
+        running = self._running.get(user, 0) - 1
+        if running > 0:
+            self._running[user] = running
+        else:
+            self._running.pop(user, None)
+
+probe_slots = ProbeSlots()
+
+class ProbeStats:
+    """Samples of a batch probe: injected and observed latency plus each outcome.
+
+    Outcomes are an upstream status class ("2xx"...), "sandbox", "injected"
+    for simulated failures, or "timeout"/"connection" for transport errors.
+    """
+
+    def __init__(self, total: int):
+        self.total = total
+        self.started = time.perf_counter()
+        self.injected: List[float] = []
+        self.observed: List[float] = []
+        self.outcomes: Dict[str, int] = {}
+        self.histogram = [0] * (len(HISTOGRAM_BUCKETS_MS) + 1)
+
+    def add(self, injected_ms: float, observed_ms: float, outcome: str):
+        self.injected.append(injected_ms)
+        self.observed.append(observed_ms)
+        self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+        for index, bound in enumerate(HISTOGRAM_BUCKETS_MS):
+            if observed_ms <= bound:
+                self.histogram[index] += 1
+                break
+        else:
+            self.histogram[-1] += 1
+
+    def snapshot(self, done: bool = False) -> dict:
+        completed = len(self.observed)
+        elapsed = time.perf_counter() - self.started
+        return {
+            "done": done,
+            "completed": completed,
+            "total": self.total,
+            "elapsed_ms": round(elapsed * 1000, 1),
+            "throughput_rps": round(completed / elapsed, 1) if elapsed > 0 else 0.0,
+            "outcomes": dict(self.outcomes),
+            "latency_ms": {
+                "observed": summarize(self.observed),
+                "injected": summarize(self.injected),
+                # What the proxy and upstream added on top of the injected delay
+                "overhead": summarize([observed - injected for observed, injected in zip(self.observed, self.injected)]),
+            },
+            "histogram": [
+                {"le": bound, "count": count}
+                for bound, count in zip(HISTOGRAM_BUCKETS_MS + (None,), self.histogram)
+            ],
+        }
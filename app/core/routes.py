@@ -0,0 +1,171 @@
+from typing import Callable, Dict, Generic, Iterable, Optional, Tuple, TypeVar
+
+Value = TypeVar("Value")
+
+def split_path(path: str) -> Tuple[str, ...]:
+    return tuple(segment for segment in path.split("/") if segment)
+
+def is_param(segment: str) -> bool:
+    """`{name}` segments match any single path segment."""
+    return segment.startswith("{") and segment.endswith("}")
+
+def route_key(path: str) -> Tuple[str, ...]:
+    """Segments of a path with parameter names blanked: paths with equal keys share a route."""
+    return tuple("{}" if is_param(segment) else segment for segment in split_path(path))
+
+class _Node(Generic[Value]):
+    __slots__ = ("prefix", "children", "param", "value")
+
+    def __init__(self, prefix: Tuple[str, ...] = ()):
+        # Static segments on the edge leading into this node
+        self.prefix = prefix
+        # First segment of each child's prefix -> child
+        self.children: Dict[str, "_Node[Value]"] = {}
+        self.param: Optional["_Node[Value]"] = None
+        self.value: Optional[Value] = None
+
+    def is_empty(self) -> bool:
+        return self.value is None and not self.children and self.param is None
+
+class RouteTable(Generic[Value]):
+    """Radix tree over path segments.
+
+    Runs of static segments share one edge, and `{name}` segments branch to a
+    single parameter child. Static routes win over parameters, so a lookup
+    only backtracks at parameter branches and costs O(path length) otherwise.
+    """
+
+    def __init__(self):
+        self._root: _Node[Value] = _Node()
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def insert(self, path: str, value: Value):
+        segments = split_path(path)
+        node = self._root
+        i = 0
+        while i < len(segments):
+            segment = segments[i]
+            if is_param(segment):
+                if node.param is None:
+                    node.param = _Node()
+                node = node.param
+                i += 1
+                continue
+
+            child = node.children.get(segment)
+            if child is None:
+                end = i
+                while end < len(segments) and not is_param(segments[end]):
+                    end += 1
+                child = node.children[segment] = _Node(segments[i:end])
+                node = child
+                i = end
+                continue
+
+            common = 0
+            while common < len(child.prefix) and i + common < len(segments) and child.prefix[common] == segments[i + common]:
+                common += 1
+            if common < len(child.prefix):
+                # Split the edge where the new path diverges
+                middle = _Node(child.prefix[:common])
+                child.prefix = child.prefix[common:]
+                middle.children[child.prefix[0]] = child
+                node.children[segment] = middle
+                child = middle
+            node = child
+            i += common
+
+        if node.value is None:
+            self._size += 1
+        node.value = value
+
+    def remove(self, path: str, match: Optional[Callable[[Value], bool]] = None) -> Optional[Value]:
+        """Remove the route at `path`, only if `match` (when given) accepts its value."""
+        segments = split_path(path)
+        trail = [self._root]
+        node = self._root
+        i = 0
+        while i < len(segments):
+            if is_param(segments[i]):
+                node = node.param
+                i += 1
+            else:
+                node = node.children.get(segments[i])
+                if node is not None:
+                    if segments[i:i + len(node.prefix)] != node.prefix:
+                        return None
+                    i += len(node.prefix)
+            if node is None:
+                return None
+            trail.append(node)
+        value = node.value
+        if value is None or (match is not None and not match(value)):
+            return None
+        node.value = None
+        self._size -= 1
+
+        # Drop nodes left with nothing under them
+        for parent, child in zip(reversed(trail[:-1]), reversed(trail[1:])):
+            if not child.is_empty():
+                break
+            if parent.param is child:
+                parent.param = None
+            else:
+                del parent.children[child.prefix[0]]
+        return value
+
+    def lookup(self, path: str) -> Optional[Value]:
+        return self._lookup(self._root, split_path(path), 0)
+
+    def _lookup(self, node: _Node[Value], segments: Tuple[str, ...], i: int) -> Optional[Value]:
+        if i == len(segments):
+            return node.value
+        child = node.children.get(segments[i])
+        if child is not None and segments[i:i + len(child.prefix)] == child.prefix:
+            value = self._lookup(child, segments, i + len(child.prefix))
+            if value is not None:
+                return value
+        if node.param is not None:
+            return self._lookup(node.param, segments, i + 1)
+        return None
+
+class RouteTables(Generic[Value]):
+    """One route table per collection, built on first use and then kept up to date.
+
+    `load` returns a collection's (path, value) pairs; afterwards callers
+    report every change through add() and remove() rather than rebuilding.
+    `refresh`, if given, runs before each get() so the source can report
+    changes made elsewhere first.
+    """
+
+    def __init__(self, load: Callable[[str], Iterable[Tuple[str, Value]]], refresh: Optional[Callable[[], None]] = None):
+        self._load = load
+        self._refresh = refresh
+        self._tables: Dict[str, RouteTable[Value]] = {}
+
+    def get(self, collection_id: str) -> RouteTable[Value]:
+        if self._refresh is not None:
+            self._refresh()
+        table = self._tables.get(collection_id)
+        if table is None:
+            table = self._tables[collection_id] = RouteTable()
+            for path, value in self._load(collection_id):
+                table.insert(path, value)
+        return table
+
+    def add(self, collection_id: str, path: str, value: Value):
+        # Tables not built yet will pick the route up when they are loaded
+        table = self._tables.get(collection_id)
+        if table is not None:
+            table.insert(path, value)
+
+    def remove(self, collection_id: str, path: str, match: Optional[Callable[[Value], bool]] = None):
+        table = self._tables.get(collection_id)
+        if table is not None:
+            table.remove(path, match)
+
+    def drop(self, collection_id: str):
+        self._tables.pop(collection_id, None)
@@ -0,0 +1,326 @@
+import fcntl
+import json
+import mmap
+import os
+import sqlite3
+import struct
+from typing import Any, Callable, Dict, Generic, Iterable, List, Optional, Tuple, Type, TypeVar
+
+from pydantic import BaseModel
+
+# Storage backend for users, collections and endpoints: "memory", "sqlite" or "shared"
+APP_STORE = os.getenv("APP_STORE", "memory")
+APP_STORE_PATH = os.getenv("APP_STORE_PATH", "latencypoison-app.db")
+# Changes kept in the shared store's log; a worker further behind reloads everything
+APP_STORE_CHANGE_LOG = int(os.getenv("APP_STORE_CHANGE_LOG", "10000"))
+
+Record = TypeVar("Record", bound=BaseModel)
+
+class Store(Generic[Record]):
+    """Records keyed by id, with secondary indexes on a fixed set of fields.
+
+    Callers that change a record in place must put() it back so the
+    backend and its indexes see the change.
+    """
+
+    def __init__(self, name: str, model: Type[Record], indexes: Iterable[str] = ()):
+        self.name = name
+        self.model = model
+        self.indexes = tuple(indexes)
+        self._listeners: List[Callable[[Optional[Record], Optional[Record]], None]] = []
+
+    def subscribe(self, listener: Callable[[Optional[Record], Optional[Record]], None]):
+        """Call `listener(old, new)` for records changed by other processes.
+
+        Only the shared backend sees such changes; in-process writes are
+        the caller's own business.
+        """
+        self._listeners.append(listener)
+
+    def refresh(self):
+        """Pick up changes made by other processes; only the shared backend has any to pick up."""
+
+    def get(self, record_id: str) -> Optional[Record]:
+        raise NotImplementedError
+
+    def put(self, record: Record) -> Record:
+        raise NotImplementedError
+
+    def delete(self, record_id: str) -> Optional[Record]:
+        raise NotImplementedError
+
+    def find(self, field: str, value: Any) -> List[Record]:
+        """Records whose indexed `field` equals `value`, in insertion order."""
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def _check_index(self, field: str):
+        if field not in self.indexes:
+            raise KeyError(f"{self.name} has no index on {field}")
+
+class MemoryStore(Store[Record]):
+    def __init__(self, name: str, model: Type[Record], indexes: Iterable[str] = ()):
+        super().__init__(name, model, indexes)
+        self._records: Dict[str, Record] = {}
+        # field -> value -> ids; dicts as ordered sets keep listings in insertion order
+        self._index: Dict[str, Dict[Any, Dict[str, None]]] = {field: {} for field in self.indexes}
+        # Indexed values as of the last put, so in-place changes can be unindexed
+        self._indexed: Dict[str, Tuple[Any, ...]] = {}
+
+    def get(self, record_id: str) -> Optional[Record]:
+        return self._records.get(record_id)
+
+    def put(self, record: Record) -> Record:
+        self._unindex(record.id)
+        self._records[record.id] = record
+        values = tuple(getattr(record, field) for field in self.indexes)
+        for field, value in zip(self.indexes, values):
+            self._index[field].setdefault(value, {})[record.id] = None
+        self._indexed[record.id] = values
+        return record
+
+    def delete(self, record_id: str) -> Optional[Record]:
+        self._unindex(record_id)
+        return self._records.pop(record_id, None)
+
+    def find(self, field: str, value: Any) -> List[Record]:
+        self._check_index(field)
+        return [self._records[record_id] for record_id in self._index[field].get(value, ())]
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def _unindex(self, record_id: str):
+        values = self._indexed.pop(record_id, None)
+        if values is None:
+            return
+        for field, value in zip(self.indexes, values):
+            ids = self._index[field].get(value)
+            if ids is not None:
+                ids.pop(record_id, None)
+                if not ids:
+                    del self._index[field][value]
+
+class SQLiteStore(Store[Record]):
+    """Records as JSON rows, with indexed fields mirrored into their own columns.
+
+    Several worker processes can share one database file.
+    """
+
+    def __init__(self, name: str, model: Type[Record], indexes: Iterable[str] = (), path: str = APP_STORE_PATH):
+        super().__init__(name, model, indexes)
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute("PRAGMA busy_timeout=5000")
+        columns = "".join(f", {field} TEXT" for field in self.indexes)
+        self._connection.execute(
+            f"CREATE TABLE IF NOT EXISTS {name} (seq INTEGER PRIMARY KEY, id TEXT UNIQUE NOT NULL, data TEXT NOT NULL{columns})"
+        )
+        for field in self.indexes:
+            self._connection.execute(f"CREATE INDEX IF NOT EXISTS ix_{name}_{field} ON {name} ({field}, seq)")
+        names = "".join(f", {field}" for field in self.indexes)
+        placeholders = ", ".join("?" for _ in range(len(self.indexes) + 2))
+        updates = "".join(f", {field} = excluded.{field}" for field in self.indexes)
+        self._upsert = (
+            f"INSERT INTO {name} (id, data{names}) VALUES ({placeholders}) "
+            f"ON CONFLICT (id) DO UPDATE SET data = excluded.data{updates}"
+        )
+
+    def _load(self, data: str) -> Record:
+        return self.model(**json.loads(data))
+
+    def get(self, record_id: str) -> Optional[Record]:
+        row = self._connection.execute(f"SELECT data FROM {self.name} WHERE id = ?", (record_id,)).fetchone()
+        return self._load(row[0]) if row else None
+
+    def put(self, record: Record) -> Record:
+        values = [getattr(record, field) for field in self.indexes]
+        self._connection.execute(self._upsert, (record.id, json.dumps(record.dict()), *values))
+        return record
+
+    def delete(self, record_id: str) -> Optional[Record]:
+        row = self._connection.execute(
+            f"DELETE FROM {self.name} WHERE id = ? RETURNING data", (record_id,)
+        ).fetchall()
+        return self._load(row[0][0]) if row else None
+
+    def find(self, field: str, value: Any) -> List[Record]:
+        self._check_index(field)
+        rows = self._connection.execute(
+            f"SELECT data FROM {self.name} WHERE {field} = ? ORDER BY seq", (value,)
+        ).fetchall()
+        return [self._load(data) for data, in rows]
+
+    def __len__(self) -> int:
+        return self._connection.execute(f"SELECT COUNT(*) FROM {self.name}").fetchone()[0]
+
+class _Transaction:
+    def __init__(self, connection: sqlite3.Connection, begin: str):
+        self._connection = connection
+        self._begin = begin
+
+    def __enter__(self):
+        self._connection.execute(self._begin)
+
+    def __exit__(self, exc_type, exc, traceback):
+        self._connection.execute("ROLLBACK" if exc_type else "COMMIT")
+
+class Generation:
+    """Change counter in a small memory-mapped file, shared by every process using the store.
+
+    Readers compare it with the value they last saw, which costs a memory
+    read rather than a query; writers bump it after each commit.
+    """
+
+    def __init__(self, path: str):
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        if os.fstat(self._fd).st_size < 8:
+            os.ftruncate(self._fd, 8)
+        self._map = mmap.mmap(self._fd, 8)
+
+    def value(self) -> int:
+        return struct.unpack_from("<Q", self._map)[0]
+
+    def bump(self) -> int:
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            value = self.value() + 1
+            struct.pack_into("<Q", self._map, 0, value)
+            return value
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+_generations: Dict[str, Generation] = {}
+
+def shared_generation(path: str) -> Generation:
+    generation = _generations.get(path)
+    if generation is None:
+        generation = _generations[path] = Generation(path + "-generation")
+    return generation
+
+class SharedStore(MemoryStore[Record]):
+    """SQLite-backed store with a local in-memory copy, for running several workers.
+
+    Reads are served from the local copy. Writes go to SQLite together with
+    an entry in a change log, then bump a shared generation counter; on its
+    next read each worker sees the new generation and applies the logged
+    changes, so a write is visible to every worker as soon as it returns.
+    """
+
+    def __init__(self, name: str, model: Type[Record], indexes: Iterable[str] = (), path: str = APP_STORE_PATH):
+        super().__init__(name, model, indexes)
+        self._db = SQLiteStore(name, model, indexes, path)
+        self._connection = self._db._connection
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS changes (seq INTEGER PRIMARY KEY AUTOINCREMENT, store TEXT NOT NULL, id TEXT NOT NULL)"
+        )
+        self._generation = shared_generation(path)
+        self._seen = self._generation.value()
+        self._seq = 0
+        self._reload()
+
+    def _reload(self):
+        """Replace the local copy with the database's contents."""
+        with self._read():
+            self._seq = self._last_seq()
+            rows = self._connection.execute(f"SELECT data FROM {self.name} ORDER BY seq").fetchall()
+        old = dict(self._records)
+        for record_id in old:
+            super().delete(record_id)
+        for data, in rows:
+            super().put(self._db._load(data))
+        for record_id in old.keys() | self._records.keys():
+            self._notify(old.get(record_id), self._records.get(record_id))
+
+    def _notify(self, old: Optional[Record], new: Optional[Record]):
+        for listener in self._listeners:
+            listener(old, new)
+
+    def refresh(self):
+        generation = self._generation.value()
+        if generation == self._seen:
+            return
+        # Taken before reading, so a write that lands meanwhile triggers another sync
+        self._seen = generation
+        with self._read():
+            first = self._connection.execute("SELECT MIN(seq) FROM changes").fetchone()[0]
+            if first is not None and first > self._seq + 1:
+                # Changes we never saw have been pruned from the log
+                behind = True
+            else:
+                behind = False
+                changed = self._connection.execute(
+                    "SELECT DISTINCT id FROM changes WHERE store = ? AND seq > ?", (self.name, self._seq)
+                ).fetchall()
+                updates = [(record_id, self._db.get(record_id)) for record_id, in changed]
+                self._seq = self._last_seq()
+        if behind:
+            self._reload()
+            return
+        for record_id, record in updates:
+            old = self._records.get(record_id)
+            if record is None:
+                super().delete(record_id)
+            else:
+                super().put(record)
+            self._notify(old, record)
+
+    def _read(self):
+        # One read transaction, so the log and the rows come from the same snapshot
+        return _Transaction(self._connection, "BEGIN")
+
+    def _last_seq(self) -> int:
+        return self._connection.execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()[0]
+
+    def _write(self, record_id: str, write: Callable[[], Any]):
+        with _Transaction(self._connection, "BEGIN IMMEDIATE"):
+            result = write()
+            seq = self._connection.execute(
+                "INSERT INTO changes (store, id) VALUES (?, ?)", (self.name, record_id)
+            ).lastrowid
+            if seq % 1000 == 0:
+                self._connection.execute("DELETE FROM changes WHERE seq <= ?", (seq - APP_STORE_CHANGE_LOG,))
+        # Nobody else wrote since our last sync: our own change needs no replaying
+        if seq == self._seq + 1:
+            self._seq = seq
+        generation = self._generation.bump()
+        if generation == self._seen + 1:
+            self._seen = generation
+        return result
+
+    def get(self, record_id: str) -> Optional[Record]:
+        self.refresh()
+        return super().get(record_id)
+
+    def put(self, record: Record) -> Record:
+        self.refresh()
+        self._write(record.id, lambda: self._db.put(record))
+        return super().put(record)
+
+    def delete(self, record_id: str) -> Optional[Record]:
+        self.refresh()
+        self._write(record_id, lambda: self._db.delete(record_id))
+        return super().delete(record_id)
+
+    def find(self, field: str, value: Any) -> List[Record]:
+        self.refresh()
+        return super().find(field, value)
+
+    def __len__(self) -> int:
+        self.refresh()
+        return super().__len__()
+
+STORE_BACKENDS = {
+    "memory": MemoryStore,
+    "sqlite": SQLiteStore,
+    "shared": SharedStore,
+}
+
+def create_store(name: str, model: Type[Record], indexes: Iterable[str] = ()) -> Store[Record]:
+    """Create a store on the backend selected by APP_STORE."""
+    if APP_STORE not in STORE_BACKENDS:
+        raise ValueError("APP_STORE must be one of: " + ", ".join(STORE_BACKENDS))
+    return STORE_BACKENDS[APP_STORE](name, model, indexes)
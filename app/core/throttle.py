@@ -0,0 +1,75 @@
+# Shared module: keep api/throttle.py and app/core/throttle.py identical (make check-shared)
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import AsyncIterator, Optional
+
+class TokenBucket:
+    """Byte-rate limiter driven by the event loop's timers.
+
+    consume() takes budget immediately and, when the bucket runs into debt,
+    sleeps just long enough for the debt to refill. No threads are involved,
+    so thousands of throttled connections cost one timer each.
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = float(rate)
+        self.capacity = float(burst if burst is not None else max(rate / 10, 1))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    async def consume(self, amount: int):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= amount
+        if self.tokens < 0:
+            await asyncio.sleep(-self.tokens / self.rate)
+
+@dataclass(frozen=True)
+class Shaping:
+    """Link shaping for one proxied exchange; zero means unlimited / no delay.
+
+    bandwidth_down/bandwidth_up are bytes per second per connection,
+    ttfb_ms delays the response headers once upstream has answered,
+    chunk_size re-chunks bodies and chunk_delay_ms waits before each chunk
+    (a small chunk_size with a long delay gives a slowloris-style trickle).
+    """
+    bandwidth_down: int = 0
+    bandwidth_up: int = 0
+    ttfb_ms: int = 0
+    chunk_delay_ms: int = 0
+    chunk_size: int = 0
+
+    @property
+    def shapes_body(self) -> bool:
+        return bool(self.bandwidth_down or self.chunk_delay_ms or self.chunk_size)
+
+    async def wait_first_byte(self):
+        if self.ttfb_ms > 0:
+            await asyncio.sleep(self.ttfb_ms / 1000)
+
+    def download(self, chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+        if not self.shapes_body:
+            return chunks
+        return throttled(chunks, self.bandwidth_down, self.chunk_size, self.chunk_delay_ms)
+
+    def upload(self, chunks: Optional[AsyncIterator[bytes]]) -> Optional[AsyncIterator[bytes]]:
+        if chunks is None or not self.bandwidth_up:
+            return chunks
+        return throttled(chunks, self.bandwidth_up)
+
+async def throttled(chunks: AsyncIterator[bytes], rate: int = 0, chunk_size: int = 0, chunk_delay_ms: int = 0) -> AsyncIterator[bytes]:
+    """Re-emit a byte stream at most `rate` bytes/s, in `chunk_size` pieces, `chunk_delay_ms` apart."""
+    bucket = TokenBucket(rate, burst=chunk_size or None) if rate > 0 else None
+    async for chunk in chunks:
+        view = memoryview(chunk)
+        # Rate-limited streams default to ~50 ms slices so bytes flow evenly
+        step = chunk_size or (max(rate // 20, 1) if rate else len(view)) or 1
+        for start in range(0, len(view), step):
+            piece = view[start:start + step]
+            if chunk_delay_ms > 0:
+                await asyncio.sleep(chunk_delay_ms / 1000)
+            if bucket is not None:
+                await bucket.consume(len(piece))
+            yield bytes(piece)
@@ -1,6 +1,7 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from .routers import auth, proxy, collections, endpoints
+from .routers import auth, proxy, collections, endpoints, metrics
+from .core import http_client
 
 app = FastAPI(title="LatencyPoison", description="Network Chaos Proxy")
 
@@ -13,11 +14,20 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+async def startup_event():
+    await http_client.startup()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await http_client.shutdown()
+
 # Include routers
 app.include_router(auth.router)
 app.include_router(proxy.router)
 app.include_router(collections.router)
 app.include_router(endpoints.router)
+app.include_router(metrics.router)
 
 @app.get("/")
 async def root():
@@ -26,6 +36,11 @@ async def root():
         "description": "Network Chaos Proxy",
         "endpoints": {
             "/proxy": "Forward requests with configurable latency and failure rate",
+            "/proxy/probe": "Send a batch of proxied requests and stream latency statistics",
+            "/proxy/pool": "Upstream connection pool statistics",
+            "/proxy/delays": "Delay scheduler statistics",
+            "/c/{collection_id}/{path}": "Forward to a collection's base URL with its endpoints' settings",
+            "/metrics": "Prometheus metrics",
             "/api/auth": "Authentication endpoints",
             "/api/collections": "Collections endpoints",
             "/api/endpoints": "Endpoints endpoints",
@@ -6,35 +6,33 @@ from ..core.security import (
     create_access_token,
     get_current_user
 )
-from ..schemas.user import UserCreate, User, Token, TokenData
+from ..core.store import create_store
+from ..schemas.user import UserCreate, User, UserRecord, Token, TokenData
 import jwt
 from datetime import timedelta
 
 router = APIRouter(prefix="/api/auth", tags=["auth"])
 
-# Demo account
-DEMO_USER = {
-    "username": "demo",
-    "email": "demo@example.com",
-    "hashed_password": get_password_hash("demo123"),
-}
+# Accounts, keyed by email
+users = create_store("users", UserRecord)
 
-# In-memory user storage (replace with database in production)
-users = {
-    DEMO_USER["email"]: DEMO_USER
-}
+# Demo account
+DEMO_EMAIL = "demo@example.com"
+if users.get(DEMO_EMAIL) is None:
+    users.put(UserRecord(id=DEMO_EMAIL, username="demo", email=DEMO_EMAIL, hashed_password=get_password_hash("demo123")))
 
 @router.post("/register", response_model=Token)
 async def register(user: UserCreate):
-    if user.email in users:
+    if users.get(user.email) is not None:
         raise HTTPException(status_code=400, detail="Email already registered")
     
     hashed_password = get_password_hash(user.password)
-    users[user.email] = {
-        "username": user.username,
-        "email": user.email,
-        "hashed_password": hashed_password,
-    }
+    users.put(UserRecord(
+        id=user.email,
+        username=user.username,
+        email=user.email,
+        hashed_password=hashed_password,
+    ))
     
     access_token = create_access_token({"sub": user.email})
     return {"access_token": access_token, "token_type": "bearer"}
@@ -42,10 +40,10 @@ async def register(user: UserCreate):
 @router.post("/login", response_model=Token)
 async def login(email: str = Form(...), password: str = Form(...)):
     user = users.get(email)
-    if not user or not verify_password(password, user["hashed_password"]):
+    if not user or not verify_password(password, user.hashed_password):
         raise HTTPException(status_code=400, detail="Incorrect email or password")
     
-    access_token = create_access_token({"sub": user["email"]})
+    access_token = create_access_token({"sub": user.email})
     return {"access_token": access_token, "token_type": "bearer"}
 
 @router.get("/me", response_model=User)
@@ -54,7 +52,7 @@ async def read_users_me(current_user: TokenData = Depends(get_current_user)):
     if user is None:
         raise HTTPException(status_code=404, detail="User not found")
     
-    return {"username": user["username"], "email": user["email"]}
+    return {"username": user.username, "email": user.email}
 
 @router.get("/test-token")
 async def test_token(request: Request):
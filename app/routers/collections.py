@@ -1,5 +1,7 @@
 from fastapi import APIRouter, HTTPException, Depends
 from ..core.security import get_current_user
+from ..core.store import create_store
+from .endpoints import routes
 from ..schemas.collection import Collection, CollectionCreate, CollectionUpdate
 from ..schemas.user import TokenData
 import uuid
@@ -11,8 +13,15 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/collections", tags=["collections"])
 
-# In-memory storage for collections (replace with database in production)
-collections = {}
+# Collections, indexed by owner
+collections = create_store("collections", Collection, indexes=("user_email",))
+
+def collection_changed(old, new):
+    # Deleted by another worker
+    if old is not None and new is None:
+        routes.drop(old.id)
+
+collections.subscribe(collection_changed)
 
 @router.post("/", response_model=Collection)
 async def create_collection(
@@ -31,7 +40,7 @@ async def create_collection(
             user_email=current_user.email,
             endpoints=[]
         )
-        collections[collection_id] = new_collection
+        collections.put(new_collection)
         return new_collection
     except Exception as e:
         logger.error(f"Error creating collection: {str(e)}")
@@ -41,11 +50,7 @@ async def create_collection(
 async def get_collections(current_user: TokenData = Depends(get_current_user)):
     try:
         logger.info(f"Getting collections for user: {current_user.email}")
-        user_collections = [
-            collection for collection in collections.values()
-            if collection.user_email == current_user.email
-        ]
-        return user_collections
+        return collections.find("user_email", current_user.email)
     except Exception as e:
         logger.error(f"Error getting collections: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -85,8 +90,14 @@ async def update_collection(
         
         if collection_update.name is not None:
             collection.name = collection_update.name
+        if collection_update.base_url is not None:
+            collection.base_url = collection_update.base_url
+        if collection_update.default_latency_ms is not None:
+            collection.default_latency_ms = collection_update.default_latency_ms
+        if collection_update.default_fail_rate is not None:
+            collection.default_fail_rate = collection_update.default_fail_rate
         
-        collections[collection_id] = collection
+        collections.put(collection)
         return collection
     except HTTPException:
         raise
@@ -107,7 +118,8 @@ async def delete_collection(
         if collection.user_email != current_user.email:
             raise HTTPException(status_code=403, detail="Not authorized to delete this collection")
         
-        del collections[collection_id]
+        collections.delete(collection_id)
+        routes.drop(collection_id)
         return {"message": "Collection deleted successfully"}
     except HTTPException:
         raise
@@ -1,7 +1,10 @@
 from fastapi import APIRouter, HTTPException, Depends
 from ..core.security import get_current_user
+from ..core.routes import RouteTables, route_key
+from ..core.store import create_store
 from ..schemas.endpoint import Endpoint, EndpointCreate, EndpointUpdate
 from ..schemas.user import TokenData
+from typing import Optional
 import uuid
 import logging
 
@@ -11,8 +14,28 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/endpoints", tags=["endpoints"])
 
-# In-memory storage for endpoints (replace with database in production)
-endpoints = {}
+# Endpoints, indexed by collection
+endpoints = create_store("endpoints", Endpoint, indexes=("collection_id",))
+
+# Per-collection route tables for /c/{collection_id}/{path}, updated as endpoints change
+routes = RouteTables(lambda collection_id: (
+    (endpoint.path, endpoint) for endpoint in endpoints.find("collection_id", collection_id)
+), refresh=endpoints.refresh)
+
+def endpoint_changed(old, new):
+    # Changed by another worker: rebuild the affected tables on next use
+    for endpoint in (old, new):
+        if endpoint is not None:
+            routes.drop(endpoint.collection_id)
+
+endpoints.subscribe(endpoint_changed)
+
+def check_path_free(collection_id: str, path: str, endpoint_id: Optional[str] = None):
+    """Reject a path that would share a route with another endpoint of the collection."""
+    key = route_key(path)
+    for other in endpoints.find("collection_id", collection_id):
+        if other.id != endpoint_id and route_key(other.path) == key:
+            raise HTTPException(status_code=409, detail=f"Endpoint {other.id} already serves path {other.path}")
 
 @router.post("/", response_model=Endpoint)
 async def create_endpoint(
@@ -22,6 +45,7 @@ async def create_endpoint(
 ):
     try:
         logger.info(f"Creating endpoint for collection: {collection_id}")
+        check_path_free(collection_id, endpoint.path)
         endpoint_id = str(uuid.uuid4())
         new_endpoint = Endpoint(
             id=endpoint_id,
@@ -30,8 +54,11 @@ async def create_endpoint(
             fail_rate=endpoint.fail_rate,
             collection_id=collection_id
         )
-        endpoints[endpoint_id] = new_endpoint
+        endpoints.put(new_endpoint)
+        routes.add(collection_id, new_endpoint.path, new_endpoint)
         return new_endpoint
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error creating endpoint: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -43,11 +70,7 @@ async def get_collection_endpoints(
 ):
     try:
         logger.info(f"Getting endpoints for collection: {collection_id}")
-        collection_endpoints = [
-            endpoint for endpoint in endpoints.values()
-            if endpoint.collection_id == collection_id
-        ]
-        return collection_endpoints
+        return endpoints.find("collection_id", collection_id)
     except Exception as e:
         logger.error(f"Error getting endpoints: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -80,7 +103,10 @@ async def update_endpoint(
         endpoint = endpoints.get(endpoint_id)
         if not endpoint:
             raise HTTPException(status_code=404, detail="Endpoint not found")
+        if endpoint_update.path is not None:
+            check_path_free(endpoint.collection_id, endpoint_update.path, endpoint.id)
         
+        routes.remove(endpoint.collection_id, endpoint.path, lambda route: route.id == endpoint.id)
         if endpoint_update.path is not None:
             endpoint.path = endpoint_update.path
         if endpoint_update.latency_ms is not None:
@@ -88,7 +114,8 @@ async def update_endpoint(
         if endpoint_update.fail_rate is not None:
             endpoint.fail_rate = endpoint_update.fail_rate
         
-        endpoints[endpoint_id] = endpoint
+        endpoints.put(endpoint)
+        routes.add(endpoint.collection_id, endpoint.path, endpoint)
         return endpoint
     except HTTPException:
         raise
@@ -107,7 +134,8 @@ async def delete_endpoint(
         if not endpoint:
             raise HTTPException(status_code=404, detail="Endpoint not found")
         
-        del endpoints[endpoint_id]
+        endpoints.delete(endpoint_id)
+        routes.remove(endpoint.collection_id, endpoint.path, lambda route: route.id == endpoint.id)
         return {"message": "Endpoint deleted successfully"}
     except HTTPException:
         raise
@@ -0,0 +1,10 @@
+from fastapi import APIRouter
+from fastapi.responses import Response
+from ..core import metrics
+
+router = APIRouter(tags=["metrics"])
+
+@router.get("/metrics")
+async def read_metrics():
+    """Prometheus text exposition of the proxy hot-path metrics."""
+    return Response(metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
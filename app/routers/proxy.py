@@ -1,13 +1,36 @@
-from fastapi import APIRouter, HTTPException, Query
-from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from functools import lru_cache
+from typing import Callable, Optional
 import httpx
+import json
 import random
 import asyncio
-from urllib.parse import urlparse
+import time
+from urllib.parse import urlparse, urlencode
 from datetime import datetime
+from ..core import http_client, metrics, recordings
+from ..core.delays import scheduler
+from ..core.latency import build_sampler
+from ..core.probe import PROBE_MAX_CONCURRENCY, PROBE_MAX_SAMPLES, PROBE_PROGRESS_INTERVAL, ProbeStats, probe_slots
+from ..core.security import get_current_user
+from ..core.throttle import Shaping
+from ..schemas.probe import ProbeRequest
+from ..schemas.user import TokenData
+from .collections import collections
+from .endpoints import routes
 
 router = APIRouter(tags=["proxy"])
 
+PROXY_MODES = ("raw", "inspect")
+
+# Query parameters consumed by the proxy itself rather than forwarded
+CONTROL_PARAMS = {
+    "url", "min_latency", "max_latency", "fail_rate", "sandbox", "record", "match", "mode",
+    "distribution", "latency_params",
+    "bandwidth_down", "bandwidth_up", "ttfb_ms", "chunk_delay_ms", "chunk_size",
+}
+
 def validate_url(url: str) -> bool:
     """Validate that the URL is properly formatted and uses http/https."""
     try:
@@ -16,18 +39,55 @@ def validate_url(url: str) -> bool:
     except:
         return False
 
-@router.get("/proxy")
+def latency_range_valid(min_latency: int, max_latency: int, distribution: str) -> bool:
+    # max_latency 0 leaves the upper end open for the non-uniform distributions
+    return min_latency <= max_latency or (max_latency == 0 and distribution != "uniform")
+
+@lru_cache(maxsize=256)
+def compiled_sampler(distribution: str, latency_params: Optional[str], min_latency: int, max_latency: int):
+    """Build (once per distinct setting) the sampler for a latency configuration."""
+    params = json.loads(latency_params) if latency_params else None
+    if params is not None and not isinstance(params, dict):
+        raise ValueError("latency_params must be a JSON object")
+    return build_sampler(distribution, params, min_latency, max_latency)
+
+def forwarded_url(url: str, request: Request) -> str:
+    """Append the caller's non-control query parameters to the destination URL."""
+    params = [
+        (key, value) for key, value in request.query_params.multi_items()
+        if key not in CONTROL_PARAMS
+    ]
+    if not params:
+        return url
+    separator = "&" if urlparse(url).query else "?"
+    return url + separator + urlencode(params)
+
+@router.api_route("/proxy", methods=http_client.PROXY_METHODS)
 async def proxy(
+    request: Request,
     url: str = Query(..., description="The destination URL to forward to"),
     min_latency: Optional[int] = Query(0, description="Minimum latency in milliseconds"),
     max_latency: Optional[int] = Query(0, description="Maximum latency in milliseconds"),
     fail_rate: Optional[float] = Query(0.0, description="Probability of returning a 500 error (0.0 to 1.0)"),
-    sandbox: Optional[bool] = Query(False, description="Enable sandbox mode to return mock data")
+    sandbox: Optional[bool] = Query(False, description="Enable sandbox mode: replay a recorded response, or return mock data if there is none"),
+    record: bool = Query(False, description="Record the upstream response for later sandbox replays"),
+    match: Optional[str] = Query(None, description="Request parts recordings are keyed on: any of method, url, body"),
+    mode: str = Query("raw", description="'raw' streams the upstream response through, 'inspect' wraps it in a JSON envelope"),
+    distribution: str = Query("uniform", description="Latency distribution: uniform, normal, lognormal, pareto, percentiles or histogram"),
+    latency_params: Optional[str] = Query(None, description="JSON object of distribution parameters, e.g. {\"p50\": 100, \"p99\": 900}"),
+    bandwidth_down: int = Query(0, ge=0, description="Response bandwidth cap in bytes per second (0 = unlimited)"),
+    bandwidth_up: int = Query(0, ge=0, description="Request body bandwidth cap in bytes per second (0 = unlimited)"),
+    ttfb_ms: int = Query(0, ge=0, description="Delay between the upstream answering and the first response byte"),
+    chunk_delay_ms: int = Query(0, ge=0, description="Delay before each response chunk"),
+    chunk_size: int = Query(0, ge=0, description="Re-chunk the response body into pieces of this many bytes")
 ):
     # Validate URL
     if not validate_url(url):
         raise HTTPException(status_code=400, detail="Invalid URL format. Must be http:// or https://")
     
+    if mode not in PROXY_MODES:
+        raise HTTPException(status_code=400, detail="mode must be one of: " + ", ".join(PROXY_MODES))
+
     # Validate fail_rate
     if not 0 <= fail_rate <= 1:
         raise HTTPException(status_code=400, detail="fail_rate must be between 0.0 and 1.0")
@@ -35,21 +95,58 @@ async def proxy(
     # Validate latency range
     if min_latency < 0 or max_latency < 0:
         raise HTTPException(status_code=400, detail="Latency values must be positive")
-    if min_latency > max_latency:
+    if not latency_range_valid(min_latency, max_latency, distribution):
         raise HTTPException(status_code=400, detail="min_latency must be less than or equal to max_latency")
     
-    # Apply random latency within range
-    latency = 0
-    if max_latency > 0:
-        latency = random.randint(min_latency, max_latency)
-        await asyncio.sleep(latency / 1000)
+    try:
+        sampler = compiled_sampler(distribution, latency_params, min_latency, max_latency)
+        match_parts = recordings.parse_match(match)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # Ad-hoc requests have no stored endpoint, so the upstream host stands in for it
+    timer = metrics.ProxyTimer()
+    timer.label(http_client.host_key(url))
+
+    # Apply latency drawn from the requested distribution
+    latency = round(sampler.sample())
+    if latency > 0:
+        await scheduler.sleep(latency / 1000, since=timer.started)
+    timer.mark("delay")
     
     # Check if we should fail
     if random.random() < fail_rate:
+        timer.finish("injected")
         raise HTTPException(status_code=500, detail="Random failure injected")
     
-    # In sandbox mode, return mock data
+    shaping = Shaping(
+        bandwidth_down=bandwidth_down,
+        bandwidth_up=bandwidth_up,
+        ttfb_ms=ttfb_ms,
+        chunk_delay_ms=chunk_delay_ms,
+        chunk_size=chunk_size,
+    )
+    target = forwarded_url(url, request)
+    # Recordings are only replayed to callers sending the credentials they were made with
+    scope = recordings.credentials_scope(request.headers.raw)
+
+    # In sandbox mode, replay a recording of this request if there is one
     if sandbox:
+        body_digest = recordings.digest(await request.body()) if "body" in match_parts else recordings.EMPTY_DIGEST
+        recording = recordings.store.get(recordings.request_key(scope, match_parts, request.method, target, body_digest))
+        if recording is not None:
+            if mode == "raw":
+                return await http_client.replay_response(recording, shaping, timer)
+            timer.status_code = recording.status_code
+            timer.finish()
+            return {
+                "status_code": recording.status_code,
+                "headers": {name.decode("latin-1"): value.decode("latin-1") for name, value in recording.headers},
+                "content": recordings.store.read(recording).decode("utf-8", "replace")
+            }
+
+        # Otherwise return mock data
+        timer.finish()
         return {
             "status_code": 200,
             "headers": {"Content-Type": "application/json"},
@@ -59,21 +156,191 @@ async def proxy(
                 "latency": {
                     "min": min_latency,
                     "max": max_latency,
-                    "actual": latency if max_latency > 0 else 0
+                    "actual": latency,
+                    "distribution": distribution
                 },
                 "fail_rate": fail_rate,
                 "timestamp": datetime.utcnow().isoformat()
             }
         }
     
-    # Forward the request
-    async with httpx.AsyncClient() as client:
+    body = http_client.request_body(request)
+    if record and body is not None:
+        body = recordings.BodyDigest(body)
+
+    def key() -> str:
+        body_digest = body.hexdigest() if record and body is not None else recordings.EMPTY_DIGEST
+        return recordings.request_key(scope, match_parts, request.method, target, body_digest)
+
+    # Forward the caller's method, headers, query and body over the shared connection pool
+    client = http_client.get_client()
+    upstream_request = client.build_request(
+        request.method,
+        target,
+        headers=http_client.request_headers(request),
+        content=shaping.upload(body),
+    )
+    try:
+        if mode == "raw":
+            response = await http_client.stream_response(upstream_request, shaping, timer)
+            return http_client.record_response(response, key) if record else response
+
+        async with http_client.host_slot(url):
+            response = await client.send(upstream_request)
+        timer.mark("upstream")
+        timer.status_code = response.status_code
+        if record:
+            recordings.store.save(key(), response.status_code, http_client.forward_headers(response.headers), response.content)
+        envelope = {
+            "status_code": response.status_code,
+            "headers": dict(response.headers),
+            "content": response.text
+        }
+        timer.mark("serialize")
+        timer.finish()
+        return envelope
+    except httpx.RequestError as e:
+        timer.finish("upstream")
+        raise HTTPException(status_code=500, detail=f"Error forwarding request: {str(e)}")
+
+@router.api_route("/c/{collection_id}/{path:path}", methods=http_client.PROXY_METHODS)
+async def collection_proxy(collection_id: str, path: str, request: Request):
+    """Forward to the collection's base_url + path with the matching endpoint's chaos settings.
+
+    Paths without a matching endpoint use the collection defaults, so the
+    proxy can stand in for a service's whole base URL.
+    """
+    collection = collections.get(collection_id)
+    if collection is None:
+        raise HTTPException(status_code=404, detail="Collection not found")
+    endpoint = routes.get(collection_id).lookup(path)
+
+    latency_ms = collection.default_latency_ms
+    fail_rate = collection.default_fail_rate
+    if endpoint is not None:
+        if endpoint.latency_ms is not None:
+            latency_ms = endpoint.latency_ms
+        if endpoint.fail_rate is not None:
+            fail_rate = endpoint.fail_rate
+
+    url = collection.base_url.rstrip("/") + "/" + path
+    if request.url.query:
+        url += ("&" if urlparse(url).query else "?") + request.url.query
+
+    timer = metrics.ProxyTimer()
+    timer.label(endpoint.id if endpoint is not None else http_client.host_key(url), collection_id)
+    timer.mark("lookup")
+
+    if latency_ms > 0:
+        await scheduler.sleep(latency_ms / 1000, since=timer.started)
+    timer.mark("delay")
+
+    if random.random() < fail_rate:
+        timer.finish("injected")
+        raise HTTPException(status_code=500, detail="Random failure injected")
+
+    client = http_client.get_client()
+    upstream_request = client.build_request(
+        request.method,
+        url,
+        headers=http_client.request_headers(request),
+        content=http_client.request_body(request),
+    )
+    try:
+        return await http_client.stream_response(upstream_request, timer=timer)
+    except httpx.RequestError as e:
+        timer.finish("upstream")
+        raise HTTPException(status_code=500, detail=f"Error forwarding request: {str(e)}")
+
+async def probe_sample(probe: ProbeRequest, sampler) -> tuple:
+    """One probe sample: (injected ms, observed ms, outcome), mirroring what /proxy does."""
+    started = time.perf_counter()
+    injected = round(sampler.sample())
+    if injected > 0:
+        await scheduler.sleep(injected / 1000, since=started)
+
+    if random.random() < probe.fail_rate:
+        outcome = "injected"
+    elif probe.sandbox:
+        outcome = "sandbox"
+    else:
         try:
-            response = await client.get(url)
-            return {
-                "status_code": response.status_code,
-                "headers": dict(response.headers),
-                "content": response.text
-            }
-        except httpx.RequestError as e:
-            raise HTTPException(status_code=500, detail=f"Error forwarding request: {str(e)}") 
\ No newline at end of file
+            async with http_client.host_slot(probe.url):
+                response = await http_client.get_client().request(probe.method.upper(), probe.url)
+            outcome = metrics.status_class(response.status_code)
+        except httpx.TimeoutException:
+            outcome = "timeout"
+        except httpx.RequestError:
+            outcome = "connection"
+    return injected, (time.perf_counter() - started) * 1000, outcome
+
+class ProbeResponse(StreamingResponse):
+    """Streams a probe's snapshots and frees the user's probe slot however the response ends."""
+
+    def __init__(self, content, release: Callable[[], None]):
+        super().__init__(content, media_type="application/x-ndjson")
+        self.release = release
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.release()
+
+@router.post("/proxy/probe")
+async def probe(probe: ProbeRequest, current_user: TokenData = Depends(get_current_user)):
+    """Run `samples` proxied requests server-side, `concurrency` at a time.
+
+    Streams NDJSON: a progress snapshot every PROBE_PROGRESS_INTERVAL
+    seconds, then the final one with "done": true.
+    """
+    if not validate_url(probe.url):
+        raise HTTPException(status_code=400, detail="Invalid URL format. Must be http:// or https://")
+    if probe.method.upper() not in http_client.PROXY_METHODS:
+        raise HTTPException(status_code=400, detail="method must be one of: " + ", ".join(http_client.PROXY_METHODS))
+    if probe.samples > PROBE_MAX_SAMPLES:
+        raise HTTPException(status_code=400, detail=f"samples must be at most {PROBE_MAX_SAMPLES}")
+    if probe.concurrency > PROBE_MAX_CONCURRENCY:
+        raise HTTPException(status_code=400, detail=f"concurrency must be at most {PROBE_MAX_CONCURRENCY}")
+    if not latency_range_valid(probe.min_latency, probe.max_latency, probe.distribution):
+        raise HTTPException(status_code=400, detail="min_latency must be less than or equal to max_latency")
+    try:
+        sampler = compiled_sampler(probe.distribution, probe.latency_params, probe.min_latency, probe.max_latency)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    release = probe_slots.acquire(current_user.email)
+    if release is None:
+        raise HTTPException(status_code=429, detail="A probe is already running for this user")
+
+    async def snapshots():
+        stats = ProbeStats(probe.samples)
+        remaining = iter(range(probe.samples))
+
+        async def worker():
+            for _ in remaining:
+                stats.add(*await probe_sample(probe, sampler))
+
+        workers = asyncio.gather(*(worker() for _ in range(min(probe.concurrency, probe.samples))))
+        try:
+            while not workers.done():
+                await asyncio.wait({workers}, timeout=PROBE_PROGRESS_INTERVAL)
+                if not workers.done():
+                    yield json.dumps(stats.snapshot()) + "\n"
+            workers.result()
+            yield json.dumps(stats.snapshot(done=True)) + "\n"
+        finally:
+            # Finished, or the caller went away: stop sending samples
+            workers.cancel()
+            release()
+
+    return ProbeResponse(snapshots(), release)
+
+@router.get("/proxy/pool")
+async def proxy_pool():
+    """Report upstream requests in flight and waiting for a slot, per host."""
+    return http_client.pool_stats()
+
+@router.get("/proxy/delays")
+async def proxy_delays():
+    """Report the delay scheduler's pending timers and measured wake-up lag."""
+    return scheduler.stats() 
\ No newline at end of file
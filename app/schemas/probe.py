@@ -0,0 +1,14 @@
+from pydantic import BaseModel, Field
+from typing import Optional
+
+class ProbeRequest(BaseModel):
+    url: str
+    method: str = "GET"
+    samples: int = Field(100, ge=1)
+    concurrency: int = Field(10, ge=1)
+    min_latency: int = Field(0, ge=0)
+    max_latency: int = Field(0, ge=0)
+    fail_rate: float = Field(0.0, ge=0, le=1)
+    distribution: str = "uniform"
+    latency_params: Optional[str] = None
+    sandbox: bool = False
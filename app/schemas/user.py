@@ -10,6 +10,13 @@ class User(BaseModel):
     username: str
     email: str
 
+class UserRecord(BaseModel):
+    """A stored account, keyed by email."""
+    id: str
+    username: str
+    email: str
+    hashed_password: str
+
 class Token(BaseModel):
     access_token: str
     token_type: str
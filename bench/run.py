@@ -0,0 +1,332 @@
+"""Load-generation benchmark for the LatencyPoison proxy paths.
+
+Starts a stand-in upstream and the selected service locally, drives /proxy
+at a fixed concurrency and writes the results as JSON:
+
+    python bench/run.py --target all --concurrency 50 --requests 2000
+
+Overhead is measured request time minus the injected latency, which is
+pinned by setting min_latency == max_latency. Pass --compare with a
+previous results file to fail on p99 overhead or throughput regressions.
+
+Every run also fires --concurrency requests at once with a fixed
+--delay-check-ms delay and fails if they take much more than one delay
+longer than the same batch undelayed, which is what happens when injected
+delays are served one after another.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import httpx
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+
+PERCENTILES = {"p50": 0.50, "p95": 0.95, "p99": 0.99, "p99.9": 0.999}
+# Concurrent delayed requests may add at most this many delays to an undelayed batch
+DELAY_CHECK_FACTOR = 3
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def percentile(values, fraction: float) -> float:
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+async def wait_ready(url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                await client.get(url)
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.1)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+def start(args, log_path: str, env=None) -> subprocess.Popen:
+    with open(log_path, "ab") as log:
+        return subprocess.Popen(
+            [sys.executable] + args,
+            cwd=ROOT,
+            env={**os.environ, **(env or {})},
+            stdout=log,
+            stderr=subprocess.STDOUT,
+        )
+
+async def create_endpoint(client: httpx.AsyncClient, headers: dict, collection_id: int, upstream_url: str, latency: int) -> int:
+    endpoint = await client.post("/api/endpoints/", headers=headers, json={
+        "name": "bench",
+        "url": upstream_url,
+        "method": "GET",
+        "collection_id": collection_id,
+        "min_latency": latency,
+        "max_latency": latency,
+    })
+    endpoint.raise_for_status()
+    return endpoint.json()["id"]
+
+async def prepare_api(client: httpx.AsyncClient, upstream_url: str, latency: int):
+    """Create a user, collection and endpoint; return request kwargs for /proxy and the collection id."""
+    credentials = {"username": "bench", "email": "bench@example.com", "password": "bench-password"}
+    await client.post("/api/auth/register", json=credentials)
+    login = await client.post("/api/auth/login", json=credentials)
+    login.raise_for_status()
+    headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+
+    collection = await client.post("/api/collections/", json={"name": "bench"}, headers=headers)
+    collection.raise_for_status()
+    endpoint_id = await create_endpoint(client, headers, collection.json()["id"], upstream_url, latency)
+    return {"params": {"endpoint_id": endpoint_id}, "headers": headers}, collection.json()["id"]
+
+async def write_load(client: httpx.AsyncClient, headers: dict, collection_id: int, upstream_url: str, stop: asyncio.Event):
+    """Create and delete endpoints in a loop, to measure proxy reads under concurrent writes."""
+    writes = 0
+    errors = {}
+    while not stop.is_set():
+        try:
+            created = await client.post("/api/endpoints/", headers=headers, json={
+                "name": "bench-write",
+                "url": upstream_url,
+                "method": "GET",
+                "collection_id": collection_id,
+            })
+            if created.status_code >= 400:
+                errors[str(created.status_code)] = errors.get(str(created.status_code), 0) + 1
+                continue
+            deleted = await client.delete(f"/api/endpoints/{created.json()['id']}/", headers=headers)
+            if deleted.status_code >= 400:
+                errors[str(deleted.status_code)] = errors.get(str(deleted.status_code), 0) + 1
+                continue
+            writes += 2
+        except httpx.HTTPError as e:
+            errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+    return writes, errors
+
+def prepare_app(upstream_url: str, latency: int) -> dict:
+    return {"params": {"url": upstream_url, "min_latency": latency, "max_latency": latency}}
+
+async def drive(client: httpx.AsyncClient, request: dict, concurrency: int, total: int):
+    """Closed-loop load: `concurrency` workers issue `total` requests between them."""
+    timings = []
+    errors = {}
+    remaining = total
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            started = time.perf_counter()
+            try:
+                response = await client.get("/proxy", **request)
+                await response.aread()
+                if response.status_code >= 400:
+                    errors[str(response.status_code)] = errors.get(str(response.status_code), 0) + 1
+                    continue
+            except httpx.HTTPError as e:
+                errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+                continue
+            timings.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return timings, errors, time.perf_counter() - started
+
+async def check_delays(client: httpx.AsyncClient, request: dict, delayed: dict, concurrency: int, latency: int) -> dict:
+    """Send `concurrency` delayed requests at once; they should take about one delay longer than undelayed ones, not the sum."""
+    async def batch(kwargs: dict) -> float:
+        async def one():
+            response = await client.get("/proxy", **kwargs)
+            await response.aread()
+            response.raise_for_status()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(concurrency)))
+        return (time.perf_counter() - started) * 1000
+
+    baseline = await batch(request)
+    elapsed = await batch(delayed)
+    return {
+        "requests": concurrency,
+        "latency_ms": latency,
+        "baseline_ms": baseline,
+        "elapsed_ms": elapsed,
+        # Serialized delays would add concurrency * latency
+        "passed": elapsed - baseline < latency * DELAY_CHECK_FACTOR,
+    }
+
+async def bench_target(target: str, options) -> dict:
+    upstream_port, service_port = free_port(), free_port()
+    upstream_url = f"http://127.0.0.1:{upstream_port}/{options.path.lstrip('/')}"
+    service_url = f"http://127.0.0.1:{service_port}"
+
+    env = dict(item.split("=", 1) for item in options.env)
+    workdir = tempfile.mkdtemp(prefix="latencypoison-bench-")
+    if target == "api":
+        env.setdefault("DATABASE_URL", f"sqlite:///{workdir}/bench.db")
+
+    log_path = os.path.join(workdir, "server.log")
+    processes = [
+        start([os.path.join(BENCH_DIR, "upstream.py"), "--port", str(upstream_port)], log_path),
+        start([os.path.join(BENCH_DIR, "serve.py"), "--target", target, "--port", str(service_port)], log_path, env),
+    ]
+    try:
+        await wait_ready(f"http://127.0.0.1:{upstream_port}/")
+        await wait_ready(f"{service_url}/")
+
+        limits = httpx.Limits(max_connections=options.concurrency, max_keepalive_connections=options.concurrency)
+        async with httpx.AsyncClient(base_url=service_url, limits=limits, timeout=options.timeout) as client:
+            writers = []
+            stop = asyncio.Event()
+            if target == "api":
+                request, collection_id = await prepare_api(client, upstream_url, options.latency)
+            else:
+                request = prepare_app(upstream_url, options.latency)
+
+            await drive(client, request, options.concurrency, options.concurrency * 2)  # warm-up
+            delay_check = None
+            if options.delay_check_ms > 0:
+                if target == "api":
+                    delayed_id = await create_endpoint(client, request["headers"], collection_id, upstream_url, options.delay_check_ms)
+                    delayed = {"params": {"endpoint_id": delayed_id}, "headers": request["headers"]}
+                else:
+                    delayed = prepare_app(upstream_url, options.delay_check_ms)
+                delay_check = await check_delays(client, request, delayed, options.concurrency, options.delay_check_ms)
+            idle = (await client.post("/__bench__/reset")).json()
+            if target == "api":
+                writers = [
+                    asyncio.create_task(write_load(client, request["headers"], collection_id, upstream_url, stop))
+                    for _ in range(options.writers)
+                ]
+            timings, errors, elapsed = await drive(client, request, options.concurrency, options.requests)
+            stop.set()
+            write_results = await asyncio.gather(*writers)
+            stats = (await client.get("/__bench__/stats")).json()
+    except Exception:
+        print(f"{target} benchmark failed, server output is in {log_path}", file=sys.stderr)
+        raise
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+    overhead = sorted(max(timing * 1000 - options.latency, 0.0) for timing in timings)
+    return {
+        "target": target,
+        "variant": "endpoint_id" if target == "api" else "url",
+        "requests": options.requests,
+        "succeeded": len(timings),
+        "errors": errors,
+        "throughput_rps": len(timings) / elapsed if elapsed else 0.0,
+        "overhead_ms": {name: percentile(overhead, fraction) for name, fraction in PERCENTILES.items()},
+        "memory": {
+            "idle_rss_kb": idle["rss_kb"],
+            "peak_rss_kb": stats["peak_rss_kb"],
+            "per_connection_kb": max(stats["peak_rss_kb"] - idle["rss_kb"], 0) / options.concurrency,
+        },
+        "loop_lag_ms": stats["loop_lag_ms"],
+        "delay_check": delay_check,
+        "writes": {
+            "writers": len(write_results),
+            "per_second": sum(writes for writes, _ in write_results) / elapsed if elapsed else 0.0,
+            "errors": merge_counts(write_errors for _, write_errors in write_results),
+        },
+    }
+
+def merge_counts(counts) -> dict:
+    merged = {}
+    for count in counts:
+        for key, value in count.items():
+            merged[key] = merged.get(key, 0) + value
+    return merged
+
+def compare(results: dict, baseline_path: str, tolerance: float) -> list:
+    """List regressions beyond `tolerance` (a fraction) against a previous results file."""
+    with open(baseline_path) as baseline_file:
+        baseline = {run["target"]: run for run in json.load(baseline_file)["runs"]}
+    regressions = []
+    for run in results["runs"]:
+        previous = baseline.get(run["target"])
+        if previous is None:
+            continue
+        if run["overhead_ms"]["p99"] > previous["overhead_ms"]["p99"] * (1 + tolerance):
+            regressions.append(f"{run['target']}: p99 overhead {previous['overhead_ms']['p99']:.2f} -> {run['overhead_ms']['p99']:.2f} ms")
+        if run["throughput_rps"] < previous["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{run['target']}: throughput {previous['throughput_rps']:.0f} -> {run['throughput_rps']:.0f} req/s")
+    return regressions
+
+async def main(options):
+    targets = ["app", "api"] if options.target == "all" else [options.target]
+    results = {
+        "timestamp": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            "concurrency": options.concurrency,
+            "requests": options.requests,
+            "latency_ms": options.latency,
+            "path": options.path,
+            "env": options.env,
+            "writers": options.writers,
+        },
+        "runs": [await bench_target(target, options) for target in targets],
+    }
+
+    with open(options.output, "w") as output:
+        json.dump(results, output, indent=2)
+
+    for run in results["runs"]:
+        overhead = ", ".join(f"{name}={value:.2f}" for name, value in run["overhead_ms"].items())
+        print(f"{run['target']:>4} ({run['variant']}): {run['throughput_rps']:.0f} req/s, overhead ms {overhead}, "
+              f"{run['memory']['per_connection_kb']:.1f} KiB/conn, loop lag p99 {run['loop_lag_ms']['p99']:.2f} ms, "
+              f"errors {run['errors'] or 0}")
+        if run["writes"]["writers"]:
+            print(f"      {run['writes']['per_second']:.0f} writes/s from {run['writes']['writers']} writers, "
+                  f"errors {run['writes']['errors'] or 0}")
+        check = run["delay_check"]
+        if check:
+            print(f"      {check['requests']} concurrent {check['latency_ms']} ms delays took {check['elapsed_ms']:.0f} ms "
+                  f"({check['baseline_ms']:.0f} ms undelayed)"
+                  f"{'' if check['passed'] else ' (FAILED: delays are serialized)'}")
+    print(f"Results written to {options.output}")
+
+    failed = [run["target"] for run in results["runs"] if run["delay_check"] and not run["delay_check"]["passed"]]
+    if options.compare:
+        regressions = compare(results, options.compare, options.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        failed += regressions
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", choices=["app", "api", "all"], default="all")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--latency", type=int, default=0, help="Injected latency in ms (min = max)")
+    parser.add_argument("--path", default="/echo", help="Upstream path, e.g. /bytes/1048576 for large bodies")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--delay-check-ms", type=int, default=200,
+                        help="Delay for the concurrent-delay check; 0 skips it")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="Extra environment for the service, e.g. DATABASE_URL=postgresql://...")
+    parser.add_argument("--writers", type=int, default=0,
+                        help="api only: concurrent clients creating and deleting endpoints during the run")
+    parser.add_argument("--output", default="bench-results.json")
+    parser.add_argument("--compare", metavar="BASELINE_JSON", help="Fail if results regress against this file")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed regression as a fraction")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,92 @@
+"""Run one of the LatencyPoison services under uvicorn with benchmark probes.
+
+Adds an event-loop lag monitor and resident-memory tracking, exposed at
+GET /__bench__/stats and cleared with POST /__bench__/reset.
+"""
+import argparse
+import asyncio
+import os
+import resource
+import sys
+from collections import deque
+
+import uvicorn
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+LAG_INTERVAL = 0.01  # seconds between loop lag probes
+
+lag_samples = deque(maxlen=200000)
+peak_rss_kb = 0
+
+def load_app(target: str):
+    if target == "api":
+        sys.path.insert(0, os.path.join(ROOT, "api"))
+        from main import app
+    else:
+        sys.path.insert(0, ROOT)
+        from app.main import app
+    return app
+
+def rss_kb() -> int:
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * resource.getpagesize() // 1024
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def percentile(values, fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+async def monitor():
+    global peak_rss_kb
+    loop = asyncio.get_running_loop()
+    ticks = 0
+    while True:
+        started = loop.time()
+        await asyncio.sleep(LAG_INTERVAL)
+        lag_samples.append(max(loop.time() - started - LAG_INTERVAL, 0.0))
+        ticks += 1
+        if ticks % 10 == 0:
+            peak_rss_kb = max(peak_rss_kb, rss_kb())
+
+def instrument(app):
+    tasks = []
+
+    async def start_monitor():
+        tasks.append(asyncio.get_running_loop().create_task(monitor()))
+
+    async def stats():
+        samples = list(lag_samples)
+        return {
+            "rss_kb": rss_kb(),
+            "peak_rss_kb": max(peak_rss_kb, rss_kb()),
+            "loop_lag_ms": {
+                "samples": len(samples),
+                "p50": percentile(samples, 0.50) * 1000,
+                "p99": percentile(samples, 0.99) * 1000,
+                "max": max(samples, default=0.0) * 1000,
+            },
+        }
+
+    async def reset():
+        global peak_rss_kb
+        lag_samples.clear()
+        peak_rss_kb = rss_kb()
+        return {"rss_kb": peak_rss_kb}
+
+    app.add_event_handler("startup", start_monitor)
+    app.add_api_route("/__bench__/stats", stats, methods=["GET"])
+    app.add_api_route("/__bench__/reset", reset, methods=["POST"])
+    return app
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--target", choices=["app", "api"], required=True)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, required=True)
+    args = parser.parse_args()
+    uvicorn.run(instrument(load_app(args.target)), host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,58 @@
+"""Minimal keep-alive HTTP/1.1 server used as the stand-in upstream for benchmarks.
+
+It answers every request immediately so that measured time is proxy time:
+/bytes/<n> returns n bytes, any other path returns a small JSON body.
+"""
+import argparse
+import asyncio
+
+ECHO_BODY = b'{"ok":true}'
+
+async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        while True:
+            head = await reader.readuntil(b"\r\n\r\n")
+            lines = head.decode("latin-1").split("\r\n")
+            path = lines[0].split(" ")[1]
+            headers = {}
+            for line in lines[1:]:
+                if ":" in line:
+                    name, value = line.split(":", 1)
+                    headers[name.strip().lower()] = value.strip()
+
+            if "content-length" in headers:
+                await reader.readexactly(int(headers["content-length"]))
+            elif headers.get("transfer-encoding") == "chunked":
+                while True:
+                    size = int((await reader.readline()).split(b";")[0], 16)
+                    await reader.readexactly(size + 2)
+                    if size == 0:
+                        break
+
+            if path.startswith("/bytes/"):
+                body = b"x" * int(path[len("/bytes/"):])
+                content_type = b"application/octet-stream"
+            else:
+                body = ECHO_BODY
+                content_type = b"application/json"
+            writer.write(
+                b"HTTP/1.1 200 OK\r\ncontent-type: " + content_type
+                + b"\r\ncontent-length: " + str(len(body)).encode() + b"\r\n\r\n" + body
+            )
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+async def serve(host: str, port: int):
+    server = await asyncio.start_server(handle, host, port, backlog=4096)
+    async with server:
+        await server.serve_forever()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, required=True)
+    args = parser.parse_args()
+    asyncio.run(serve(args.host, args.port))
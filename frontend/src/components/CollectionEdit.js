@@ -1,4 +1,4 @@
-import React, { useState, useEffect, useCallback } from 'react';
+import React, { useState, useEffect, useCallback, useRef } from 'react';
 import { useParams, useNavigate } from 'react-router-dom';
 import {
   Container,
@@ -22,7 +22,15 @@ import {
 } from '@mui/material';
 import DeleteIcon from '@mui/icons-material/Delete';
 import EditIcon from '@mui/icons-material/Edit';
-import { fetchCollection, fetchEndpoints, createEndpoint, updateEndpoint, deleteEndpoint } from '../services/api';
+import {
+  fetchCollection,
+  fetchEndpoints,
+  createEndpoint,
+  updateEndpoint,
+  deleteEndpoint,
+  importEndpoints,
+  exportCollection,
+} from '../services/api';
 
 function CollectionEdit() {
   const { collectionId } = useParams();
@@ -41,6 +49,7 @@ function CollectionEdit() {
   });
   const [error, setError] = useState(null);
   const [success, setSuccess] = useState(null);
+  const importInput = useRef(null);
 
   const loadData = useCallback(async () => {
     try {
@@ -126,6 +135,40 @@ function CollectionEdit() {
     }
   };
 
+  const handleImport = async (event) => {
+    const file = event.target.files[0];
+    event.target.value = '';
+    if (!file) {
+      return;
+    }
+    try {
+      const result = await importEndpoints(collectionId, file);
+      await loadData();
+      setSuccess(`Imported ${result.imported} endpoints`);
+    } catch (error) {
+      const detail = error.response?.data?.detail;
+      if (detail && detail.errors) {
+        setError(`${detail.message}: ` + detail.errors.slice(0, 3).map(e => `#${e.item} ${e.error}`).join('; '));
+      } else {
+        setError(error.message);
+      }
+    }
+  };
+
+  const handleExport = async () => {
+    try {
+      const blob = await exportCollection(collectionId);
+      const url = URL.createObjectURL(blob);
+      const link = document.createElement('a');
+      link.href = url;
+      link.download = `collection-${collectionId}.ndjson`;
+      link.click();
+      URL.revokeObjectURL(url);
+    } catch (error) {
+      setError(error.message);
+    }
+  };
+
   if (!collection) {
     return <Box>Loading...</Box>;
   }
@@ -146,13 +189,28 @@ function CollectionEdit() {
                 Default Latency: {collection.default_latency_ms}ms | Fail Rate: {collection.default_fail_rate}%
               </Typography>
             </Box>
-            <Button
-              variant="contained"
-              color="primary"
-              onClick={() => setOpenDialog(true)}
-            >
-              Add Path
-            </Button>
+            <Box sx={{ display: 'flex', gap: 1 }}>
+              <input
+                ref={importInput}
+                type="file"
+                accept=".json,.ndjson,.jsonl"
+                hidden
+                onChange={handleImport}
+              />
+              <Button variant="outlined" onClick={() => importInput.current.click()}>
+                Import
+              </Button>
+              <Button variant="outlined" onClick={handleExport}>
+                Export
+              </Button>
+              <Button
+                variant="contained"
+                color="primary"
+                onClick={() => setOpenDialog(true)}
+              >
+                Add Path
+              </Button>
+            </Box>
           </Box>
 
           <List>
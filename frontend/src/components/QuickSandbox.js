@@ -13,8 +13,17 @@ import {
   Grid,
   Tooltip,
   Divider,
+  LinearProgress,
+  Table,
+  TableBody,
+  TableCell,
+  TableHead,
+  TableRow,
 } from '@mui/material';
 import { API_ENDPOINTS } from '../config';
+import { runProbe } from '../services/api';
+
+const PERCENTILE_COLUMNS = ['p50', 'p90', 'p95', 'p99', 'max'];
 
 function QuickSandbox() {
   const [formData, setFormData] = useState({
@@ -23,10 +32,14 @@ function QuickSandbox() {
     minLatency: 0,
     maxLatency: 1000,
     sandbox: false,
+    samples: 200,
+    concurrency: 20,
   });
   const [loading, setLoading] = useState(false);
   const [result, setResult] = useState(null);
   const [error, setError] = useState(null);
+  const [probing, setProbing] = useState(false);
+  const [probeResult, setProbeResult] = useState(null);
 
   const handleChange = (e) => {
     setFormData({
@@ -78,7 +91,7 @@ function QuickSandbox() {
       const timeoutId = setTimeout(() => controller.abort(), 30000); // 30 second timeout
 
       const response = await fetch(
-        `${API_ENDPOINTS.PROXY}?url=${encodeURIComponent(formData.url)}&fail_rate=${failRateDecimal}&min_latency=${formData.minLatency}&max_latency=${formData.maxLatency}&sandbox=${formData.sandbox}`,
+        `${API_ENDPOINTS.PROXY}?url=${encodeURIComponent(formData.url)}&fail_rate=${failRateDecimal}&min_latency=${formData.minLatency}&max_latency=${formData.maxLatency}&sandbox=${formData.sandbox}&mode=inspect`,
         {
           headers: {
             'Accept': 'application/json',
@@ -114,6 +127,36 @@ function QuickSandbox() {
     }
   };
 
+  const handleProbe = async () => {
+    setProbing(true);
+    setError(null);
+    setProbeResult(null);
+
+    try {
+      await runProbe(
+        {
+          url: formData.url,
+          samples: Number(formData.samples),
+          concurrency: Number(formData.concurrency),
+          min_latency: formData.minLatency,
+          max_latency: formData.maxLatency,
+          fail_rate: formData.failRate / 100,
+          sandbox: formData.sandbox,
+        },
+        setProbeResult
+      );
+    } catch (err) {
+      setError(err.message);
+      console.error('Error:', err);
+    } finally {
+      setProbing(false);
+    }
+  };
+
+  const histogramPeak = probeResult
+    ? Math.max(1, ...probeResult.histogram.map((bucket) => bucket.count))
+    : 1;
+
   return (
     <Box sx={{ p: 3 }}>
       <Paper elevation={3} sx={{ p: 3, mb: 3 }}>
@@ -249,16 +292,65 @@ function QuickSandbox() {
             </Tooltip>
           </Box>
 
-          <Button
-            type="submit"
-            variant="contained"
-            color="primary"
-            fullWidth
-            sx={{ mt: 2 }}
-            disabled={loading}
-          >
-            {loading ? <CircularProgress size={24} /> : 'Test API'}
-          </Button>
+          <Divider sx={{ my: 3 }} />
+
+          <Box sx={{ mb: 3 }}>
+            <Typography variant="subtitle1" gutterBottom>
+              Batch Probe
+            </Typography>
+            <Typography variant="body2" color="text.secondary" sx={{ mb: 2 }}>
+              Send many requests from the server with these settings and get one latency profile back.
+            </Typography>
+            <Grid container spacing={2}>
+              <Grid item xs={12} md={6}>
+                <TextField
+                  fullWidth
+                  type="number"
+                  label="Samples"
+                  name="samples"
+                  value={formData.samples}
+                  onChange={handleChange}
+                  inputProps={{ min: 1, max: 1000 }}
+                />
+              </Grid>
+              <Grid item xs={12} md={6}>
+                <TextField
+                  fullWidth
+                  type="number"
+                  label="Concurrency"
+                  name="concurrency"
+                  value={formData.concurrency}
+                  onChange={handleChange}
+                  inputProps={{ min: 1, max: 50 }}
+                />
+              </Grid>
+            </Grid>
+          </Box>
+
+          <Grid container spacing={2} sx={{ mt: 2 }}>
+            <Grid item xs={12} md={6}>
+              <Button
+                type="submit"
+                variant="contained"
+                color="primary"
+                fullWidth
+                disabled={loading || probing}
+              >
+                {loading ? <CircularProgress size={24} /> : 'Test API'}
+              </Button>
+            </Grid>
+            <Grid item xs={12} md={6}>
+              <Button
+                variant="outlined"
+                color="primary"
+                fullWidth
+                onClick={handleProbe}
+                disabled={loading || probing}
+              >
+                {probing ? <CircularProgress size={24} /> : 'Run Probe'}
+              </Button>
+            </Grid>
+          </Grid>
         </form>
       </Paper>
 
@@ -268,6 +360,71 @@ function QuickSandbox() {
         </Alert>
       )}
 
+      {probeResult && (
+        <Paper elevation={3} sx={{ p: 3, mb: 3 }}>
+          <Typography variant="h6" gutterBottom>
+            Probe Results
+          </Typography>
+          {!probeResult.done && (
+            <LinearProgress
+              variant="determinate"
+              value={(100 * probeResult.completed) / probeResult.total}
+              sx={{ mb: 2 }}
+            />
+          )}
+          <Typography variant="body2" color="text.secondary">
+            {probeResult.completed} / {probeResult.total} samples in {(probeResult.elapsed_ms / 1000).toFixed(1)}s
+            ({probeResult.throughput_rps} req/s)
+          </Typography>
+          <Typography variant="body2" color="text.secondary" sx={{ mb: 2 }}>
+            Outcomes: {Object.entries(probeResult.outcomes).map(([outcome, count]) => `${outcome} ${count}`).join(', ')}
+          </Typography>
+
+          <Table size="small" sx={{ mb: 3 }}>
+            <TableHead>
+              <TableRow>
+                <TableCell>Latency (ms)</TableCell>
+                {PERCENTILE_COLUMNS.map((column) => (
+                  <TableCell key={column} align="right">{column}</TableCell>
+                ))}
+              </TableRow>
+            </TableHead>
+            <TableBody>
+              {['observed', 'injected', 'overhead'].map((kind) => (
+                <TableRow key={kind}>
+                  <TableCell>{kind}</TableCell>
+                  {PERCENTILE_COLUMNS.map((column) => (
+                    <TableCell key={column} align="right">
+                      {probeResult.latency_ms[kind][column].toFixed(1)}
+                    </TableCell>
+                  ))}
+                </TableRow>
+              ))}
+            </TableBody>
+          </Table>
+
+          <Typography variant="subtitle2" gutterBottom>
+            Observed latency
+          </Typography>
+          {probeResult.histogram.filter((bucket) => bucket.count > 0).map((bucket) => (
+            <Box key={bucket.le ?? 'inf'} sx={{ display: 'flex', alignItems: 'center', mb: 0.5 }}>
+              <Typography variant="caption" sx={{ width: 90 }}>
+                {bucket.le === null ? '> 30000ms' : `<= ${bucket.le}ms`}
+              </Typography>
+              <Box
+                sx={{
+                  height: 12,
+                  bgcolor: 'primary.main',
+                  width: `${(70 * bucket.count) / histogramPeak}%`,
+                  mr: 1,
+                }}
+              />
+              <Typography variant="caption">{bucket.count}</Typography>
+            </Box>
+          ))}
+        </Paper>
+      )}
+
       {result && (
         <Paper elevation={3} sx={{ p: 3 }}>
           <Box sx={{ mb: 3 }}>
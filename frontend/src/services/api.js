@@ -15,6 +15,21 @@ const handleResponse = async (response) => {
   return data;
 };
 
+// Listings are paginated; follow the X-Next-Cursor header until the last page
+const fetchAllPages = async (url) => {
+  const items = [];
+  let cursor = null;
+  do {
+    const separator = url.includes('?') ? '&' : '?';
+    const response = await fetch(cursor ? `${url}${separator}after=${cursor}` : url, {
+      headers: getAuthHeader(),
+    });
+    items.push(...(await handleResponse(response)));
+    cursor = response.headers.get('X-Next-Cursor');
+  } while (cursor);
+  return items;
+};
+
 // Authentication functions
 export const login = async (username, password) => {
   const response = await fetch(API_ENDPOINTS.AUTH.LOGIN, {
@@ -63,11 +78,7 @@ export const logout = () => {
 
 // Collection functions
 export const fetchCollections = async () => {
-  const response = await fetch(API_ENDPOINTS.COLLECTIONS, {
-    headers: getAuthHeader(),
-  });
-
-  return handleResponse(response);
+  return fetchAllPages(`${API_ENDPOINTS.COLLECTIONS}/`);
 };
 
 export const fetchCollection = async (collectionId) => {
@@ -100,14 +111,35 @@ export const deleteCollection = async (collectionId) => {
   return handleResponse(response);
 };
 
-// Endpoint functions
-export const fetchEndpoints = async (collectionId) => {
-  const response = await fetch(`${API_ENDPOINTS.COLLECTIONS}/${collectionId}/endpoints/`, {
-    headers: getAuthHeader(),
+export const importEndpoints = async (collectionId, file) => {
+  const isNdjson = /\.(ndjson|jsonl)$/i.test(file.name);
+  const response = await fetch(`${API_ENDPOINTS.COLLECTIONS}/${collectionId}/import`, {
+    method: 'POST',
+    headers: {
+      ...getAuthHeader(),
+      'Content-Type': isNdjson ? 'application/x-ndjson' : 'application/json',
+    },
+    body: file,
   });
+
   return handleResponse(response);
 };
 
+export const exportCollection = async (collectionId) => {
+  const response = await fetch(`${API_ENDPOINTS.COLLECTIONS}/${collectionId}/export`, {
+    headers: getAuthHeader(),
+  });
+  if (!response.ok) {
+    return handleResponse(response);
+  }
+  return response.blob();
+};
+
+// Endpoint functions
+export const fetchEndpoints = async (collectionId) => {
+  return fetchAllPages(`${API_ENDPOINTS.COLLECTIONS}/${collectionId}/endpoints/`);
+};
+
 export const createEndpoint = async (collectionId, endpointData) => {
   const response = await fetch(`${API_ENDPOINTS.ENDPOINTS}/?collection_id=${collectionId}`, {
     method: 'POST',
@@ -141,4 +173,39 @@ export const deleteEndpoint = async (endpointId) => {
   });
 
   return handleResponse(response);
-}; 
\ No newline at end of file
+};
+
+// Batch probe: the server streams NDJSON snapshots, the last one with done: true
+export const runProbe = async (probeConfig, onSnapshot, signal) => {
+  const response = await fetch(API_ENDPOINTS.PROBE, {
+    method: 'POST',
+    headers: {
+      ...getAuthHeader(),
+      'Content-Type': 'application/json',
+    },
+    body: JSON.stringify(probeConfig),
+    signal,
+  });
+  if (!response.ok) {
+    return handleResponse(response);
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  let snapshot = null;
+  for (;;) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    const lines = buffer.split('\n');
+    buffer = lines.pop();
+    for (const line of lines) {
+      if (line.trim()) {
+        snapshot = JSON.parse(line);
+        onSnapshot(snapshot);
+      }
+    }
+  }
+  return snapshot;
+};